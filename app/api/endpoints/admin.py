@@ -0,0 +1,37 @@
+import gc
+from typing import Dict
+
+from fastapi import APIRouter, Depends, Query
+
+from app.core.memory import memory
+from app.core.profiling import run_in_threadpool
+from app.core.security import require_admin_key
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin_key)])
+
+
+@router.get("/memory")
+async def get_memory_report(
+    top: int = Query(20, ge=1, le=200),
+    collect: bool = Query(False, description="Run a full garbage collection first")
+) -> Dict:
+    """Process memory, per-component footprints and, while tracing, top allocation sites and their growth since the last report"""
+    def report():
+        if collect:
+            gc.collect()
+        return memory.report(top)
+
+    return await run_in_threadpool(report)
+
+
+@router.post("/memory/tracing")
+async def start_allocation_tracing(frames: int = Query(1, ge=1, le=50)) -> Dict:
+    """Start tracemalloc; it slows allocations down, so stop it when done"""
+    memory.tracer.start(frames)
+    return {"tracing": memory.tracer.tracing}
+
+
+@router.delete("/memory/tracing")
+async def stop_allocation_tracing() -> Dict:
+    memory.tracer.stop()
+    return {"tracing": memory.tracer.tracing}
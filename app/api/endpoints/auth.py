@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from datetime import timedelta
 
 from app.core.database import get_db
-from app.core.security import create_access_token, get_current_user
-from app.core.config import settings
-from app.schemas.user import UserCreate, UserResponse, Token
+from app.core.security import get_current_user, oauth2_scheme, token_session_id
+from app.core.profiling import run_in_threadpool
+from app.models.user import User
+from app.schemas.user import PasswordChange, RefreshRequest, UserCreate, UserResponse, Token
+from app.services.session_service import SessionService
 from app.services.user_service import UserService
 
 router = APIRouter()
@@ -25,7 +26,8 @@ async def login(
     db: Session = Depends(get_db)
 ):
     """User login"""
-    user = UserService.authenticate_user(db, form_data.username, form_data.password)
+    # bcrypt is CPU-bound; keep it off the event loop
+    user = await run_in_threadpool(UserService.authenticate_user, db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -33,9 +35,43 @@ async def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
+    return await run_in_threadpool(SessionService.create_session, db, user.id)
+
+
+@router.post("/refresh", response_model=Token)
+async def refresh(request: RefreshRequest, db: Session = Depends(get_db)):
+    """Exchange a refresh token for new access and refresh tokens"""
+    tokens = await run_in_threadpool(SessionService.refresh, db, request.refresh_token)
+    if tokens is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return tokens
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """End the session of this access token"""
+    await run_in_threadpool(SessionService.logout, db, token_session_id(token))
+
+
+@router.post("/password", response_model=Token)
+async def change_password(
+    password_change: PasswordChange,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Change password; every existing session is ended and a new one is returned"""
+    tokens = await run_in_threadpool(
+        SessionService.change_password,
+        db, current_user.id, password_change.current_password, password_change.new_password
     )
-    
-    return {"access_token": access_token, "token_type": "bearer"}
+    if tokens is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect password")
+    return tokens
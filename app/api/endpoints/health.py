@@ -1,21 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import json
+import queue
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 from datetime import date, timedelta
 
-from app.core.database import get_db
+from app.core.cache import user_tag
+from app.core.profiling import run_in_threadpool
+from app.core.database import get_db, get_session_factory, run_in_session
 from app.core.security import get_current_user
 from app.schemas.health_data import (
-    HealthDataCreate, HealthDataResponse,
-    HealthPlanCreate, HealthPlanResponse, HealthPlanUpdate
+    HealthDataCreate, HealthDataResponse, HealthTrendResponse,
+    HealthDataBatch, HealthDataIngestResponse,
+    HealthPlanCreate, HealthPlanResponse, HealthPlanUpdate,
+    PlanSimulationRequest, PlanSimulationResponse, PlanProgressResponse
 )
-from app.services.health_data_service import HealthDataService
-from app.services.ai_service import AIHealthPlanService
+from app.services.health_data_service import HealthDataService, statistics_cache
+from app.services.adherence_tracker import adherence_tracker
+from app.services.ai_service import get_ai_service
+from app.services.segmentation_service import segmentation_service
+from app.services.recommendation_service import RecommendationService, recommendation_cache
+from app.services.ingest_buffer import ingest_buffer
+from app.services.plan_simulator import plan_simulator
 from app.models.user import User
 
 router = APIRouter(prefix="/health", tags=["health"])
 
-ai_service = AIHealthPlanService()
+ai_service = get_ai_service()
+
+
+async def get_current_user_with_writes(current_user: User = Depends(get_current_user)) -> User:
+    """Current user, with their buffered health data flushed so reads include it"""
+    if ingest_buffer.has_pending(current_user.id):
+        await run_in_threadpool(ingest_buffer.flush_user, current_user.id)
+    return current_user
 
 
 # Health Data Endpoints
@@ -27,15 +47,28 @@ async def create_health_data(
 ):
     """Submit health data"""
     health_record = HealthDataService.create_health_data(db, current_user.id, health_data)
+    segmentation_service.schedule(current_user.id)
     return health_record
 
 
+@router.post("/data/ingest", response_model=HealthDataIngestResponse, status_code=status.HTTP_202_ACCEPTED)
+async def ingest_health_data(
+    batch: HealthDataBatch,
+    current_user: User = Depends(get_current_user)
+):
+    """Submit health data through the write-behind buffer"""
+    for record in batch.records:
+        HealthDataService.record_model(record.data_type)
+    first_seq, last_seq = await run_in_threadpool(ingest_buffer.append, current_user.id, batch.records)
+    return {"accepted": len(batch.records), "first_seq": first_seq, "last_seq": last_seq}
+
+
 @router.get("/data", response_model=List[HealthDataResponse])
 async def get_health_data(
     data_type: Optional[str] = Query(None, description="Data type: exercise, diet, sleep"),
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_user_with_writes),
     db: Session = Depends(get_db)
 ):
     """Get health data"""
@@ -48,23 +81,42 @@ async def get_health_data(
 @router.get("/statistics")
 async def get_health_statistics(
     days: int = Query(7, ge=1, le=365),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_with_writes),
+    session_factory=Depends(get_session_factory)
 ):
     """Get health data statistics"""
-    stats = HealthDataService.get_health_data_statistics(db, current_user.id, days)
-    return stats
+    return await statistics_cache.get(
+        f"{current_user.id}:{days}",
+        lambda: run_in_session(session_factory, HealthDataService.get_health_data_statistics, current_user.id, days),
+        tags=[user_tag(current_user.id)]
+    )
+
+
+@router.get("/trends", response_model=HealthTrendResponse)
+async def get_health_trends(
+    metric: str = Query(..., description="Numeric field, e.g. duration, calories, sleep_duration"),
+    bucket: str = Query("day", description="Bucket size: day, week, month"),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    current_user: User = Depends(get_current_user_with_writes),
+    db: Session = Depends(get_db)
+):
+    """Get bucketed health data trends"""
+    trends = HealthDataService.get_health_data_trends(
+        db, current_user.id, metric, bucket, start, end
+    )
+    return trends
 
 
 # Health Plan Endpoints
 @router.post("/plan", response_model=HealthPlanResponse, status_code=status.HTTP_201_CREATED)
 async def generate_health_plan(
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_user_with_writes),
     db: Session = Depends(get_db)
 ):
     """Generate personalized health plan"""
-    # Use AI service to generate personalized plan
-    plan_data = ai_service.generate_personalized_plan(db, current_user)
+    # Use AI service to generate personalized plan, off the event loop
+    plan_data = await run_in_threadpool(ai_service.generate_personalized_plan, db, current_user)
     
     # Create plan
     created_plan = HealthDataService.create_health_plan(
@@ -85,6 +137,96 @@ async def get_health_plans(
     return plans
 
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+def _save_streamed_plan(db: Session, user_id: int, plan: HealthPlanCreate) -> HealthPlanResponse:
+    return HealthPlanResponse.model_validate(HealthDataService.create_health_plan(db, user_id, plan))
+
+
+async def _plan_events(request: Request, session_factory, user: User, plan_data: Dict) -> AsyncIterator[str]:
+    """Plan fields, then generated description tokens, then the saved plan
+
+    Runs after the endpoint has returned, when its request-scoped session
+    may already be closed, so the plan is saved in a session of its own.
+    """
+    yield _sse("plan", plan_data)
+    
+    generated = []
+    if ai_service.text_generator is not None:
+        stream = ai_service.text_generator.stream(ai_service.plan_description_prompt(user, plan_data))
+        try:
+            while True:
+                try:
+                    chunk = await run_in_threadpool(stream.get, 1.0)
+                except queue.Empty:
+                    if await request.is_disconnected():
+                        return
+                    continue
+                if chunk is None:
+                    break
+                generated.append(chunk)
+                yield _sse("token", {"text": chunk})
+        except Exception as e:
+            print(f"Could not generate plan description: {e}")
+            yield _sse("error", {"detail": "Plan description generation failed"})
+            return
+        finally:
+            # Stops generation when the client goes away mid-stream
+            stream.cancel()
+    
+    # Only plans that streamed to completion are saved
+    created_plan = await run_in_threadpool(
+        run_in_session, session_factory, _save_streamed_plan, user.id,
+        HealthPlanCreate(**plan_data, ai_generated_content="".join(generated).strip() or None)
+    )
+    yield _sse("done", created_plan)
+
+
+@router.get("/plan/stream")
+async def stream_health_plan(
+    request: Request,
+    current_user: User = Depends(get_current_user_with_writes),
+    db: Session = Depends(get_db),
+    session_factory=Depends(get_session_factory)
+):
+    """Generate personalized health plan, streamed as Server-Sent Events
+    
+    Events: plan (computed fields), token (generated description text, repeated)
+    and done (the saved plan), or error (generation failed; nothing is saved).
+    """
+    plan_data = await run_in_threadpool(ai_service.generate_personalized_plan, db, current_user)
+    return StreamingResponse(
+        _plan_events(request, session_factory, current_user, plan_data),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/plan/simulate", response_model=PlanSimulationResponse, response_model_exclude_none=True)
+async def simulate_health_plan(
+    simulation: PlanSimulationRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Project weight and calorie balance for every combination of the parameter grids
+    
+    Grids left empty take the value of plan_id's plan, if given. Scenarios
+    are listed in grid order: exercise minutes, then weekly days, then calories.
+    """
+    plan = None
+    if simulation.plan_id is not None:
+        plans = HealthDataService.get_user_health_plans(db, current_user.id)
+        plan = next((p for p in plans if p.id == simulation.plan_id), None)
+        if not plan:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Health plan not found"
+            )
+    return await run_in_threadpool(plan_simulator.simulate, current_user, simulation, plan)
+
+
 @router.get("/plan/{plan_id}", response_model=HealthPlanResponse)
 async def get_health_plan(
     plan_id: int,
@@ -104,6 +246,16 @@ async def get_health_plan(
     return plan
 
 
+@router.get("/plan/{plan_id}/progress", response_model=PlanProgressResponse)
+async def get_health_plan_progress(
+    plan_id: int,
+    current_user: User = Depends(get_current_user_with_writes),
+    db: Session = Depends(get_db)
+):
+    """Get health plan adherence: days on target, calorie balance and streaks"""
+    return await run_in_threadpool(adherence_tracker.progress, db, current_user.id, plan_id)
+
+
 @router.put("/plan/{plan_id}", response_model=HealthPlanResponse)
 async def update_health_plan(
     plan_id: int,
@@ -120,41 +272,22 @@ async def update_health_plan(
 
 @router.get("/recommendations")
 async def get_ai_recommendations(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_with_writes),
+    session_factory=Depends(get_session_factory)
 ):
     """Get AI recommendations"""
-    # Analyze user health data
-    analysis = ai_service.analyze_health_data(db, current_user.id)
-    
-    # Generate recommendations
-    recommendations = []
-    
-    # Generate recommendations based on analysis
-    if analysis["exercise_frequency"] < 3:
-        recommendations.append({
-            "type": "exercise",
-            "priority": "high",
-            "message": "Recommend increasing exercise frequency to at least 3 times per week"
-        })
-    
-    if analysis["average_sleep_hours"] < 7:
-        recommendations.append({
-            "type": "sleep",
-            "priority": "high",
-            "message": "Insufficient sleep time, recommend 7-9 hours daily for health"
-        })
-    
-    if analysis["average_sleep_hours"] >= 7:
-        recommendations.append({
-            "type": "sleep",
-            "priority": "low",
-            "message": "Adequate sleep, keep it up"
-        })
-    
-    return {
-        "user_id": current_user.id,
-        "analysis": analysis,
-        "recommendations": recommendations
-    }
+    return await recommendation_cache.get(
+        current_user.id,
+        lambda: run_in_session(session_factory, RecommendationService.get_recommendations, current_user.id),
+        tags=[user_tag(current_user.id)]
+    )
 
+
+@router.get("/recommendations/peers")
+async def get_peer_recommendations(
+    k: int = Query(20, ge=1, le=100, description="Number of similar users to compare with"),
+    current_user: User = Depends(get_current_user_with_writes),
+    db: Session = Depends(get_db)
+):
+    """Get recommendations based on similar users"""
+    return ai_service.get_peer_recommendations(db, current_user, k)
@@ -2,9 +2,11 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
+from app.core.profiling import run_in_threadpool
 from app.core.security import get_current_user
-from app.schemas.user import UserUpdate, UserResponse
+from app.schemas.user import UserUpdate, UserResponse, UserSegmentResponse
 from app.services.user_service import UserService
+from app.services.segmentation_service import segmentation_service
 from app.models.user import User
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -24,9 +26,19 @@ async def update_current_user(
 ):
     """Update current user information"""
     updated_user = UserService.update_user(db, current_user.id, user_data)
+    segmentation_service.schedule(updated_user.id)
     return updated_user
 
 
+@router.get("/me/segment", response_model=UserSegmentResponse)
+async def get_current_user_segment(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get current user's segment"""
+    return await run_in_threadpool(segmentation_service.get_segment, db, current_user)
+
+
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: int,
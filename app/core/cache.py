@@ -0,0 +1,535 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.memory import memory
+from app.core.metrics import metrics
+from app.core.profiling import run_in_threadpool
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+TAG_PREFIX = "tag:"
+LOCK_PREFIX = "lock:"
+
+
+class MemoryBackend:
+    """Process-local LRU store capped by total bytes; tag versions are kept apart and never evicted"""
+
+    shared = False
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # key -> (expires_at, value)
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._versions: Dict[str, bytes] = {}
+        self._bytes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key: str, now: float) -> Optional[bytes]:
+        if key.startswith(TAG_PREFIX):
+            return self._versions.get(key)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(key) + len(entry[1])
+
+    def _set(self, key: str, value: bytes, ttl: Optional[float]):
+        if key.startswith(TAG_PREFIX):
+            self._versions[key] = value
+            return
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl if ttl else float("inf"), value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        now = time.monotonic()
+        with self._lock:
+            return [self._get(key, now) for key in keys]
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self.set_sync(key, value, ttl)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        with self._lock:
+            if self._get(key, time.monotonic()) is not None:
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    async def delete(self, key: str):
+        self.delete_sync(key)
+
+    def set_sync(self, key: str, value: bytes, ttl: Optional[float] = None):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def delete_sync(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    async def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+class DiskBackend:
+    """SQLite file shared by the workers on one host
+
+    Durability is not needed for a cache, so writes skip fsync; WAL mode lets
+    readers proceed while another worker writes.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, max_entries: int = 1_000_000, purge_every: int = 1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self._local = threading.local()
+        self._writes = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # sqlite3 blocks (up to the busy timeout under writer contention), so the
+    # async methods run the synchronous ones in a worker thread
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return await run_in_threadpool(self.get_many_sync, keys)
+
+    def get_many_sync(self, keys: List[str]) -> List[Optional[bytes]]:
+        placeholders = ",".join("?" * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, value FROM cache_entries WHERE key IN ({placeholders}) "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            [*keys, time.time()]
+        ).fetchall()
+        found = dict(rows)
+        return [found.get(key) for key in keys]
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        await run_in_threadpool(self.set_sync, key, value, ttl)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return await run_in_threadpool(self.add_sync, key, value, ttl)
+
+    def add_sync(self, key: str, value: bytes, ttl: float) -> bool:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("DELETE FROM cache_entries WHERE key = ? AND expires_at <= ?", (key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, now + ttl)
+        )
+        return cursor.rowcount == 1
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self.delete_sync, key)
+
+    def set_sync(self, key: str, value: bytes, ttl: Optional[float] = None):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl if ttl else None)
+        )
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            self._purge(conn)
+
+    def _purge(self, conn: sqlite3.Connection):
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+        # Over the cap, drop the entries closest to expiry; tag versions never expire
+        conn.execute(
+            "DELETE FROM cache_entries WHERE key IN (SELECT key FROM cache_entries "
+            "WHERE expires_at IS NOT NULL ORDER BY expires_at LIMIT max(0, "
+            "(SELECT count(*) FROM cache_entries) - ?))",
+            (self.max_entries,)
+        )
+
+    def delete_sync(self, key: str):
+        self._connection().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    async def clear(self):
+        await run_in_threadpool(self.clear_sync)
+
+    def clear_sync(self):
+        self._connection().execute("DELETE FROM cache_entries")
+
+    def stats(self) -> Dict:
+        count, size = self._connection().execute(
+            "SELECT count(*), coalesce(sum(length(value)), 0) FROM cache_entries"
+        ).fetchone()
+        return {"backend": "disk", "path": self.path, "entries": count, "bytes": size}
+
+
+class RedisBackend:
+    """Entries in any server speaking the Redis protocol, shared by all hosts"""
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "cache:"):
+        if not HAS_REDIS:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package")
+        self.client = aioredis.from_url(url)
+        # Invalidation is also called from synchronous service code and threads
+        self.sync_client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return await self.client.mget([self.prefix + key for key in keys])
+
+    def get_many_sync(self, keys: List[str]) -> List[Optional[bytes]]:
+        return self.sync_client.mget([self.prefix + key for key in keys])
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        await self.client.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return bool(await self.client.set(self.prefix + key, value, px=int(ttl * 1000), nx=True))
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    def set_sync(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self.sync_client.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    def delete_sync(self, key: str):
+        self.sync_client.delete(self.prefix + key)
+
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter(f"{self.prefix}*")]
+        if keys:
+            await self.client.delete(*keys)
+
+    def stats(self) -> Dict:
+        return {"backend": "redis", "prefix": self.prefix}
+
+
+def _tag_key(tag: str) -> str:
+    return TAG_PREFIX + tag
+
+
+# Values are pickled, so entries read back from a shared store must be ours:
+# each one is prefixed with an HMAC of the pickle. The memory backend never
+# leaves the process and signs with a key of its own.
+_SIGNING_KEY = settings.CACHE_SECRET.encode() or os.urandom(32)
+_SIGNATURE_BYTES = hashlib.sha256().digest_size
+
+
+def _dumps(value: Any) -> bytes:
+    payload = pickle.dumps(value)
+    return hmac.new(_SIGNING_KEY, payload, hashlib.sha256).digest() + payload
+
+
+def _loads(raw: bytes) -> Any:
+    """Unpickle a signed entry; raises ValueError when the signature does not match"""
+    signature, payload = raw[:_SIGNATURE_BYTES], raw[_SIGNATURE_BYTES:]
+    if not hmac.compare_digest(signature, hmac.new(_SIGNING_KEY, payload, hashlib.sha256).digest()):
+        raise ValueError("cache entry signature does not match")
+    return pickle.loads(payload)
+
+
+def _new_version() -> bytes:
+    # Unique per invalidation, so a lost or reset version can never match an old entry
+    return str(time.time_ns()).encode()
+
+
+class Cache:
+    """One namespace of cached values on a shared backend
+
+    Values are pickled (and signed) together with the versions of their tags at the time
+    the computation started; invalidating a tag bumps its version, which
+    turns every entry stamped with the old version into a miss (including
+    results of computations still running when the tag was invalidated).
+
+    Concurrent misses for a key share one computation in this process; on
+    shared backends a short-lived lock keeps other workers waiting for that
+    result instead of recomputing it.
+    """
+
+    def __init__(self, name: str, backend, ttl_seconds: float, lock_timeout: float = 10.0):
+        self.name = name
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.lock_timeout = lock_timeout
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.errors = 0
+
+    def _key(self, key) -> str:
+        return f"{self.name}:{key}"
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    async def _lookup(self, key: str, tags: Tuple[str, ...]) -> Tuple[bool, Any, List[Optional[bytes]]]:
+        """(found, value, current tag versions)"""
+        raw, *versions = await self.backend.get_many([key, *[_tag_key(tag) for tag in tags]])
+        if raw is None:
+            return False, None, versions
+        try:
+            stamped, value = _loads(raw)
+        except ValueError as e:
+            # Written with another secret, or not by us: recompute and overwrite it
+            print(f"Could not read cache {self.name}: {e}")
+            self._count("errors")
+            return False, None, versions
+        if stamped != versions:
+            self._count("stale")
+            return False, None, versions
+        return True, value, versions
+
+    async def get(self, key, compute: Callable[[], Any], tags: Iterable[str] = (), ttl: Optional[float] = None) -> Any:
+        """Cached value of key, computing it on a miss
+
+        compute may be a coroutine function or a blocking function (run in a
+        worker thread). None results are not cached. Coalesced callers share
+        one computation, so it must not use one request's database session;
+        see run_in_session.
+        """
+        key, tags = self._key(key), tuple(tags)
+        try:
+            found, value, versions = await self._lookup(key, tags)
+        except Exception as e:
+            print(f"Could not read cache {self.name}: {e}")
+            self._count("errors")
+            return await self._call(compute)
+        if found:
+            self._count("hits")
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                self.misses += 1
+                future = asyncio.ensure_future(self._fill(key, compute, tags, versions, ttl))
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+        # One caller disconnecting must not cancel the computation others wait on
+        return await asyncio.shield(future)
+
+    async def _fill(self, key: str, compute, tags, versions, ttl) -> Any:
+        locked = False
+        try:
+            if self.backend.shared:
+                locked = await self._acquire(key)
+                deadline = time.monotonic() + self.lock_timeout
+                # Another worker is computing it; wait for its result or for its lock to go away
+                while not locked and time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                    found, value, _ = await self._lookup(key, tags)
+                    if found:
+                        return value
+                    locked = await self._acquire(key)
+            value = await self._call(compute)
+            if value is not None:
+                try:
+                    await self.backend.set(key, _dumps((versions, value)), ttl or self.ttl_seconds)
+                except Exception as e:
+                    print(f"Could not write cache {self.name}: {e}")
+                    self._count("errors")
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            if locked:
+                try:
+                    await self.backend.delete(LOCK_PREFIX + key)
+                except Exception as e:
+                    print(f"Could not unlock cache {self.name}: {e}")
+
+    async def _acquire(self, key: str) -> bool:
+        try:
+            return await self.backend.add(LOCK_PREFIX + key, b"1", self.lock_timeout)
+        except Exception as e:
+            # Compute without the lock rather than fail the request
+            print(f"Could not lock cache {self.name}: {e}")
+            return False
+
+    @staticmethod
+    async def _call(compute: Callable[[], Any]) -> Any:
+        if asyncio.iscoroutinefunction(compute):
+            return await compute()
+        return await run_in_threadpool(compute)
+
+    async def tag_versions(self, tags: Iterable[str]) -> List[Optional[bytes]]:
+        """Current versions of tags, to pass to set() for a value computed afterwards"""
+        tags = tuple(tags)
+        return await self.backend.get_many([_tag_key(tag) for tag in tags]) if tags else []
+
+    async def set(
+        self,
+        key,
+        value,
+        tags: Iterable[str] = (),
+        ttl: Optional[float] = None,
+        versions: Optional[List[Optional[bytes]]] = None
+    ):
+        """Store a value; pass the tag versions read before computing it so a concurrent invalidation wins"""
+        if versions is None:
+            versions = await self.tag_versions(tags)
+        await self.backend.set(self._key(key), _dumps((versions, value)), ttl or self.ttl_seconds)
+
+    async def invalidate(self, key):
+        await self.backend.delete(self._key(key))
+
+    def invalidate_sync(self, key):
+        self.backend.delete_sync(self._key(key))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "ttl_seconds": self.ttl_seconds,
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "stale": self.stale,
+                "errors": self.errors,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+def build_backend(name: str):
+    if name == "memory":
+        return MemoryBackend(settings.CACHE_MEMORY_MAX_BYTES)
+    if name in ("disk", "redis") and not settings.CACHE_SECRET:
+        raise RuntimeError(f"CACHE_BACKEND={name} requires CACHE_SECRET to sign cached values")
+    if name == "disk":
+        return DiskBackend(settings.CACHE_DISK_PATH)
+    if name == "redis":
+        return RedisBackend(settings.REDIS_URL, settings.CACHE_REDIS_PREFIX)
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+cache_backend = build_backend(settings.CACHE_BACKEND)
+caches: Dict[str, Cache] = {}
+
+
+def get_cache(name: str, ttl_seconds: float) -> Cache:
+    """The named cache namespace, created on first use"""
+    if name not in caches:
+        caches[name] = Cache(name, cache_backend, ttl_seconds)
+    return caches[name]
+
+
+def user_tag(user_id: int) -> str:
+    """Tag of everything derived from one user's profile or health data"""
+    return f"user:{user_id}"
+
+
+async def invalidate_tags(*tags: str):
+    for tag in tags:
+        await cache_backend.set(_tag_key(tag), _new_version())
+
+
+def invalidate_tags_sync(*tags: str):
+    """invalidate_tags for synchronous code and worker threads"""
+    for tag in tags:
+        try:
+            cache_backend.set_sync(_tag_key(tag), _new_version())
+        except Exception as e:
+            print(f"Could not invalidate cache tag {tag}: {e}")
+
+
+def tag_versions_sync(*tags: str) -> Optional[List[Optional[bytes]]]:
+    """Current versions of tags, for process-local caches to notice other workers' invalidations
+
+    None on the per-process memory backend, where every invalidation is local.
+    """
+    if not cache_backend.shared:
+        return None
+    try:
+        return cache_backend.get_many_sync([_tag_key(tag) for tag in tags])
+    except Exception as e:
+        print(f"Could not read cache tags: {e}")
+        # A fresh version matches nothing, so the caller treats its copy as stale
+        return [_new_version() for _ in tags]
+
+
+async def clear_caches():
+    await cache_backend.clear()
+
+
+def cache_stats() -> Dict:
+    return {
+        "backend": cache_backend.stats(),
+        "namespaces": {name: cache.stats() for name, cache in caches.items()}
+    }
+
+
+def cache_memory() -> Dict:
+    """Bytes this process holds for cached values; disk and redis keep them elsewhere"""
+    report = {"inflight": sum(len(cache._inflight) for cache in caches.values())}
+    if isinstance(cache_backend, MemoryBackend):
+        backend = cache_backend.stats()
+        report.update(entries=backend["entries"], bytes=backend["bytes"], max_bytes=backend["max_bytes"])
+    return report
+
+
+metrics.register("cache", cache_stats)
+memory.register("cache", cache_memory)
@@ -0,0 +1,244 @@
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "text/",
+)
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        # Emit everything so far without ending the stream
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encodings() -> Dict[str, callable]:
+    """Content-Encoding -> compressor factory, in server preference order"""
+    encodings = {}
+    if HAS_BROTLI:
+        encodings["br"] = lambda: BrotliCompressor(settings.COMPRESSION_BROTLI_QUALITY)
+    if HAS_ZSTD:
+        encodings["zstd"] = lambda: ZstdCompressor(settings.COMPRESSION_ZSTD_LEVEL)
+    encodings["gzip"] = lambda: GzipCompressor(settings.COMPRESSION_GZIP_LEVEL)
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str, supported) -> Optional[str]:
+    """Pick the supported coding with the highest q-value, ties going to server preference"""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+
+    best, best_q = None, 0.0
+    for coding in supported:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+class CompressionMiddleware:
+    """ASGI response compression with gzip, and brotli/zstd when installed
+
+    Complete bodies under minimum_size are sent as-is; bodies of at least
+    offload_size are compressed in a worker thread so the event loop keeps
+    serving. Streaming responses are compressed chunk by chunk and flushed
+    after each one, so nothing is held back.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, offload_size: int = 256 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.encodings = available_encodings()
+        self._lock = threading.Lock()
+        self.counts: Dict[str, Dict[str, int]] = {}
+        metrics.register("compression", self.stats)
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int, streamed: bool):
+        with self._lock:
+            counts = self.counts.setdefault(
+                encoding, {"responses": 0, "streamed": 0, "bytes_in": 0, "bytes_out": 0}
+            )
+            counts["responses"] += 1
+            counts["streamed"] += int(streamed)
+            counts["bytes_in"] += bytes_in
+            counts["bytes_out"] += bytes_out
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                encoding: {**counts, "ratio": counts["bytes_out"] / counts["bytes_in"] if counts["bytes_in"] else 1.0}
+                for encoding, counts in self.counts.items()
+            }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = _header(scope.get("headers", []), b"accept-encoding")
+        encoding = negotiate_encoding(accept.decode("latin-1"), self.encodings) if accept else None
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        responder = _CompressingResponder(self, send, encoding)
+        await self.app(scope, receive, responder)
+
+
+class _CompressingResponder:
+    def __init__(self, middleware: CompressionMiddleware, send, encoding: str):
+        self.middleware = middleware
+        self.send = send
+        self.encoding = encoding
+        self.factory = middleware.encodings[encoding]
+        self.minimum_size = middleware.minimum_size
+        self.offload_size = middleware.offload_size
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    def _compressible(self, headers) -> bool:
+        if _header(headers, b"content-encoding") is not None:
+            return False
+        content_type = (_header(headers, b"content-type") or b"").decode("latin-1").lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES) or "+json" in content_type
+
+    def _start_headers(self, length: Optional[int]) -> List[Tuple[bytes, bytes]]:
+        headers = [
+            (key, value) for key, value in self.start_message.get("headers", [])
+            if key.lower() not in (b"content-length", b"vary")
+        ]
+        vary = _header(self.start_message.get("headers", []), b"vary")
+        headers.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+        headers.append((b"content-encoding", self.encoding.encode()))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode()))
+        return headers
+
+    async def _run(self, fn, data: bytes) -> bytes:
+        if len(data) >= self.offload_size:
+            return await anyio.to_thread.run_sync(fn, data)
+        return fn(data)
+
+    def _compress_all(self, data: bytes) -> bytes:
+        compressor = self.factory()
+        return compressor.compress(data) + compressor.finish()
+
+    def _compress_chunk(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush()
+
+    async def __call__(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start_message = message
+            self.passthrough = not self._compressible(message.get("headers", []))
+            if self.passthrough:
+                await self.send(message)
+            return
+        if message_type != "http.response.body" or self.passthrough:
+            return await self.send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            if not more_body:
+                # Complete body in one message
+                if len(body) < self.minimum_size:
+                    await self.send(self.start_message)
+                    return await self.send(message)
+                compressed = await self._run(self._compress_all, body)
+                self.middleware.record(self.encoding, len(body), len(compressed), streamed=False)
+                await self.send({**self.start_message, "headers": self._start_headers(len(compressed))})
+                return await self.send({"type": "http.response.body", "body": compressed})
+            # Streaming: length unknown, compress and flush as chunks arrive
+            self.compressor = self.factory()
+            await self.send({**self.start_message, "headers": self._start_headers(None)})
+
+        chunk = await self._run(self._compress_chunk, body) if body else b""
+        if not more_body:
+            chunk += self.compressor.finish()
+        self.bytes_in += len(body)
+        self.bytes_out += len(chunk)
+        if not more_body:
+            self.middleware.record(self.encoding, self.bytes_in, self.bytes_out, streamed=True)
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
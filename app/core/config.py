@@ -1,6 +1,8 @@
 from pydantic import BaseModel
 from typing import Optional
 import os
+import socket
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,9 +23,156 @@ class Settings(BaseModel):
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+    
+    # Revoked token denylist: per-worker bloom filter over the revoked_tokens table
+    DENYLIST_CAPACITY: int = int(os.getenv("DENYLIST_CAPACITY", "100000"))
+    DENYLIST_ERROR_RATE: float = float(os.getenv("DENYLIST_ERROR_RATE", "0.001"))
+    DENYLIST_SYNC_SECONDS: float = float(os.getenv("DENYLIST_SYNC_SECONDS", "2"))
+    DENYLIST_REBUILD_SECONDS: float = float(os.getenv("DENYLIST_REBUILD_SECONDS", "600"))
     
     # AI Model
     AI_MODEL_PATH: str = "./models/health_model.h5"
+    
+    # Text generator: pytorch (full precision), onnx (ONNX Runtime, int8 when quantized) or none
+    TEXT_GENERATOR_BACKEND: str = os.getenv("TEXT_GENERATOR_BACKEND", "pytorch")
+    TEXT_GENERATOR_MODEL: str = os.getenv("TEXT_GENERATOR_MODEL", "gpt2")
+    TEXT_GENERATOR_ONNX_PATH: str = os.getenv("TEXT_GENERATOR_ONNX_PATH", "./models/text_generator_onnx")
+    TEXT_GENERATOR_MAX_NEW_TOKENS: int = int(os.getenv("TEXT_GENERATOR_MAX_NEW_TOKENS", "60"))
+    TEXT_GENERATOR_THREADS: int = int(os.getenv("TEXT_GENERATOR_THREADS", "0"))  # 0 = runtime default
+    
+    # Per-user health data cache
+    HEALTH_CACHE_DAYS: int = int(os.getenv("HEALTH_CACHE_DAYS", "90"))
+    HEALTH_CACHE_MAX_BYTES: int = int(os.getenv("HEALTH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    HEALTH_CACHE_TTL_SECONDS: float = float(os.getenv("HEALTH_CACHE_TTL_SECONDS", "300"))
+    
+    # User segmentation
+    SEGMENTATION_CLUSTERS: int = int(os.getenv("SEGMENTATION_CLUSTERS", "5"))
+    SEGMENTATION_MODEL_PATH: str = os.getenv("SEGMENTATION_MODEL_PATH", "./models/segmentation.joblib")
+    SEGMENTATION_SAVE_EVERY: int = int(os.getenv("SEGMENTATION_SAVE_EVERY", "100"))
+    # Users' latest vectors are folded into the centroids in batches of distinct users, or after a while
+    SEGMENTATION_BATCH_USERS: int = int(os.getenv("SEGMENTATION_BATCH_USERS", "256"))
+    SEGMENTATION_FOLD_SECONDS: float = float(os.getenv("SEGMENTATION_FOLD_SECONDS", "60"))
+    SEGMENTATION_DRIFT_THRESHOLD: float = float(os.getenv("SEGMENTATION_DRIFT_THRESHOLD", "0.25"))
+    
+    # Similar-user (peer) index
+    PEER_INDEX_PATH: str = os.getenv("PEER_INDEX_PATH", "./models/peer_index.joblib")
+    PEER_INDEX_NPROBE: int = int(os.getenv("PEER_INDEX_NPROBE", "16"))
+    PEER_INDEX_MAX_DELTA: int = int(os.getenv("PEER_INDEX_MAX_DELTA", "10000"))
+    PEER_INDEX_RELOAD_SECONDS: float = float(os.getenv("PEER_INDEX_RELOAD_SECONDS", "60"))
+    
+    # Cache layer (app/core/cache.py): memory (per process), disk (per host) or redis (shared)
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")
+    CACHE_MEMORY_MAX_BYTES: int = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+    CACHE_DISK_PATH: str = os.getenv("CACHE_DISK_PATH", "./data/cache.sqlite3")
+    CACHE_REDIS_PREFIX: str = os.getenv("CACHE_REDIS_PREFIX", "cache:")
+    # Signs cached values; required by the disk and redis backends, and the
+    # same for every worker and host sharing the store
+    CACHE_SECRET: str = os.getenv("CACHE_SECRET", "")
+    CACHE_PRINCIPAL_TTL_SECONDS: float = float(os.getenv("CACHE_PRINCIPAL_TTL_SECONDS", "60"))
+    CACHE_STATISTICS_TTL_SECONDS: float = float(os.getenv("CACHE_STATISTICS_TTL_SECONDS", "300"))
+    RECOMMENDATION_CACHE_TTL_SECONDS: float = float(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "300"))
+    
+    # Daily precomputation of analyses, statistics and recommendations for active users
+    PRECOMPUTE_ENABLED: bool = os.getenv("PRECOMPUTE_ENABLED", "false").lower() == "true"
+    PRECOMPUTE_AT: str = os.getenv("PRECOMPUTE_AT", "05:00")
+    PRECOMPUTE_ACTIVE_DAYS: int = int(os.getenv("PRECOMPUTE_ACTIVE_DAYS", "14"))
+    PRECOMPUTE_BATCH_SIZE: int = int(os.getenv("PRECOMPUTE_BATCH_SIZE", "200"))
+    PRECOMPUTE_CONCURRENCY: int = int(os.getenv("PRECOMPUTE_CONCURRENCY", "2"))
+    PRECOMPUTE_MAX_USERS_PER_SECOND: float = float(os.getenv("PRECOMPUTE_MAX_USERS_PER_SECOND", "50"))
+    PRECOMPUTE_BUSY_CONNECTIONS: int = int(os.getenv("PRECOMPUTE_BUSY_CONNECTIONS", "3"))
+    PRECOMPUTE_TTL_SECONDS: float = float(os.getenv("PRECOMPUTE_TTL_SECONDS", str(6 * 3600)))
+
+    # Interned plan text blobs (app/services/plan_text_store.py)
+    PLAN_TEXT_CACHE_MAX_BYTES: int = int(os.getenv("PLAN_TEXT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+    # What-if plan projections (POST /api/health/plan/simulate)
+    SIMULATION_MAX_SCENARIOS: int = int(os.getenv("SIMULATION_MAX_SCENARIOS", "2000"))
+    SIMULATION_MAX_DAYS: int = int(os.getenv("SIMULATION_MAX_DAYS", "365"))
+
+    # Streaming anomaly detection: daily totals per metric against an EWMA baseline,
+    # flagged beyond ANOMALY_Z_THRESHOLD running standard deviations
+    ANOMALY_ENABLED: bool = os.getenv("ANOMALY_ENABLED", "true").lower() == "true"
+    ANOMALY_EWMA_ALPHA: float = float(os.getenv("ANOMALY_EWMA_ALPHA", "0.2"))
+    ANOMALY_Z_THRESHOLD: float = float(os.getenv("ANOMALY_Z_THRESHOLD", "3"))
+    ANOMALY_MIN_DAYS: int = int(os.getenv("ANOMALY_MIN_DAYS", "7"))
+    ANOMALY_RECENT_DAYS: int = int(os.getenv("ANOMALY_RECENT_DAYS", "3"))
+    ANOMALY_BOOTSTRAP_DAYS: int = int(os.getenv("ANOMALY_BOOTSTRAP_DAYS", "90"))
+
+    # Plan adherence (GET /api/health/plan/{id}/progress): a day is on target when calories
+    # eaten are within this fraction of the plan's target
+    ADHERENCE_CALORIE_TOLERANCE: float = float(os.getenv("ADHERENCE_CALORIE_TOLERANCE", "0.1"))
+
+    # Recommendation and plan insight rules
+    RECOMMENDATION_RULES_PATH: str = os.getenv(
+        "RECOMMENDATION_RULES_PATH",
+        str(Path(__file__).resolve().parent.parent / "rules" / "recommendations.json"),
+    )
+    
+    # Write-behind ingestion buffer (POST /api/health/data/ingest)
+    INGEST_ENABLED: bool = os.getenv("INGEST_ENABLED", "false").lower() == "true"
+    INGEST_LOG_DIR: str = os.getenv("INGEST_LOG_DIR", "./data/ingest")
+    INGEST_NODE_ID: str = os.getenv("INGEST_NODE_ID", socket.gethostname())
+    INGEST_SEGMENT_BYTES: int = int(os.getenv("INGEST_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+    INGEST_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("INGEST_FLUSH_INTERVAL_SECONDS", "1.0"))
+    INGEST_FLUSH_BATCH: int = int(os.getenv("INGEST_FLUSH_BATCH", "1000"))
+    INGEST_MAX_PENDING: int = int(os.getenv("INGEST_MAX_PENDING", "100000"))
+    
+    # Response compression (gzip; brotli and zstd when installed)
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+    COMPRESSION_MINIMUM_SIZE: int = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+    COMPRESSION_OFFLOAD_SIZE: int = int(os.getenv("COMPRESSION_OFFLOAD_SIZE", str(256 * 1024)))
+    COMPRESSION_GZIP_LEVEL: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    COMPRESSION_BROTLI_QUALITY: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+    COMPRESSION_ZSTD_LEVEL: int = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+    
+    # Admin endpoints (/api/admin/*), authorised by the X-Admin-Key header; disabled when empty
+    ADMIN_API_KEY: str = os.getenv("ADMIN_API_KEY", "")
+
+    # Per-request profiling: requests with an X-Profile header signed with PROFILING_SECRET
+    # (scripts/profile_header.py) are profiled into PROFILING_DIR; keep disabled in production.
+    # The secret is required and must differ from SECRET_KEY, which signs access tokens
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_SECRET: str = os.getenv("PROFILING_SECRET", "")
+    PROFILING_DIR: str = os.getenv("PROFILING_DIR", "./data/profiles")
+    PROFILING_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", "1"))
+
+    # Pre-fork server (python -m app.server)
+    SERVER_HOST: str = os.getenv("SERVER_HOST", "0.0.0.0")
+    SERVER_PORT: int = int(os.getenv("SERVER_PORT", "8000"))
+    # More than one worker needs CACHE_BACKEND=disk or redis: memory caches are per process
+    SERVER_WORKERS: int = int(os.getenv("SERVER_WORKERS", "1"))
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: float = float(os.getenv("SERVER_GRACEFUL_TIMEOUT_SECONDS", "30"))
+    SERVER_PRELOAD: bool = os.getenv("SERVER_PRELOAD", "true").lower() == "true"
+    SERVER_LOG_LEVEL: str = os.getenv("SERVER_LOG_LEVEL", "info")
+    
+    # Shared state for multi-worker deployments
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    
+    # Admission control: token buckets (requests/second, burst) per user and globally,
+    # and concurrent requests per route class; 0 disables a limit
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory, redis
+    RATE_LIMIT_PLAN_USER_RATE: float = float(os.getenv("RATE_LIMIT_PLAN_USER_RATE", "0.2"))
+    RATE_LIMIT_PLAN_USER_BURST: int = int(os.getenv("RATE_LIMIT_PLAN_USER_BURST", "3"))
+    RATE_LIMIT_PLAN_GLOBAL_RATE: float = float(os.getenv("RATE_LIMIT_PLAN_GLOBAL_RATE", "20"))
+    RATE_LIMIT_PLAN_GLOBAL_BURST: int = int(os.getenv("RATE_LIMIT_PLAN_GLOBAL_BURST", "40"))
+    RATE_LIMIT_PLAN_CONCURRENCY: int = int(os.getenv("RATE_LIMIT_PLAN_CONCURRENCY", "4"))
+    RATE_LIMIT_SIMULATE_USER_RATE: float = float(os.getenv("RATE_LIMIT_SIMULATE_USER_RATE", "2"))
+    RATE_LIMIT_SIMULATE_USER_BURST: int = int(os.getenv("RATE_LIMIT_SIMULATE_USER_BURST", "10"))
+    RATE_LIMIT_SIMULATE_GLOBAL_RATE: float = float(os.getenv("RATE_LIMIT_SIMULATE_GLOBAL_RATE", "0"))
+    RATE_LIMIT_SIMULATE_GLOBAL_BURST: int = int(os.getenv("RATE_LIMIT_SIMULATE_GLOBAL_BURST", "0"))
+    RATE_LIMIT_SIMULATE_CONCURRENCY: int = int(os.getenv("RATE_LIMIT_SIMULATE_CONCURRENCY", "4"))
+    RATE_LIMIT_AUTH_USER_RATE: float = float(os.getenv("RATE_LIMIT_AUTH_USER_RATE", "1"))
+    RATE_LIMIT_AUTH_USER_BURST: int = int(os.getenv("RATE_LIMIT_AUTH_USER_BURST", "20"))
+    RATE_LIMIT_AUTH_GLOBAL_RATE: float = float(os.getenv("RATE_LIMIT_AUTH_GLOBAL_RATE", "50"))
+    RATE_LIMIT_AUTH_GLOBAL_BURST: int = int(os.getenv("RATE_LIMIT_AUTH_GLOBAL_BURST", "100"))
+    RATE_LIMIT_AUTH_CONCURRENCY: int = int(os.getenv("RATE_LIMIT_AUTH_CONCURRENCY", "8"))
+    RATE_LIMIT_DEFAULT_USER_RATE: float = float(os.getenv("RATE_LIMIT_DEFAULT_USER_RATE", "20"))
+    RATE_LIMIT_DEFAULT_USER_BURST: int = int(os.getenv("RATE_LIMIT_DEFAULT_USER_BURST", "60"))
+    RATE_LIMIT_DEFAULT_GLOBAL_RATE: float = float(os.getenv("RATE_LIMIT_DEFAULT_GLOBAL_RATE", "0"))
+    RATE_LIMIT_DEFAULT_GLOBAL_BURST: int = int(os.getenv("RATE_LIMIT_DEFAULT_GLOBAL_BURST", "0"))
+    RATE_LIMIT_DEFAULT_CONCURRENCY: int = int(os.getenv("RATE_LIMIT_DEFAULT_CONCURRENCY", "0"))
 
 
 settings = Settings()
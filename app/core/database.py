@@ -1,7 +1,9 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.session import _sessions
 from app.core.config import settings
+from app.core.memory import memory
 
 # Create database engine
 engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
@@ -22,7 +24,36 @@ def get_db():
         db.close()
 
 
+def get_session_factory():
+    """Session factory dependency, for work shared beyond the request that starts it"""
+    return SessionLocal
 
 
+def run_in_session(session_factory, function, *args):
+    """Call function(db, *args) with a session of its own, closed afterwards
+
+    Cache computations shared by coalesced requests use this rather than the
+    first caller's request-scoped session, which is closed if that caller
+    disconnects.
+    """
+    db = session_factory()
+    try:
+        return function(db, *args)
+    finally:
+        db.close()
+
+
+def database_memory():
+    """Pool connections, and the open sessions with the objects in their identity maps"""
+    pool = engine.pool
+    # SQLAlchemy's registry of live sessions, weakly referenced
+    sessions = list(_sessions.values())
+    return {
+        "pool": pool.status(),
+        "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+        "sessions": len(sessions),
+        "identity_map_objects": sum(len(session.identity_map) for session in sessions),
+    }
 
 
+memory.register("database", database_memory)
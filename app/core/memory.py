@@ -0,0 +1,137 @@
+import gc
+import linecache
+import resource
+import sys
+import threading
+import tracemalloc
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+# Allocations of the tracer itself, left out of reports
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+def array_bytes(obj, depth: int = 2) -> int:
+    """Bytes held by numpy arrays reachable from obj's attributes, dicts and lists, depth levels down"""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if depth < 0 or obj is None or isinstance(obj, (str, bytes, int, float, bool)):
+        return 0
+    if isinstance(obj, dict):
+        children = obj.values()
+    elif isinstance(obj, (list, tuple)):
+        children = obj
+    elif hasattr(obj, "__dict__"):
+        children = vars(obj).values()
+    else:
+        return 0
+    return sum(array_bytes(child, depth - 1) for child in list(children))
+
+
+def process_memory() -> Dict:
+    """Resident and peak resident set size of this process, in bytes"""
+    report = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    report["rss_bytes" if key == "VmRSS" else "peak_rss_bytes"] = int(value.split()[0]) * 1024
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        report["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    report["gc_objects"] = len(gc.get_objects())
+    report["threads"] = threading.active_count()
+    return report
+
+
+class AllocationTracer:
+    """tracemalloc on demand: top allocation sites, and what changed since the previous snapshot"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1):
+        """Start tracing; allocations made before this are not attributed"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._previous = None
+
+    def stop(self):
+        with self._lock:
+            tracemalloc.stop()
+            self._previous = None
+
+    def snapshot(self, top: int = 20) -> Dict:
+        """Top sites by size, and by growth since the last call"""
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        snapshot = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+        with self._lock:
+            previous, self._previous = self._previous, snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        report = {
+            "tracing": True,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "top": [_site(stat) for stat in snapshot.statistics("lineno")[:top]],
+        }
+        if previous is not None:
+            report["diff"] = [_site(stat) for stat in snapshot.compare_to(previous, "lineno")[:top]]
+        return report
+
+
+def _site(stat) -> Dict:
+    frame = stat.traceback[0]
+    site = {"site": f"{frame.filename}:{frame.lineno}", "bytes": stat.size, "count": stat.count}
+    if hasattr(stat, "size_diff"):
+        site.update(bytes_diff=stat.size_diff, count_diff=stat.count_diff)
+    return site
+
+
+class MemoryRegistry:
+    """Named memory footprint providers (models, caches, pools) collected for /api/admin/memory"""
+
+    def __init__(self):
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+        self._lock = threading.Lock()
+        self.tracer = AllocationTracer()
+
+    def register(self, name: str, collector: Callable[[], Dict]):
+        with self._lock:
+            self._collectors[name] = collector
+
+    def components(self) -> Dict[str, Dict]:
+        with self._lock:
+            collectors = dict(self._collectors)
+        report = {}
+        for name, collector in collectors.items():
+            try:
+                report[name] = collector()
+            except Exception as e:
+                print(f"Could not measure memory of {name}: {e}")
+        return report
+
+    def report(self, top: int = 20) -> Dict:
+        """Process memory, per-component footprints and, while tracing, top allocation sites"""
+        return {
+            "process": process_memory(),
+            "components": self.components(),
+            "allocations": self.tracer.snapshot(top),
+        }
+
+
+memory = MemoryRegistry()
@@ -0,0 +1,28 @@
+import threading
+from typing import Callable, Dict
+
+
+class MetricsRegistry:
+    """Named stats providers collected into one snapshot for /metrics"""
+
+    def __init__(self):
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, collector: Callable[[], Dict]):
+        with self._lock:
+            self._collectors[name] = collector
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            collectors = dict(self._collectors)
+        report = {}
+        for name, collector in collectors.items():
+            try:
+                report[name] = collector()
+            except Exception as e:
+                print(f"Could not collect metrics for {name}: {e}")
+        return report
+
+
+metrics = MetricsRegistry()
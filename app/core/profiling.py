@@ -0,0 +1,280 @@
+import cProfile
+import functools
+import hashlib
+import hmac
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool as _run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.responses import JSONResponse
+
+from app.core.metrics import metrics
+
+# deterministic: cProfile, written as .pstats; sampling: stack samples, written as folded stacks (flame graph input)
+MODES = ("deterministic", "sampling")
+HEADER = b"x-profile"
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+
+def sign_profile_header(mode: str, ttl_seconds: float, secret: str) -> str:
+    """X-Profile header value asking for a mode profile, valid for ttl_seconds"""
+    expires = int(time.time() + ttl_seconds)
+    return f"{mode}:{expires}:{_signature(mode, expires, secret)}"
+
+
+def verify_profile_header(value: str, secret: str) -> Optional[str]:
+    """Requested mode, or None when the value is malformed, expired or wrongly signed"""
+    try:
+        mode, expires, signature = value.split(":")
+        expires = int(expires)
+    except ValueError:
+        return None
+    if mode not in MODES or expires < time.time():
+        return None
+    if not hmac.compare_digest(_signature(mode, expires, secret), signature):
+        return None
+    return mode
+
+
+def _signature(mode: str, expires: int, secret: str) -> str:
+    return hmac.new(secret.encode(), f"profile:{mode}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+def _folded(frame, stop, root: str) -> str:
+    """Stack from stop (inclusive) down to frame as root;outer;...;inner"""
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame))
+        if frame is stop:
+            break
+        frame = frame.f_back
+    return ";".join([root, *reversed(labels)])
+
+
+def _on_stack(frame, target) -> bool:
+    while frame is not None:
+        if frame is target:
+            return True
+        frame = frame.f_back
+    return False
+
+
+class RequestProfile:
+    """One request's profile across the event loop thread and the worker threads it uses
+
+    Worker threads are covered for work offloaded through run_in_threadpool
+    below. In deterministic mode the event loop thread is profiled for the
+    whole request, so other requests' coroutine steps show up too; profile
+    on a quiet instance. Sampling mode only counts event loop samples taken
+    while this request's coroutines are running.
+    """
+
+    def __init__(self, mode: str, path: str, interval_seconds: float):
+        self.mode = mode
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self.queries: List[Dict] = []
+        self._lock = threading.Lock()
+        self._profiles: List[cProfile.Profile] = []
+        # Worker thread ident -> the frame its offloaded call started in
+        self._workers: Dict[int, object] = {}
+        self._stacks: Counter = Counter()
+        self._loop_profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self, marker_frame):
+        """Begin profiling; marker_frame is the request's outermost coroutine frame"""
+        self.started = time.perf_counter()
+        if self.mode == "deterministic":
+            self._loop_profile = cProfile.Profile()
+            self._loop_profile.enable()
+            return
+        self._marker = marker_frame
+        self._loop_thread = threading.get_ident()
+        self._sampler = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.started
+        if self._loop_profile is not None:
+            self._loop_profile.disable()
+            self._profiles.append(self._loop_profile)
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval_seconds):
+            frames = sys._current_frames()
+            frame = frames.get(self._loop_thread)
+            if frame is not None and _on_stack(frame, self._marker):
+                self._stacks[_folded(frame, self._marker, "event_loop")] += 1
+            with self._lock:
+                workers = list(self._workers.items())
+            for ident, start in workers:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self._stacks[_folded(frame, start, "worker")] += 1
+
+    def wrap(self, func: Callable) -> Callable:
+        """func, profiled when it runs in a worker thread"""
+        @functools.wraps(func)
+        def profiled(*args):
+            if self.mode == "deterministic":
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    return func(*args)
+                finally:
+                    profile.disable()
+                    with self._lock:
+                        self._profiles.append(profile)
+            ident = threading.get_ident()
+            with self._lock:
+                self._workers[ident] = sys._getframe()
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._workers.pop(ident, None)
+        return profiled
+
+    def record_query(self, statement: str, seconds: float):
+        with self._lock:
+            self.queries.append({"statement": statement, "ms": round(seconds * 1000, 3)})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.mode == "deterministic":
+            stats = pstats.Stats(self._profiles[0])
+            for profile in self._profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(self.path)
+        else:
+            with open(self.path, "w") as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        with open(os.path.splitext(self.path)[0] + ".sql.json", "w") as f:
+            json.dump({
+                "seconds": self.seconds,
+                "queries": len(self.queries),
+                "query_ms": round(sum(query["ms"] for query in self.queries), 3),
+                "statements": self.queries,
+            }, f, indent=2)
+
+
+async def run_in_threadpool(func: Callable, *args, **kwargs):
+    """fastapi.concurrency.run_in_threadpool that profiles func when the request is being profiled"""
+    profile = _current.get()
+    if profile is not None:
+        func = profile.wrap(functools.partial(func, **kwargs) if kwargs else func)
+        kwargs = {}
+    return await _run_in_threadpool(func, *args, **kwargs)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = conn.info.get("profile_query_started")
+    if profile is not None and started:
+        profile.record_query(statement, time.perf_counter() - started.pop())
+
+
+def install_sql_hooks():
+    """Time SQL statements of profiled requests (contextvars reach the worker threads running them)"""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class ProfilingMiddleware:
+    """Profiles single requests that carry a signed X-Profile header
+
+    The header value comes from sign_profile_header (see
+    scripts/profile_header.py). The profile is written to directory when the
+    request finishes, and its path is returned in X-Profile-Path, next to a
+    .sql.json file with the request's SQL statements and their timings. One
+    request is profiled at a time; others asking meanwhile get 409. Only
+    installed with PROFILING_ENABLED; without it, the cost is one context
+    variable lookup per run_in_threadpool call.
+    """
+
+    def __init__(self, app, secret: str, directory: str, interval_seconds: float = 0.001):
+        self.app = app
+        self.secret = secret
+        self.directory = directory
+        self.interval_seconds = interval_seconds
+        self._busy = False
+        self.profiled = 0
+        self.rejected = 0
+        install_sql_hooks()
+        metrics.register("profiling", self.stats)
+
+    def stats(self) -> Dict:
+        return {"profiled": self.profiled, "rejected": self.rejected, "directory": self.directory}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        value = next((v for k, v in scope.get("headers", []) if k == HEADER), None)
+        if value is None:
+            return await self.app(scope, receive, send)
+
+        mode = verify_profile_header(value.decode("latin-1"), self.secret)
+        if mode is None or self._busy:
+            self.rejected += 1
+            if mode is None:
+                response = JSONResponse({"detail": "Invalid profiling signature"}, status_code=403)
+            else:
+                response = JSONResponse({"detail": "Another request is being profiled"}, status_code=409)
+            return await response(scope, receive, send)
+
+        name = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        suffix = ".pstats" if mode == "deterministic" else ".folded"
+        path = os.path.abspath(os.path.join(
+            self.directory,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}-{name}-{uuid.uuid4().hex[:8]}{suffix}"
+        ))
+
+        async def send_with_path(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-path", path.encode())]}
+            await send(message)
+
+        self._busy = True
+        profile = RequestProfile(mode, path, self.interval_seconds)
+        token = _current.set(profile)
+        profile.start(sys._getframe())
+        try:
+            await self.app(scope, receive, send_with_path)
+        finally:
+            profile.stop()
+            _current.reset(token)
+            self._busy = False
+            try:
+                profile.save()
+                self.profiled += 1
+            except Exception as e:
+                print(f"Could not save request profile: {e}")
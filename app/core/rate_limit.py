@@ -0,0 +1,346 @@
+import math
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from jose import JWTError, jwt
+from starlette.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+try:
+    import redis.asyncio as aioredis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+# (route class, method, path pattern); first match wins, other /api routes are "default"
+ROUTE_CLASSES = (
+    ("plan", "POST", re.compile(r"^/api/health/plan$")),
+    ("plan", "GET", re.compile(r"^/api/health/plan/stream$")),
+    ("simulate", "POST", re.compile(r"^/api/health/plan/simulate$")),
+    ("auth", "POST", re.compile(r"^/api/auth/(login|register)$")),
+)
+API_PREFIX = "/api/"
+
+
+class RouteLimits:
+    """Token bucket and concurrency limits for one route class; 0 disables a limit"""
+
+    def __init__(
+        self,
+        user_rate: float = 0,
+        user_burst: int = 0,
+        global_rate: float = 0,
+        global_burst: int = 0,
+        concurrency: int = 0
+    ):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.concurrency = concurrency
+
+
+class MemoryBackend:
+    """Process-local token buckets and concurrency counters"""
+
+    def __init__(self, max_buckets: int = 100_000):
+        self.max_buckets = max_buckets
+        # key -> (tokens, updated_at, full_at)
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._slots: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """Take one token; returns 0 when allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if len(self._buckets) > self.max_buckets:
+                self._prune(now)
+            return wait
+
+    async def refund(self, key: str, rate: float, burst: int):
+        """Return a token taken by a request rejected at a later stage"""
+        with self._lock:
+            entry = self._buckets.get(key)
+            if entry is None:
+                return
+            tokens, updated_at, _ = entry
+            tokens = min(burst, tokens + 1)
+            self._buckets[key] = (tokens, updated_at, updated_at + (burst - tokens) / rate)
+
+    def _prune(self, now: float):
+        # A full bucket is indistinguishable from a missing one
+        for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        with self._lock:
+            if self._slots.get(key, 0) >= limit:
+                return False
+            self._slots[key] = self._slots.get(key, 0) + 1
+            return True
+
+    async def release(self, key: str):
+        with self._lock:
+            self._slots[key] = max(0, self._slots.get(key, 0) - 1)
+
+    async def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._slots.clear()
+
+
+# Token bucket kept in a hash; uses the server clock so all workers agree
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+REFUND_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', math.min(tonumber(ARGV[1]), tokens + 1))
+end
+"""
+
+ACQUIRE_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+if count > tonumber(ARGV[1]) then
+    redis.call('DECR', KEYS[1])
+    return 0
+end
+return 1
+"""
+
+RELEASE_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') > 0 then
+    redis.call('DECR', KEYS[1])
+end
+"""
+
+
+class RedisBackend:
+    """Token buckets and concurrency counters shared by all workers through Redis
+
+    Any server speaking the Redis protocol with Lua scripting works, e.g. a
+    local redis-server in development. Concurrency counters expire after
+    slot_ttl idle seconds so slots held by a crashed worker are recovered.
+    """
+
+    def __init__(self, url: str, prefix: str = "admission:", slot_ttl: int = 300):
+        if not HAS_REDIS:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the redis package")
+        self.client = aioredis.from_url(url)
+        self.prefix = prefix
+        self.slot_ttl = slot_ttl
+        self._take = self.client.register_script(TAKE_SCRIPT)
+        self._refund = self.client.register_script(REFUND_SCRIPT)
+        self._acquire = self.client.register_script(ACQUIRE_SCRIPT)
+        self._release = self.client.register_script(RELEASE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return float(await self._take(keys=[self.prefix + key], args=[rate, burst]))
+
+    async def refund(self, key: str, rate: float, burst: int):
+        await self._refund(keys=[self.prefix + key], args=[burst])
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        return bool(await self._acquire(keys=[self.prefix + key], args=[limit, self.slot_ttl]))
+
+    async def release(self, key: str):
+        await self._release(keys=[self.prefix + key])
+
+    async def reset(self):
+        keys = [key async for key in self.client.scan_iter(f"{self.prefix}*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """Route class of a request, or None for routes outside the API"""
+    for name, route_method, pattern in ROUTE_CLASSES:
+        if method == route_method and pattern.match(path):
+            return name
+    return "default" if path.startswith(API_PREFIX) else None
+
+
+def client_identity(scope) -> str:
+    """Rate limit key: the token's user id when it verifies, else the client address"""
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                try:
+                    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+                    if payload.get("sub") is not None:
+                        return f"user:{payload['sub']}"
+                except JWTError:
+                    pass
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class AdmissionController:
+    """Decides whether a request is admitted, rate limited (429) or shed (503)"""
+
+    def __init__(self, limits: Dict[str, RouteLimits], backend, enabled: bool = True):
+        self.limits = limits
+        self.backend = backend
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, name: str, outcome: str):
+        with self._lock:
+            counts = self.counts.setdefault(name, {"admitted": 0, "rate_limited": 0, "shed": 0})
+            counts[outcome] += 1
+
+    async def check(self, name: str, identity: str) -> Optional[Tuple[int, float, str]]:
+        """Take tokens and a concurrency slot; returns (status, retry_after, detail) on rejection
+
+        Tokens taken by earlier stages are refunded when a later stage
+        rejects the request, so a user is not charged for requests shed
+        because the server is busy. Admitted requests must call release()
+        when done.
+        """
+        limits = self.limits[name]
+        user_key, global_key = f"{name}:{identity}", f"{name}:global"
+        try:
+            if limits.user_rate > 0:
+                wait = await self.backend.take(user_key, limits.user_rate, limits.user_burst)
+                if wait > 0:
+                    self._count(name, "rate_limited")
+                    return 429, wait, "Too many requests"
+            rejection = None
+            if limits.global_rate > 0:
+                wait = await self.backend.take(global_key, limits.global_rate, limits.global_burst)
+                if wait > 0:
+                    rejection = 503, wait, "Server is busy, please retry later"
+            if rejection is None and limits.concurrency > 0 and not await self.backend.acquire(
+                f"{name}:active", limits.concurrency
+            ):
+                if limits.global_rate > 0:
+                    await self.backend.refund(global_key, limits.global_rate, limits.global_burst)
+                rejection = 503, 1, "Server is busy, please retry later"
+            if rejection is not None:
+                if limits.user_rate > 0:
+                    await self.backend.refund(user_key, limits.user_rate, limits.user_burst)
+                self._count(name, "shed")
+                return rejection
+        except Exception as e:
+            # Fail open: a broken shared store must not take the API down with it
+            print(f"Could not apply admission control: {e}")
+            return None
+        self._count(name, "admitted")
+        return None
+
+    async def release(self, name: str):
+        if self.limits[name].concurrency > 0:
+            try:
+                await self.backend.release(f"{name}:active")
+            except Exception as e:
+                print(f"Could not release concurrency slot: {e}")
+
+    async def reset(self):
+        await self.backend.reset()
+        with self._lock:
+            self.counts.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {name: dict(counts) for name, counts in self.counts.items()}
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware applying an AdmissionController to API requests"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.controller.enabled:
+            return await self.app(scope, receive, send)
+        name = route_class(scope["method"], scope["path"])
+        if name is None or name not in self.controller.limits:
+            return await self.app(scope, receive, send)
+
+        rejection = await self.controller.check(name, client_identity(scope))
+        if rejection is not None:
+            status_code, retry_after, detail = rejection
+            response = JSONResponse(
+                {"detail": detail},
+                status_code=status_code,
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await self.controller.release(name)
+
+
+def build_backend(name: str):
+    if name == "redis":
+        return RedisBackend(settings.REDIS_URL)
+    if name != "memory":
+        raise ValueError(f"Unknown rate limit backend: {name}")
+    return MemoryBackend()
+
+
+admission_controller = AdmissionController(
+    limits={
+        "plan": RouteLimits(
+            settings.RATE_LIMIT_PLAN_USER_RATE, settings.RATE_LIMIT_PLAN_USER_BURST,
+            settings.RATE_LIMIT_PLAN_GLOBAL_RATE, settings.RATE_LIMIT_PLAN_GLOBAL_BURST,
+            settings.RATE_LIMIT_PLAN_CONCURRENCY
+        ),
+        "simulate": RouteLimits(
+            settings.RATE_LIMIT_SIMULATE_USER_RATE, settings.RATE_LIMIT_SIMULATE_USER_BURST,
+            settings.RATE_LIMIT_SIMULATE_GLOBAL_RATE, settings.RATE_LIMIT_SIMULATE_GLOBAL_BURST,
+            settings.RATE_LIMIT_SIMULATE_CONCURRENCY
+        ),
+        "auth": RouteLimits(
+            settings.RATE_LIMIT_AUTH_USER_RATE, settings.RATE_LIMIT_AUTH_USER_BURST,
+            settings.RATE_LIMIT_AUTH_GLOBAL_RATE, settings.RATE_LIMIT_AUTH_GLOBAL_BURST,
+            settings.RATE_LIMIT_AUTH_CONCURRENCY
+        ),
+        "default": RouteLimits(
+            settings.RATE_LIMIT_DEFAULT_USER_RATE, settings.RATE_LIMIT_DEFAULT_USER_BURST,
+            settings.RATE_LIMIT_DEFAULT_GLOBAL_RATE, settings.RATE_LIMIT_DEFAULT_GLOBAL_BURST,
+            settings.RATE_LIMIT_DEFAULT_CONCURRENCY
+        ),
+    },
+    backend=build_backend(settings.RATE_LIMIT_BACKEND),
+    enabled=settings.RATE_LIMIT_ENABLED
+)
+metrics.register("admission", admission_controller.stats)
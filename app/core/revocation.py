@@ -0,0 +1,182 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.memory import memory
+from app.core.metrics import metrics
+from app.core.profiling import run_in_threadpool
+from app.models.auth_session import RevokedToken
+
+# Re-read rows revoked this long before the last one seen, for transactions that committed late
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class BloomFilter:
+    """Set membership with false positives at about error_rate while holding up to capacity keys"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        # Double hashing: positions h1 + i * h2 from one 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
+class TokenDenylist:
+    """Revoked access token jtis and session ids, checked on every authenticated request
+
+    The revoked_tokens table is authoritative. Each worker mirrors it in a
+    bloom filter, so tokens that were never revoked - nearly all of them -
+    are accepted without a query; only filter hits are looked up. Workers
+    poll for rows revoked elsewhere at most every sync_seconds (piggybacked
+    on requests), so a revocation takes up to that long to reach other
+    workers. Every rebuild_seconds the filter is rebuilt from the unexpired
+    rows, which drops expired entries and resizes it, and expired rows are
+    deleted.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, sync_seconds: float, rebuild_seconds: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_seconds = sync_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._filter = BloomFilter(self.capacity, self.error_rate)
+            self._synced_at = 0.0
+            self._built_at = 0.0
+            self._last_seen: Optional[datetime] = None
+            self._syncing = False
+            self.checks = 0
+            self.filter_hits = 0
+            self.false_positives = 0
+            self.rejected = 0
+            self.syncs = 0
+            self.rebuilds = 0
+
+    def add(self, *ids: str):
+        """Mark ids revoked in this worker right away; the caller stores them in revoked_tokens"""
+        with self._lock:
+            for token_id in ids:
+                self._filter.add(token_id)
+
+    def sync(self, db: Session):
+        """Add rows revoked since the last sync, or rebuild the filter when it is due"""
+        now = time.monotonic()
+        rebuild = now - self._built_at >= self.rebuild_seconds
+        query = db.query(RevokedToken.jti, RevokedToken.revoked_at)
+        if rebuild:
+            utcnow = datetime.utcnow()
+            db.query(RevokedToken).filter(RevokedToken.expires_at <= utcnow).delete(synchronize_session=False)
+            db.commit()
+            rows = query.filter(RevokedToken.expires_at > utcnow).all()
+            new_filter = BloomFilter(max(self.capacity, 2 * len(rows)), self.error_rate)
+        else:
+            if self._last_seen is not None:
+                query = query.filter(RevokedToken.revoked_at >= self._last_seen - SYNC_OVERLAP)
+            rows = query.all()
+        last_seen = max((revoked_at for _, revoked_at in rows), default=self._last_seen)
+
+        with self._lock:
+            if rebuild:
+                self._filter = new_filter
+                self._built_at = now
+                self.rebuilds += 1
+            for jti, _ in rows:
+                if rebuild or jti not in self._filter:
+                    self._filter.add(jti)
+            self._last_seen = last_seen
+            self._synced_at = now
+            self.syncs += 1
+
+    def _sync_due(self) -> bool:
+        with self._lock:
+            if self._syncing or time.monotonic() - self._synced_at < self.sync_seconds:
+                return False
+            self._syncing = True
+            return True
+
+    def _lookup(self, db: Session, ids: Iterable[str]) -> bool:
+        return db.query(RevokedToken.jti).filter(
+            RevokedToken.jti.in_(list(ids)), RevokedToken.expires_at > datetime.utcnow()
+        ).first() is not None
+
+    async def is_revoked(self, db: Session, *ids: Optional[str]) -> bool:
+        """Whether any of the token's ids (jti, sid) is revoked"""
+        ids = [token_id for token_id in ids if token_id]
+        if not ids:
+            return False
+        if self._sync_due():
+            try:
+                await run_in_threadpool(self.sync, db)
+            except Exception as e:
+                print(f"Could not sync token denylist: {e}")
+            finally:
+                self._syncing = False
+
+        with self._lock:
+            self.checks += 1
+            hit = any(token_id in self._filter for token_id in ids)
+            if hit:
+                self.filter_hits += 1
+        if not hit:
+            return False
+        revoked = await run_in_threadpool(self._lookup, db, ids)
+        with self._lock:
+            if revoked:
+                self.rejected += 1
+            else:
+                self.false_positives += 1
+        return revoked
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": self._filter.count,
+                "capacity": self._filter.capacity,
+                "checks": self.checks,
+                "filter_hits": self.filter_hits,
+                "false_positives": self.false_positives,
+                "rejected": self.rejected,
+                "syncs": self.syncs,
+                "rebuilds": self.rebuilds,
+            }
+
+
+token_denylist = TokenDenylist(
+    capacity=settings.DENYLIST_CAPACITY,
+    error_rate=settings.DENYLIST_ERROR_RATE,
+    sync_seconds=settings.DENYLIST_SYNC_SECONDS,
+    rebuild_seconds=settings.DENYLIST_REBUILD_SECONDS
+)
+metrics.register("token_denylist", token_denylist.stats)
+memory.register("token_denylist", lambda: {"filter_bytes": token_denylist._filter.nbytes})
@@ -1,13 +1,17 @@
+import hmac
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 
+from app.core.cache import get_cache, user_tag
 from app.core.config import settings
-from app.core.database import get_db
+from app.core.database import get_db, get_session_factory, run_in_session
+from app.core.revocation import token_denylist
 from app.models.user import User
 
 # Password hashing
@@ -16,6 +20,9 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
+# Authenticated users' columns, so most requests skip the user lookup
+principal_cache = get_cache("principals", settings.CACHE_PRINCIPAL_TTL_SECONDS)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password"""
@@ -27,9 +34,15 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def new_token_id() -> str:
+    """Random jti or session id"""
+    return uuid.uuid4().hex
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT token"""
     to_encode = data.copy()
+    to_encode.setdefault("jti", new_token_id())
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
@@ -40,7 +53,36 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+def create_refresh_token(user_id: int, sid: str, jti: str, expires_at: datetime) -> str:
+    """Create a refresh token for session sid; only accepted by /api/auth/refresh"""
+    return jwt.encode(
+        {"sub": str(user_id), "sid": sid, "jti": jti, "type": "refresh", "exp": expires_at},
+        settings.SECRET_KEY,
+        algorithm=settings.ALGORITHM
+    )
+
+
+def token_session_id(token: str) -> Optional[str]:
+    """sid claim of an access token already validated by get_current_user"""
+    return jwt.get_unverified_claims(token).get("sid")
+
+
+def decode_refresh_token(token: str) -> Optional[dict]:
+    """Claims of a valid refresh token, or None"""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != "refresh" or not payload.get("sid") or not payload.get("jti"):
+        return None
+    return payload
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+    session_factory=Depends(get_session_factory)
+) -> User:
     """Get current logged-in user"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -51,16 +93,40 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         user_id_str: str = payload.get("sub")
-        if user_id_str is None:
+        if user_id_str is None or payload.get("type") == "refresh":
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == int(user_id_str)).first()
-    if user is None:
+    # Logged out sessions and revoked tokens; tokens issued before sessions existed have neither id
+    if await token_denylist.is_revoked(db, payload.get("jti"), payload.get("sid")):
         raise credentials_exception
     
-    return user
+    user_id = int(user_id_str)
+    columns = await principal_cache.get(
+        user_id, lambda: run_in_session(session_factory, _load_principal, user_id), tags=[user_tag(user_id)]
+    )
+    if columns is None:
+        raise credentials_exception
+    
+    # Detached copy; endpoints only read the user's attributes
+    return User(**columns)
 
 
+def _load_principal(db: Session, user_id: int) -> Optional[dict]:
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is None:
+        return None
+    return {
+        column.key: getattr(user, column.key)
+        for column in User.__table__.columns
+        if column.key != "hashed_password"
+    }
+
 
+def require_admin_key(x_admin_key: Optional[str] = Header(None)):
+    """Admin endpoints: 404 unless ADMIN_API_KEY is set, 403 unless X-Admin-Key matches it"""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_admin_key is None or not hmac.compare_digest(x_admin_key, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin key")
@@ -1,9 +1,21 @@
-from fastapi import FastAPI
+import math
+
+from fastapi import FastAPI, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
 from app.core.database import Base, engine
-from app.api.endpoints import auth, users, health
+from app.core.metrics import metrics
+from app.core.profiling import ProfilingMiddleware
+from app.core.rate_limit import AdmissionControlMiddleware, admission_controller
+from app.api.endpoints import admin, auth, users, health
+from app.services.ingest_buffer import ingest_buffer
+from app.services.peer_index import peer_index
+from app.services.precompute import precompute_scheduler
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
@@ -17,6 +29,17 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Response compression; innermost so rejections and CORS headers are untouched
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        offload_size=settings.COMPRESSION_OFFLOAD_SIZE
+    )
+
+# Rate limiting and load shedding; added before CORS so rejections still carry CORS headers
+app.add_middleware(AdmissionControlMiddleware, controller=admission_controller)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -26,10 +49,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request profiling; outermost so the profile covers the whole middleware stack
+if settings.PROFILING_ENABLED:
+    if not settings.PROFILING_SECRET or settings.PROFILING_SECRET == settings.SECRET_KEY:
+        raise RuntimeError("PROFILING_ENABLED requires a PROFILING_SECRET of its own, different from SECRET_KEY")
+    app.add_middleware(
+        ProfilingMiddleware,
+        secret=settings.PROFILING_SECRET,
+        directory=settings.PROFILING_DIR,
+        interval_seconds=settings.PROFILING_SAMPLE_INTERVAL_MS / 1000
+    )
+
 # Register routes
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(users.router, prefix="/api", tags=["Users"])
 app.include_router(health.router, prefix="/api", tags=["Health"])
+app.include_router(admin.router, prefix="/api", tags=["Admin"])
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    """FastAPI's 422 response, with rejected NaN and infinity inputs echoed as strings JSON can encode"""
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content={"detail": jsonable_encoder(
+            exc.errors(), custom_encoder={float: lambda value: value if math.isfinite(value) else str(value)}
+        )}
+    )
+
+
+@app.on_event("startup")
+def start_ingest_buffer():
+    """Replay unflushed health data and start the write-behind flusher"""
+    if settings.INGEST_ENABLED:
+        ingest_buffer.start()
+
+
+@app.on_event("shutdown")
+def stop_ingest_buffer():
+    """Flush buffered health data before exiting"""
+    ingest_buffer.stop()
+
+
+@app.on_event("startup")
+def start_peer_index():
+    """Load the peer index, or start building it so the first peer request does not"""
+    try:
+        peer_index.ensure_ready()
+    except Exception as e:
+        print(f"Could not load peer index: {e}")
+
+
+@app.on_event("startup")
+async def start_precompute():
+    """Schedule the daily precomputation; the checkpoint lease keeps one runner across workers"""
+    if settings.PRECOMPUTE_ENABLED:
+        precompute_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_precompute():
+    await precompute_scheduler.stop()
 
 
 @app.get("/")
@@ -47,3 +127,9 @@ async def root():
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Cache and service metrics"""
+    return metrics.snapshot()
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class AuthSession(Base):
+    """A login; its refresh token is rotated on every use"""
+    __tablename__ = "auth_sessions"
+
+    id = Column(String(32), primary_key=True)  # sid claim of the session's tokens
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    refresh_jti = Column(String(32), nullable=False)  # Only the latest refresh token is valid
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime)
+
+
+class RevokedToken(Base):
+    """Denylisted access token jti or session id, kept until the tokens it covers have expired"""
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String(32), primary_key=True)
+    revoked_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,80 @@
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, ForeignKey, Index, Sequence
+from sqlalchemy.orm import declared_attr
+from datetime import datetime
+from typing import Union
+
+from app.core.database import Base
+
+# Shared id sequence keeps record ids unique across the per-type tables
+health_record_id_seq = Sequence("health_record_id_seq")
+
+
+class HealthRecordMixin:
+    """Columns shared by every typed health record table"""
+
+    # Type-specific payload columns, overridden by each table
+    record_fields = ()
+
+    @declared_attr
+    def id(cls):
+        return Column(Integer, health_record_id_seq, primary_key=True)
+
+    @declared_attr
+    def user_id(cls):
+        return Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    @declared_attr
+    def __table_args__(cls):
+        return (Index(f"ix_{cls.__tablename__}_user_date", "user_id", "date"),)
+
+    date = Column(Date, nullable=False)
+    notes = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class ExerciseRecord(HealthRecordMixin, Base):
+    __tablename__ = "health_exercise"
+    data_type = "exercise"
+    record_fields = ("exercise_type", "duration", "calories_burned", "distance", "intensity")
+
+    exercise_type = Column(String(50))
+    duration = Column(Float)  # minutes
+    calories_burned = Column(Float)
+    distance = Column(Float)  # km
+    intensity = Column(String(20))
+
+
+class DietRecord(HealthRecordMixin, Base):
+    __tablename__ = "health_diet"
+    data_type = "diet"
+    record_fields = ("meal_type", "food_name", "calories", "protein", "carbs", "fats", "fiber")
+
+    meal_type = Column(String(20))
+    food_name = Column(String(100))
+    calories = Column(Float)
+    protein = Column(Float)
+    carbs = Column(Float)
+    fats = Column(Float)
+    fiber = Column(Float)
+
+
+class SleepRecord(HealthRecordMixin, Base):
+    __tablename__ = "health_sleep"
+    data_type = "sleep"
+    record_fields = ("sleep_duration", "sleep_quality", "bed_time", "wake_time")
+
+    sleep_duration = Column(Float)  # hours
+    sleep_quality = Column(String(20))
+    bed_time = Column(DateTime)
+    wake_time = Column(DateTime)
+
+
+# data_type value -> storage table
+HEALTH_RECORD_MODELS = {
+    ExerciseRecord.data_type: ExerciseRecord,
+    DietRecord.data_type: DietRecord,
+    SleepRecord.data_type: SleepRecord,
+}
+
+HealthRecord = Union[ExerciseRecord, DietRecord, SleepRecord]
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Text
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class IngestCheckpoint(Base):
+    """Highest ingestion log sequence number flushed to the health record tables"""
+    __tablename__ = "ingest_checkpoints"
+
+    node = Column(String(100), primary_key=True)  # INGEST_NODE_ID of the writing server
+    flushed_seq = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class IngestDeadLetter(Base):
+    """Ingested record the database rejected, kept for inspection instead of blocking the buffer"""
+    __tablename__ = "ingest_dead_letters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    node = Column(String(100), nullable=False)
+    seq = Column(BigInteger, nullable=False)
+    user_id = Column(Integer, nullable=False, index=True)
+    record = Column(Text, nullable=False)  # the record as JSON, as logged
+    error = Column(Text, nullable=False)
+    received_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, LargeBinary, DateTime, ForeignKey, JSON
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class UserMetricStats(Base):
+    """Running daily statistics of a user's health metrics, for streaming anomaly detection"""
+    __tablename__ = "user_metric_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    metrics = Column(String(200), nullable=False)  # comma-separated metric names, one state row each
+    state = Column(LargeBinary, nullable=False)  # float64 (metrics, STATE_FIELDS) array, see anomaly_detector
+    anomalies = Column(JSON, nullable=False, default=dict)  # metric -> latest anomaly
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
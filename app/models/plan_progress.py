@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, Float, Date, DateTime, LargeBinary, ForeignKey
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class PlanProgress(Base):
+    """Running adherence counters of a health plan, kept up to date as health data is written"""
+    __tablename__ = "plan_progress"
+
+    plan_id = Column(Integer, ForeignKey("health_plans.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)  # last day of the plan, inclusive
+
+    # float64 per plan day: calories eaten (NaN when no diet record) and exercise minutes
+    calories = Column(LargeBinary, nullable=False)
+    minutes = Column(LargeBinary, nullable=False)
+
+    # Counters over the days before open_day, the latest day with data (-1 before any)
+    open_day = Column(Integer, nullable=False, default=-1)
+    days_on_target = Column(Integer, nullable=False, default=0)
+    exercise_days = Column(Integer, nullable=False, default=0)
+    calorie_days = Column(Integer, nullable=False, default=0)
+    calorie_balance = Column(Float, nullable=False, default=0.0)  # calories eaten minus target; < 0 is a deficit
+    current_streak = Column(Integer, nullable=False, default=0)
+    best_streak = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
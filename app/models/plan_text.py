@@ -0,0 +1,27 @@
+from sqlalchemy import Column, String, Integer, Text, DateTime, ForeignKey
+from datetime import datetime
+
+from app.core.database import Base
+
+# HealthPlan text columns stored as blobs; the columns themselves stay NULL
+PLAN_TEXT_FIELDS = ("description", "exercise_plan", "diet_suggestions")
+
+
+class PlanTextBlob(Base):
+    """Plan text stored once per distinct content"""
+    __tablename__ = "plan_text_blobs"
+
+    hash = Column(String(64), primary_key=True)  # sha256 hex of the UTF-8 text
+    text = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False)  # UTF-8 bytes
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class HealthPlanText(Base):
+    """Blob references of one health plan's text fields (NULL for empty fields)"""
+    __tablename__ = "health_plan_texts"
+
+    plan_id = Column(Integer, ForeignKey("health_plans.id", ondelete="CASCADE"), primary_key=True)
+    description_hash = Column(String(64), ForeignKey("plan_text_blobs.hash"))
+    exercise_plan_hash = Column(String(64), ForeignKey("plan_text_blobs.hash"))
+    diet_suggestions_hash = Column(String(64), ForeignKey("plan_text_blobs.hash"))
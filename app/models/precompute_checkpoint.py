@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, Integer, Boolean, Date, DateTime
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class PrecomputeCheckpoint(Base):
+    """Progress and lease of the daily precomputation run"""
+    __tablename__ = "precompute_checkpoints"
+
+    job = Column(String(50), primary_key=True)
+    run_date = Column(Date, nullable=False)
+    last_user_id = Column(Integer, nullable=False, default=0)  # Users are processed in id order
+    users_done = Column(Integer, nullable=False, default=0)
+    completed = Column(Boolean, nullable=False, default=False)
+    lease_owner = Column(String(100))
+    lease_expires_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, JSON
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class UserSegment(Base):
+    """Latest feature vector and segment assignment of a user"""
+    __tablename__ = "user_segments"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    segment_id = Column(Integer, nullable=True, index=True)
+    features = Column(JSON, nullable=False)  # unscaled _extract_user_features vector
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
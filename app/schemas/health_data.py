@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, FiniteFloat
+from typing import Annotated, List, Optional
 from datetime import datetime, date
 
 
@@ -7,25 +7,26 @@ class HealthDataBase(BaseModel):
     data_type: str  # exercise, diet, sleep
     date: date
     
+    # String lengths match the health record columns; NaN and infinity are rejected
     # Exercise data
-    exercise_type: Optional[str] = None
-    duration: Optional[float] = None
-    calories_burned: Optional[float] = None
-    distance: Optional[float] = None
-    intensity: Optional[str] = None
+    exercise_type: Optional[str] = Field(None, max_length=50)
+    duration: Optional[FiniteFloat] = None
+    calories_burned: Optional[FiniteFloat] = None
+    distance: Optional[FiniteFloat] = None
+    intensity: Optional[str] = Field(None, max_length=20)
     
     # Diet data
-    meal_type: Optional[str] = None
-    food_name: Optional[str] = None
-    calories: Optional[float] = None
-    protein: Optional[float] = None
-    carbs: Optional[float] = None
-    fats: Optional[float] = None
-    fiber: Optional[float] = None
+    meal_type: Optional[str] = Field(None, max_length=20)
+    food_name: Optional[str] = Field(None, max_length=100)
+    calories: Optional[FiniteFloat] = None
+    protein: Optional[FiniteFloat] = None
+    carbs: Optional[FiniteFloat] = None
+    fats: Optional[FiniteFloat] = None
+    fiber: Optional[FiniteFloat] = None
     
     # Sleep data
-    sleep_duration: Optional[float] = None
-    sleep_quality: Optional[str] = None
+    sleep_duration: Optional[FiniteFloat] = None
+    sleep_quality: Optional[str] = Field(None, max_length=20)
     bed_time: Optional[datetime] = None
     wake_time: Optional[datetime] = None
     
@@ -36,6 +37,17 @@ class HealthDataCreate(HealthDataBase):
     pass
 
 
+class HealthDataBatch(BaseModel):
+    records: List[HealthDataCreate] = Field(..., min_length=1, max_length=1000)
+
+
+class HealthDataIngestResponse(BaseModel):
+    accepted: int
+    # Ingestion log sequence numbers assigned to the batch
+    first_seq: int
+    last_seq: int
+
+
 class HealthDataResponse(HealthDataBase):
     id: int
     user_id: int
@@ -46,6 +58,21 @@ class HealthDataResponse(HealthDataBase):
         from_attributes = True
 
 
+class HealthTrendResponse(BaseModel):
+    metric: str
+    bucket: str  # day, week, month
+    start_date: date
+    end_date: date
+    
+    # Parallel arrays, one entry per bucket
+    buckets: List[date]
+    count: List[int]
+    sum: List[float]
+    mean: List[Optional[float]]
+    rolling_7d_mean: List[Optional[float]]
+    rolling_28d_mean: List[Optional[float]]
+
+
 class HealthPlanBase(BaseModel):
     plan_type: str  # exercise, diet, general
     title: Optional[str] = None
@@ -62,7 +89,7 @@ class HealthPlanBase(BaseModel):
 
 
 class HealthPlanCreate(HealthPlanBase):
-    pass
+    ai_generated_content: Optional[str] = None
 
 
 class HealthPlanResponse(HealthPlanBase):
@@ -82,7 +109,58 @@ class HealthPlanUpdate(BaseModel):
     diet_suggestions: Optional[str] = None
 
 
+class PlanSimulationRequest(BaseModel):
+    """Parameter grids; every combination is one scenario. Empty grids take the plan's value"""
+    plan_id: Optional[int] = None
+    exercise_minutes_per_day: List[Annotated[float, Field(ge=0, le=600)]] = []
+    weekly_exercise_days: List[Annotated[int, Field(ge=0, le=7)]] = []
+    calories_target: List[Annotated[float, Field(ge=0, le=10000)]] = []
+    duration_days: Optional[int] = Field(None, ge=1)
+    trajectories: bool = True
 
 
-
-
+class PlanSimulationResponse(BaseModel):
+    start_weight: float
+    maintenance_calories: float
+    duration_days: int
+    scenarios: int
+    
+    # Parallel arrays, one entry per scenario
+    exercise_minutes_per_day: List[float]
+    weekly_exercise_days: List[int]
+    calories_target: List[float]
+    final_weight: List[float]
+    weight_change: List[float]
+    average_daily_balance: List[float]
+    
+    # scenarios x duration_days, end-of-day values; omitted unless trajectories was set
+    weight: Optional[List[List[float]]] = None
+    calorie_balance: Optional[List[List[float]]] = None
+
+
+class PlanProgressResponse(BaseModel):
+    plan_id: int
+    start_date: date
+    end_date: date
+    days: int
+    # Days before today; a day is on target when calories eaten are within tolerance of the
+    # target (and, for plans with exercise every day, the exercise minutes are met)
+    days_completed: int
+    days_on_target: int
+    adherence_rate: float
+    current_streak: int
+    best_streak: int
+    
+    calories_target: Optional[float] = None
+    calorie_days: int
+    calorie_balance: float  # calories eaten minus target over completed days; < 0 is a deficit
+    average_daily_balance: Optional[float] = None
+    
+    exercise_minutes_per_day: Optional[float] = None
+    weekly_exercise_days: Optional[int] = None
+    exercise_days: int
+    exercise_days_target: float
+    
+    # Today so far, while the plan runs
+    today_calories: Optional[float] = None
+    today_exercise_minutes: Optional[float] = None
@@ -39,9 +39,28 @@ class UserResponse(UserBase):
         from_attributes = True
 
 
+class UserSegmentResponse(BaseModel):
+    user_id: int
+    segment_id: Optional[int] = None  # None until enough users have been seen
+    updated_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str = Field(..., min_length=6)
 
 
 class TokenData(BaseModel):
@@ -0,0 +1,281 @@
+"""
+Pre-fork server: load the app and its models once, then fork workers
+
+The parent imports app.main (which loads the AIHealthPlanService models,
+rule sets and segmentation centroids), freezes the loaded objects out of
+the garbage collector and forks SERVER_WORKERS uvicorn workers that share
+one listening socket. Model weights are then shared copy-on-write instead
+of being loaded once per worker.
+
+    python -m app.server --workers 4 --port 8000
+
+Signals to the parent:
+    SIGTERM / SIGINT  graceful shutdown; workers get SERVER_GRACEFUL_TIMEOUT_SECONDS
+    SIGHUP            rolling restart, one worker at a time
+
+Workers re-fork from the parent's preloaded state, so a rolling restart
+recycles worker memory but does not pick up code changes; restart the
+parent (or run with --no-preload) for that.
+
+Running more than one worker requires a shared cache backend
+(CACHE_BACKEND=disk or redis, with CACHE_SECRET), so that invalidations
+reach every worker.
+Still per worker: the ingestion log (a user reads their own buffered
+writes immediately only on the worker that accepted them, other workers
+after the next flush), the online segmentation centroids (only worker 0
+persists them) and the peer index delta.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Callable, Dict, Optional
+
+from app.core.config import settings
+
+# A worker dying sooner than this after its start is treated as a crash loop
+MIN_WORKER_LIFETIME_SECONDS = 5.0
+
+
+def preload():
+    """Import the app and load shared read-only state before forking"""
+    from app.core.database import engine
+    from app.main import app
+    from app.services.peer_index import peer_index
+
+    try:
+        # In the foreground: threads do not survive the fork
+        peer_index.ensure_ready(background=False)
+    except Exception as e:
+        print(f"Could not preload peer index: {e}")
+
+    # Connections must not be shared across processes
+    engine.dispose()
+    # Keep the collector from writing to (and so un-sharing) every preloaded object
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def drain_orphaned_ingest_logs(workers: int):
+    """Flush ingestion logs that no worker slot will pick up
+
+    That is the single-process log in INGEST_LOG_DIR itself and the logs of
+    slots beyond the current worker count.
+    """
+    if not settings.INGEST_ENABLED or not os.path.isdir(settings.INGEST_LOG_DIR):
+        return
+    from app.core.database import engine
+    from app.services.ingest_buffer import SEGMENT_PREFIX, IngestBuffer
+
+    orphans = [(settings.INGEST_LOG_DIR, settings.INGEST_NODE_ID)]
+    for name in sorted(os.listdir(settings.INGEST_LOG_DIR)):
+        slot = name[len("worker-"):]
+        if name.startswith("worker-") and slot.isdigit() and int(slot) >= workers:
+            orphans.append((os.path.join(settings.INGEST_LOG_DIR, name), f"{settings.INGEST_NODE_ID}-{name}"))
+
+    for log_dir, node_id in orphans:
+        if not any(name.startswith(SEGMENT_PREFIX) for name in os.listdir(log_dir)):
+            continue
+        buffer = IngestBuffer(
+            log_dir=log_dir,
+            node_id=node_id,
+            segment_bytes=settings.INGEST_SEGMENT_BYTES,
+            flush_interval=settings.INGEST_FLUSH_INTERVAL_SECONDS,
+            flush_batch=settings.INGEST_FLUSH_BATCH,
+            max_pending=settings.INGEST_MAX_PENDING
+        )
+        try:
+            buffer.start()
+            buffer.stop(flush=True)
+        except Exception as e:
+            print(f"Could not drain ingestion log {log_dir}: {e}")
+    engine.dispose()
+
+
+def serve_worker(slot: int, sock: socket.socket, app=None):
+    """Worker body: run uvicorn on the inherited socket"""
+    import uvicorn
+
+    from app.core.database import engine
+    from app.services.ingest_buffer import ingest_buffer
+    from app.services.segmentation_service import segmentation_service
+
+    # Drop pooled connections inherited from the parent without closing them under it
+    engine.dispose(close=False)
+    # Each worker slot owns an ingestion log; a replacement worker replays its predecessor's
+    ingest_buffer.log_dir = os.path.join(settings.INGEST_LOG_DIR, f"worker-{slot}")
+    ingest_buffer.node_id = f"{settings.INGEST_NODE_ID}-worker-{slot}"
+    if slot:
+        # Workers' online centroids diverge; one writer keeps SEGMENTATION_MODEL_PATH consistent
+        segmentation_service.save_every = 0
+
+    if app is None:
+        from app.main import app
+    elif settings.TEXT_GENERATOR_BACKEND == "onnx":
+        # ONNX Runtime sessions own thread pools that do not survive fork; open one per worker
+        from app.services.ai_service import get_ai_service
+        get_ai_service().load_model()
+    config = uvicorn.Config(app, log_level=settings.SERVER_LOG_LEVEL, access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Forks, monitors and restarts worker processes"""
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        workers: int,
+        target: Callable[[int, socket.socket], None],
+        graceful_timeout: float
+    ):
+        self.sock = sock
+        self.workers = workers
+        self.target = target
+        self.graceful_timeout = graceful_timeout
+        # pid -> (slot, started_at)
+        self.children: Dict[int, tuple] = {}
+        self.stopping = False
+        self.restart_requested = False
+
+    def spawn(self, slot: int) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                    signal.signal(sig, signal.SIG_DFL)
+                self.target(slot, self.sock)
+            except BaseException as e:
+                print(f"Worker {slot} failed: {e}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.children[pid] = (slot, time.monotonic())
+        return pid
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_hup(self, signum, frame):
+        self.restart_requested = True
+
+    def reap(self) -> Optional[tuple]:
+        """Collect one exited worker, returning (pid, slot, lifetime)"""
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return None
+        if pid == 0 or pid not in self.children:
+            return None
+        slot, started_at = self.children.pop(pid)
+        return pid, slot, time.monotonic() - started_at
+
+    def stop_worker(self, pid: int) -> bool:
+        """SIGTERM a worker and wait for it, killing it after the graceful timeout"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                self.children.pop(pid, None)
+                return True
+            time.sleep(0.05)
+        print(f"Worker {pid} did not exit in {self.graceful_timeout}s, killing it")
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        self.children.pop(pid, None)
+        return False
+
+    def rolling_restart(self):
+        # Stop before respawning: the new worker takes over the slot's ingestion log
+        for pid, (slot, _) in list(self.children.items()):
+            if self.stopping:
+                return
+            self.stop_worker(pid)
+            self.spawn(slot)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_hup)
+        for slot in range(self.workers):
+            self.spawn(slot)
+        print(f"Started {self.workers} workers (parent pid {os.getpid()})")
+
+        while not self.stopping:
+            if self.restart_requested:
+                self.restart_requested = False
+                print("Rolling restart")
+                self.rolling_restart()
+            exited = self.reap()
+            if exited is None:
+                time.sleep(0.1)
+                continue
+            pid, slot, lifetime = exited
+            if self.stopping:
+                break
+            print(f"Worker {pid} (slot {slot}) exited after {lifetime:.1f}s, restarting")
+            if lifetime < MIN_WORKER_LIFETIME_SECONDS:
+                time.sleep(1)
+            self.spawn(slot)
+
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.children):
+            self.stop_worker(pid)
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS)
+    parser.add_argument("--graceful-timeout", type=float, default=settings.SERVER_GRACEFUL_TIMEOUT_SECONDS)
+    parser.add_argument(
+        "--no-preload", dest="preload", action="store_false", default=settings.SERVER_PRELOAD,
+        help="Import the app in each worker instead of once in the parent"
+    )
+    args = parser.parse_args()
+    if args.workers > 1 and settings.CACHE_BACKEND == "memory":
+        parser.error(
+            "more than one worker needs CACHE_BACKEND=disk or redis; "
+            "with per-process caches, workers would serve data other workers have invalidated"
+        )
+
+    sock = bind_socket(args.host, args.port)
+    app = preload() if args.preload else None
+    drain_orphaned_ingest_logs(args.workers)
+    Supervisor(
+        sock,
+        workers=args.workers,
+        target=lambda slot, sock: serve_worker(slot, sock, app),
+        graceful_timeout=args.graceful_timeout
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
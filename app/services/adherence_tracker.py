@@ -0,0 +1,257 @@
+import threading
+from datetime import date, timedelta
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.health_data import HealthPlan
+from app.models.plan_progress import PlanProgress
+from app.services.health_data_cache import health_data_cache, DATA_TYPE_CODES
+
+# data_type -> record field added to the day's totals
+TRACKED_FIELDS = {"diet": "calories", "exercise": "duration"}
+COUNTERS = ("days_on_target", "exercise_days", "calorie_days", "calorie_balance", "current_streak", "best_streak")
+
+
+def plan_window(plan: HealthPlan) -> Tuple[date, int]:
+    """First day and length in days of a plan"""
+    start = plan.start_date or plan.created_at.date()
+    if plan.duration_days:
+        return start, plan.duration_days
+    if plan.end_date:
+        return start, max((plan.end_date - start).days, 1)
+    return start, 30
+
+
+def _runs(flags: np.ndarray) -> Tuple[int, int]:
+    """(trailing, longest) runs of True"""
+    if not flags.any():
+        return 0, 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], flags.astype(np.int8), [0]))))
+    starts, ends = edges[::2], edges[1::2]
+    trailing = int(ends[-1] - starts[-1]) if ends[-1] == len(flags) else 0
+    return trailing, int((ends - starts).max())
+
+
+class AdherenceTracker:
+    """Plan progress counters, maintained as health data is written
+
+    Each plan has a plan_progress row with its daily calories and exercise
+    minutes as packed arrays and counters over its completed days. A day
+    is complete once data for a later day arrives: writes for the latest
+    day only add to its totals, a write for a later day folds the latest
+    day into the counters in O(1), and a write for an earlier day recounts
+    from the arrays (never the records). Reads fold in the latest day when
+    the calendar has moved past it, so they are O(1) too. Plans are updated
+    whatever their status, so a paused plan resumes with complete counters.
+    """
+
+    def __init__(self, calorie_tolerance: float):
+        self.calorie_tolerance = calorie_tolerance
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.recounts = 0
+        self.bootstraps = 0
+
+    def _status(self, plan: HealthPlan, calories: np.ndarray, minutes: np.ndarray):
+        """Per day: diet logged, exercise target met, on target"""
+        diet = ~np.isnan(calories)
+        if plan.exercise_minutes_per_day:
+            exercise = minutes >= plan.exercise_minutes_per_day
+        else:
+            exercise = minutes > 0
+        on_target = diet | (minutes > 0)
+        if plan.calories_target:
+            on_target &= np.abs(calories - plan.calories_target) <= self.calorie_tolerance * plan.calories_target
+        if plan.exercise_minutes_per_day and (plan.weekly_exercise_days or 0) >= 7:
+            # Exercise is a daily requirement only for plans asking for it every day
+            on_target &= exercise
+        return diet, exercise, on_target
+
+    def _fold(self, counters: Dict, plan: HealthPlan, calories: np.ndarray, minutes: np.ndarray, day: int):
+        """Add one completed day to the counters"""
+        diet, exercise, on_target = (
+            flags[0] for flags in self._status(plan, calories[day:day + 1], minutes[day:day + 1])
+        )
+        counters["days_on_target"] += int(on_target)
+        counters["exercise_days"] += int(exercise)
+        if diet:
+            counters["calorie_days"] += 1
+            if plan.calories_target:
+                counters["calorie_balance"] += float(calories[day] - plan.calories_target)
+        counters["current_streak"] = counters["current_streak"] + 1 if on_target else 0
+        counters["best_streak"] = max(counters["best_streak"], counters["current_streak"])
+
+    def _recount(self, plan: HealthPlan, calories: np.ndarray, minutes: np.ndarray, completed: int) -> Dict:
+        """Counters over the first completed days, from the daily arrays"""
+        calories, minutes = calories[:completed], minutes[:completed]
+        diet, exercise, on_target = self._status(plan, calories, minutes)
+        current_streak, best_streak = _runs(on_target)
+        return {
+            "days_on_target": int(on_target.sum()),
+            "exercise_days": int(exercise.sum()),
+            "calorie_days": int(diet.sum()),
+            "calorie_balance": float((calories[diet] - plan.calories_target).sum()) if plan.calories_target else 0.0,
+            "current_streak": current_streak,
+            "best_streak": best_streak,
+        }
+
+    def start(self, db: Session, plan: HealthPlan) -> PlanProgress:
+        """Create a flushed plan's progress row from the records already in its window; the caller commits"""
+        progress = self._build(db, plan)
+        db.add(progress)
+        with self._lock:
+            self.bootstraps += 1
+        return progress
+
+    def _build(self, db: Session, plan: HealthPlan) -> PlanProgress:
+        """A plan's progress computed from the records already in its window, not added to the session"""
+        start_date, days = plan_window(plan)
+        end_date = start_date + timedelta(days=days - 1)
+        series = health_data_cache.get_series(db, plan.user_id, start_date, end_date)
+        in_range = series.between(start_date, end_date)
+        day = series.column("date")[in_range] - start_date.toordinal()
+        data_type = series.column("data_type")[in_range]
+        eaten = series.column("calories")[in_range]
+        duration = series.column("duration")[in_range]
+
+        diet = (data_type == DATA_TYPE_CODES["diet"]) & ~np.isnan(eaten)
+        exercise = (data_type == DATA_TYPE_CODES["exercise"]) & ~np.isnan(duration)
+        calories = np.full(days, np.nan)
+        logged = np.bincount(day[diet], minlength=days) > 0
+        calories[logged] = np.bincount(day[diet], weights=eaten[diet], minlength=days)[logged]
+        minutes = np.bincount(day[exercise], weights=duration[exercise], minlength=days).astype(np.float64)
+        with_data = day[diet | exercise]
+        open_day = int(with_data.max()) if len(with_data) else -1
+
+        return PlanProgress(
+            plan_id=plan.id,
+            user_id=plan.user_id,
+            start_date=start_date,
+            end_date=end_date,
+            calories=calories.tobytes(),
+            minutes=minutes.tobytes(),
+            open_day=open_day,
+            **self._recount(plan, calories, minutes, max(open_day, 0))
+        )
+
+    def observe(self, db: Session, user_id: int, records: Iterable):
+        """Add new records to the progress of the user's plans covering their dates; the caller commits"""
+        values = sorted(
+            (record.date, record.data_type, value)
+            for record in records
+            if record.data_type in TRACKED_FIELDS
+            and (value := getattr(record, TRACKED_FIELDS[record.data_type], None)) is not None
+        )
+        if not values:
+            return
+        rows = (
+            db.query(PlanProgress, HealthPlan)
+            .join(HealthPlan, HealthPlan.id == PlanProgress.plan_id)
+            .filter(
+                PlanProgress.user_id == user_id,
+                PlanProgress.start_date <= values[-1][0],
+                PlanProgress.end_date >= values[0][0]
+            )
+            .with_for_update(of=PlanProgress)
+            .all()
+        )
+        for progress, plan in rows:
+            self._update(progress, plan, values)
+
+    def _update(self, progress: PlanProgress, plan: HealthPlan, values):
+        calories = np.frombuffer(progress.calories, dtype=np.float64).copy()
+        minutes = np.frombuffer(progress.minutes, dtype=np.float64).copy()
+        counters = {name: getattr(progress, name) for name in COUNTERS}
+        open_day = progress.open_day
+        late = False
+        for day_date, data_type, value in values:
+            day = (day_date - progress.start_date).days
+            if not 0 <= day < len(calories):
+                continue
+            if day > open_day:
+                if open_day >= 0:
+                    self._fold(counters, plan, calories, minutes, open_day)
+                if day > open_day + 1:
+                    # Days in between had no data
+                    counters["current_streak"] = 0
+                open_day = day
+            elif day < open_day:
+                late = True
+            if data_type == "diet":
+                calories[day] = value if np.isnan(calories[day]) else calories[day] + value
+            else:
+                minutes[day] += value
+        if late:
+            counters = self._recount(plan, calories, minutes, open_day)
+
+        progress.calories = calories.tobytes()
+        progress.minutes = minutes.tobytes()
+        progress.open_day = open_day
+        for name, value in counters.items():
+            setattr(progress, name, value)
+        with self._lock:
+            self.updates += 1
+            self.recounts += late
+
+    def progress(self, db: Session, user_id: int, plan_id: int) -> Dict:
+        """A plan's progress up to today"""
+        plan = db.query(HealthPlan).filter(
+            HealthPlan.id == plan_id,
+            HealthPlan.user_id == user_id
+        ).first()
+        if not plan:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Health plan not found"
+            )
+
+        progress = db.get(PlanProgress, plan_id)
+        if progress is None:
+            # Plans created before progress tracking, until the backfill_plan_progress migration runs
+            progress = self._build(db, plan)
+
+        calories = np.frombuffer(progress.calories, dtype=np.float64)
+        minutes = np.frombuffer(progress.minutes, dtype=np.float64)
+        days = len(calories)
+        today = (date.today() - progress.start_date).days
+        completed = min(max(today, 0), days)
+        counters = {name: getattr(progress, name) for name in COUNTERS}
+        if 0 <= progress.open_day < completed:
+            # The calendar has moved past the latest day with data
+            self._fold(counters, plan, calories, minutes, progress.open_day)
+        if completed - 1 > progress.open_day:
+            counters["current_streak"] = 0
+
+        in_plan = 0 <= today < days
+        return {
+            "plan_id": plan.id,
+            "start_date": progress.start_date,
+            "end_date": progress.end_date,
+            "days": days,
+            "days_completed": completed,
+            "adherence_rate": counters["days_on_target"] / completed if completed else 0.0,
+            **counters,
+            "calories_target": plan.calories_target,
+            "average_daily_balance": (
+                counters["calorie_balance"] / counters["calorie_days"]
+                if plan.calories_target and counters["calorie_days"] else None
+            ),
+            "exercise_minutes_per_day": plan.exercise_minutes_per_day,
+            "weekly_exercise_days": plan.weekly_exercise_days,
+            "exercise_days_target": (plan.weekly_exercise_days or 0) * completed / 7,
+            "today_calories": None if not in_plan or np.isnan(calories[today]) else float(calories[today]),
+            "today_exercise_minutes": float(minutes[today]) if in_plan else None,
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"updates": self.updates, "recounts": self.recounts, "bootstraps": self.bootstraps}
+
+
+adherence_tracker = AdherenceTracker(calorie_tolerance=settings.ADHERENCE_CALORIE_TOLERANCE)
+metrics.register("adherence", adherence_tracker.stats)
@@ -1,25 +1,35 @@
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from datetime import date, timedelta
 import numpy as np
 from sklearn.preprocessing import StandardScaler
-from sklearn.neighbors import KNeighborsRegressor
-from sklearn.cluster import KMeans
-
-try:
-    from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
-    HAS_TRANSFORMERS = True
-except ImportError:
-    HAS_TRANSFORMERS = False
 
 from app.models.user import User
-from app.models.health_data import HealthData
+from app.services.health_data_cache import health_data_cache, DATA_TYPE_CODES
+from app.services.peer_index import peer_index
+from app.services.rule_engine import rule_sets
+from app.services.text_generator import load_text_generator
+
+# Column names of the vector returned by _extract_user_features
+USER_FEATURE_NAMES = (
+    "height", "weight", "is_male", "age", "activity_level",
+    "exercise_frequency", "average_exercise_duration", "total_calories_burned",
+    "average_sleep_hours", "average_daily_calories"
+)
+
+# Daily energy expenditure as a multiple of BMR
+ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.2,
+    "lightly_active": 1.375,
+    "moderately_active": 1.55,
+    "very_active": 1.725,
+    "extra_active": 1.9
+}
 
 
 class AIHealthPlanService:
     def __init__(self):
-        self.model = None
-        self.kmeans = None
         self.scaler = StandardScaler()
         self.text_generator = None
         self.load_model()
@@ -27,25 +37,8 @@ class AIHealthPlanService:
     def load_model(self):
         """Load or initialize AI models"""
         try:
-            # Initialize KMeans clustering for user segmentation
-            self.kmeans = KMeans(n_clusters=5, random_state=42, n_init=10)
-            
-            # Initialize KNN regression model for exercise prediction
-            self.model = KNeighborsRegressor(n_neighbors=5, weights='distance')
-            
-            # Load text generation model (GPT-2 based)
-            if HAS_TRANSFORMERS:
-                try:
-                    # Use a lightweight model for text generation
-                    self.text_generator = pipeline(
-                        "text-generation",
-                        model="gpt2",
-                        device=-1,  # Use CPU
-                        max_length=200
-                    )
-                except Exception as e:
-                    print(f"Could not load text generation model: {e}")
-                    self.text_generator = None
+            # Text generation backend (TEXT_GENERATOR_BACKEND: pytorch, onnx or none)
+            self.text_generator = load_text_generator()
         except Exception as e:
             print(f"Error loading models: {e}")
     
@@ -82,35 +75,34 @@ class AIHealthPlanService:
         
         return np.array(features).reshape(1, -1)
     
-    def calculate_bmr(self, user: User) -> float:
-        """Calculate Basal Metabolic Rate (BMR)"""
+    def bmr_coefficients(self, user: User) -> Optional[Tuple[float, float]]:
+        """(multiplier, offset) with calculate_bmr == multiplier * (10 * weight + offset)"""
         if not user.weight or not user.height or not user.date_of_birth:
             return None
         
         age = (date.today() - user.date_of_birth).days // 365
         
-        # Mifflin-St Jeor Equation
+        # Mifflin-St Jeor Equation, less its weight term
         if user.gender == "male":
-            bmr = 10 * user.weight + 6.25 * user.height - 5 * age + 5
+            offset = 6.25 * user.height - 5 * age + 5
         elif user.gender == "female":
-            bmr = 10 * user.weight + 6.25 * user.height - 5 * age - 161
+            offset = 6.25 * user.height - 5 * age - 161
         else:
-            bmr = 10 * user.weight + 6.25 * user.height - 5 * age - 78
-        
-        # Activity multipliers
-        activity_multipliers = {
-            "sedentary": 1.2,
-            "lightly_active": 1.375,
-            "moderately_active": 1.55,
-            "very_active": 1.725,
-            "extra_active": 1.9
-        }
+            offset = 6.25 * user.height - 5 * age - 78
         
+        multiplier = 1.0
         if user.activity_level:
-            multiplier = activity_multipliers.get(user.activity_level, 1.2)
-            bmr *= multiplier
+            multiplier = ACTIVITY_MULTIPLIERS.get(user.activity_level, 1.2)
         
-        return bmr
+        return multiplier, offset
+    
+    def calculate_bmr(self, user: User) -> float:
+        """Calculate Basal Metabolic Rate (BMR)"""
+        coefficients = self.bmr_coefficients(user)
+        if coefficients is None:
+            return None
+        multiplier, offset = coefficients
+        return multiplier * (10 * user.weight + offset)
     
     def analyze_health_data(self, db: Session, user_id: int) -> Dict:
         """Analyze user's health data"""
@@ -118,11 +110,9 @@ class AIHealthPlanService:
         end_date = date.today()
         start_date = end_date - timedelta(days=30)
         
-        health_data_list = db.query(HealthData).filter(
-            HealthData.user_id == user_id,
-            HealthData.date >= start_date,
-            HealthData.date <= end_date
-        ).all()
+        series = health_data_cache.get_series(db, user_id, start_date, end_date)
+        in_range = series.between(start_date, end_date)
+        data_type = series.column("data_type")
         
         analysis = {
             "exercise_frequency": 0,
@@ -134,25 +124,88 @@ class AIHealthPlanService:
             "recommendations": []
         }
         
-        exercise_data = [d for d in health_data_list if d.data_type == "exercise"]
-        sleep_data = [d for d in health_data_list if d.data_type == "sleep"]
-        diet_data = [d for d in health_data_list if d.data_type == "diet"]
+        exercise = in_range & (data_type == DATA_TYPE_CODES["exercise"])
+        sleep = in_range & (data_type == DATA_TYPE_CODES["sleep"])
+        diet = in_range & (data_type == DATA_TYPE_CODES["diet"])
+        exercise_count = int(np.count_nonzero(exercise))
+        sleep_count = int(np.count_nonzero(sleep))
+        diet_count = int(np.count_nonzero(diet))
         
-        if exercise_data:
-            analysis["exercise_frequency"] = len(exercise_data)
-            analysis["average_exercise_duration"] = sum(d.duration or 0 for d in exercise_data) / len(exercise_data)
-            analysis["total_calories_burned"] = sum(d.calories_burned or 0 for d in exercise_data)
+        if exercise_count:
+            analysis["exercise_frequency"] = exercise_count
+            analysis["average_exercise_duration"] = float(np.nansum(series.column("duration")[exercise])) / exercise_count
+            analysis["total_calories_burned"] = float(np.nansum(series.column("calories_burned")[exercise]))
         
-        if sleep_data:
-            analysis["average_sleep_hours"] = sum(d.sleep_duration or 0 for d in sleep_data) / len(sleep_data)
+        if sleep_count:
+            analysis["average_sleep_hours"] = float(np.nansum(series.column("sleep_duration")[sleep])) / sleep_count
             # Simple sleep quality assessment
             analysis["average_sleep_quality"] = "good" if analysis["average_sleep_hours"] >= 7 else "needs_improvement"
         
-        if diet_data:
-            analysis["average_daily_calories"] = sum(d.calories or 0 for d in diet_data) / max(len(diet_data), 1)
+        if diet_count:
+            analysis["average_daily_calories"] = float(np.nansum(series.column("calories")[diet])) / diet_count
         
         return analysis
     
+    def get_peer_recommendations(self, db: Session, user: User, k: int = 20) -> Dict:
+        """Recommend based on the habits of the k most similar users"""
+        analysis = self.analyze_health_data(db, user.id)
+        features = self._extract_user_features(user, analysis)[0]
+        
+        # Until a first index is built, only users updated since startup are searched
+        index_ready = peer_index.ensure_ready()
+        peers = peer_index.query(features, k, exclude_user_id=user.id)
+        
+        habits = ("exercise_frequency", "average_exercise_duration", "average_sleep_hours", "average_daily_calories")
+        columns = [USER_FEATURE_NAMES.index(name) for name in habits]
+        result = {
+            "user_id": user.id,
+            "index_ready": index_ready,
+            "peer_count": len(peers),
+            "your_values": {name: float(features[i]) for name, i in zip(habits, columns)},
+            "peer_averages": {},
+            "recommendations": []
+        }
+        if not peers:
+            return result
+        
+        # Distance-weighted neighbour averages, as KNeighborsRegressor(weights="distance") would predict
+        distances = np.array([distance for _, distance, _ in peers])
+        weights = 1.0 / np.maximum(distances, 1e-6)
+        peer_features = np.vstack([vector for _, _, vector in peers])[:, columns]
+        averages = {
+            name: round(float(value), 2)
+            for name, value in zip(habits, weights @ peer_features / weights.sum())
+        }
+        result["peer_averages"] = averages
+        yours = result["your_values"]
+        
+        if averages["exercise_frequency"] >= yours["exercise_frequency"] + 2:
+            result["recommendations"].append({
+                "type": "exercise",
+                "priority": "medium",
+                "message": f"Users similar to you log about {averages['exercise_frequency']:.0f} workouts a month; try adding one more session per week"
+            })
+        if averages["average_exercise_duration"] > yours["average_exercise_duration"] * 1.2:
+            result["recommendations"].append({
+                "type": "exercise",
+                "priority": "low",
+                "message": f"Similar users train for about {averages['average_exercise_duration']:.0f} minutes per session"
+            })
+        if averages["average_sleep_hours"] >= yours["average_sleep_hours"] + 0.5:
+            result["recommendations"].append({
+                "type": "sleep",
+                "priority": "medium",
+                "message": f"Similar users sleep about {averages['average_sleep_hours']:.1f} hours a night"
+            })
+        if not result["recommendations"]:
+            result["recommendations"].append({
+                "type": "general",
+                "priority": "low",
+                "message": "Your habits are on par with or ahead of similar users, keep it up"
+            })
+        
+        return result
+    
     def generate_personalized_plan(self, db: Session, user: User) -> Dict:
         """Generate personalized health plan using AI"""
         # Get user information
@@ -195,6 +248,15 @@ class AIHealthPlanService:
         
         return plan
     
+    def plan_description_prompt(self, user: User, plan: Dict) -> str:
+        """Prompt for the text generator's free-text notes on a generated plan"""
+        goal = (user.health_goal or "general_health").replace("_", " ")
+        return (
+            f"Coach's notes on a 30-day {goal} plan with {plan['exercise_minutes_per_day']:.0f} minutes "
+            f"of exercise {plan['weekly_exercise_days']} days a week and a daily target of "
+            f"{plan['calories_target']:.0f} calories. Key advice:"
+        )
+    
     def _predict_exercise_minutes(self, features: np.ndarray, analysis: Dict, goal: str) -> float:
         """Use ML to predict optimal exercise minutes"""
         # Base prediction on exercise frequency and duration patterns
@@ -255,21 +317,9 @@ class AIHealthPlanService:
         # Start with basic description
         description = f"A personalized AI-powered health plan tailored for {user.full_name or user.username}."
         
-        # Add AI insights based on data analysis
-        if analysis.get("exercise_frequency", 0) < 3:
-            description += " Our AI analysis shows your exercise frequency can be increased to improve overall health and reach your goals faster."
-        
-        if analysis.get("average_sleep_hours", 0) < 7:
-            description += " The AI has detected insufficient sleep patterns - improving sleep quality will significantly boost your results."
-        
-        if analysis.get("average_daily_calories", 0) > 3000:
-            description += " Your current calorie intake appears high; the plan focuses on quality nutrition while creating a sustainable caloric balance."
-        
-        # Add goal-specific AI recommendations
-        if goal == "weight_loss":
-            description += " This AI-optimized plan focuses on sustainable weight loss through a combination of cardio and strength training."
-        elif goal == "muscle_gain":
-            description += " The plan is optimized for muscle hypertrophy with progressive resistance training and strategic nutrition timing."
+        # Add AI insights based on data analysis and goal
+        for insight in rule_sets["plan_insights"].evaluate({**analysis, "goal": goal}):
+            description += " " + insight["message"]
         
         return description
     
@@ -354,7 +404,7 @@ Customized to match your fitness trajectory."""
         return suggestions.get(goal, suggestions["general_health"])
 
 
-
-
-
-
+@lru_cache()
+def get_ai_service() -> AIHealthPlanService:
+    """Shared AIHealthPlanService instance, loaded on first use"""
+    return AIHealthPlanService()
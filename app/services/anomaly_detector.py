@@ -0,0 +1,318 @@
+import math
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.metric_stats import UserMetricStats
+from app.services.health_data_cache import health_data_cache
+
+# metric -> (data type, label, value format, directions flagged). Partial daily totals only
+# grow, so "low" is only meaningful for metrics logged once a day, like a night's sleep
+ANOMALY_METRICS = {
+    "sleep_duration": ("sleep", "Sleep", "{:.1f} h", ("low", "high")),
+    "calories": ("diet", "Calorie intake", "{:.0f} kcal", ("high",)),
+    "duration": ("exercise", "Exercise time", "{:.0f} min", ("high",)),
+}
+METRICS_BY_TYPE = {
+    data_type: tuple(name for name, spec in ANOMALY_METRICS.items() if spec[0] == data_type)
+    for data_type in {spec[0] for spec in ANOMALY_METRICS.values()}
+}
+
+# One state row per metric: Welford count, mean and M2 plus the EWMA of completed
+# days' totals, then the latest (open) day as an ordinal and its running total
+STATE_FIELDS = ("count", "mean", "m2", "ewma", "day", "day_total")
+# Spread floor as a fraction of the baseline, so near-constant histories don't flag small changes
+MIN_STD_FRACTION = 0.05
+
+# Dialects with INSERT ... ON CONFLICT DO NOTHING
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def empty_state() -> List[float]:
+    return [0.0] * len(STATE_FIELDS)
+
+
+def fold(state: List[float], value: float, alpha: float):
+    """Add a completed day's total: Welford's update and the EWMA"""
+    count = state[0] + 1
+    delta = value - state[1]
+    state[0] = count
+    state[1] += delta / count
+    state[2] += delta * (value - state[1])
+    state[3] = value if count == 1 else state[3] + alpha * (value - state[3])
+
+
+def update(state: List[float], day: int, value: float, alpha: float) -> bool:
+    """Add a record's value to its day; False for days before the open one, which need a recount"""
+    if day == state[4]:
+        state[5] += value
+    elif day > state[4]:
+        if state[4]:
+            fold(state, state[5], alpha)
+        state[4] = day
+        state[5] = value
+    else:
+        return False
+    return True
+
+
+def score(state: List[float], min_days: int) -> Optional[Tuple[float, float]]:
+    """(z, expected) of the open day's total against the EWMA baseline, once min_days days are complete"""
+    count = state[0]
+    if count < max(min_days, 2):
+        return None
+    std = max(math.sqrt(state[2] / (count - 1)), MIN_STD_FRACTION * abs(state[3]), 1e-9)
+    return (state[5] - state[3]) / std, state[3]
+
+
+def offline_state(days: np.ndarray, values: np.ndarray, alpha: float) -> List[float]:
+    """The state update() reaches over records in date order, computed from the whole history at once"""
+    state = empty_state()
+    if len(days) == 0:
+        return state
+    unique_days, index = np.unique(days, return_inverse=True)
+    totals = np.bincount(index, weights=values)
+    completed = totals[:-1]
+    n = len(completed)
+    state[4], state[5] = float(unique_days[-1]), float(totals[-1])
+    if n:
+        weights = alpha * (1 - alpha) ** np.arange(n - 1, -1, -1)
+        weights[0] = (1 - alpha) ** (n - 1)
+        state[0] = float(n)
+        state[1] = float(completed.mean())
+        state[2] = float(((completed - state[1]) ** 2).sum())
+        state[3] = float(weights @ completed)
+    return state
+
+
+def encode_state(state: Dict[str, List[float]]) -> bytes:
+    return np.array(list(state.values()), dtype=np.float64).tobytes()
+
+
+def decode_state(row: UserMetricStats) -> Dict[str, List[float]]:
+    """State per metric of ANOMALY_METRICS; metrics added since the row was written start empty"""
+    stored = np.frombuffer(row.state, dtype=np.float64).reshape(-1, len(STATE_FIELDS)).tolist()
+    by_name = dict(zip(row.metrics.split(","), stored))
+    return {name: by_name.get(name) or empty_state() for name in ANOMALY_METRICS}
+
+
+class AnomalyDetector:
+    """Streaming per-user anomaly detection over daily health metric totals
+
+    Each user has one user_metric_stats row holding, per metric, Welford's
+    running mean and variance and an EWMA of completed daily totals, plus
+    the running total of the latest (open) day. Record writes update it in
+    O(1), in the same transaction as the records, and score the open day
+    against the EWMA in running standard deviations. Records dated before
+    a user's open day (backfilled days) have their metrics recounted from
+    the last bootstrap_days of history. Records dated after tomorrow or
+    with non-finite values are stored but not counted. A user's state is
+    built from the same history on their first write.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        alpha: float,
+        threshold: float,
+        min_days: int,
+        recent_days: int,
+        bootstrap_days: int
+    ):
+        self.enabled = enabled
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_days = min_days
+        self.recent_days = recent_days
+        self.bootstrap_days = bootstrap_days
+        self._lock = threading.Lock()
+        self.events = 0
+        self.late = 0
+        self.dropped = 0
+        self.anomalies = 0
+        self.bootstraps = 0
+        self.recounts = 0
+        self.update_seconds = 0.0
+
+    def _history(self, db: Session, user_id: int) -> Tuple[int, Dict[str, Tuple[np.ndarray, np.ndarray]]]:
+        """First day (ordinal) of the bootstrap window, and each metric's stored (days, values) in it"""
+        start_date = date.today() - timedelta(days=self.bootstrap_days)
+        end_date = date.today() + timedelta(days=1)
+        series = health_data_cache.get_series(db, user_id, start_date, end_date)
+        in_range = series.between(start_date, end_date)
+        dates = series.column("date")
+        history = {}
+        for name in ANOMALY_METRICS:
+            values = series.column(name)
+            present = in_range & ~np.isnan(values)
+            history[name] = (dates[present], values[present])
+        return start_date.toordinal(), history
+
+    def _bootstrap(self, db: Session, user_id: int) -> Dict[str, List[float]]:
+        _, history = self._history(db, user_id)
+        state = {name: offline_state(days, values, self.alpha) for name, (days, values) in history.items()}
+        with self._lock:
+            self.bootstraps += 1
+        return state
+
+    def _recount(self, db: Session, user_id: int, state: Dict[str, List[float]], values, metrics) -> int:
+        """Rebuild metrics' states from the stored history plus the new values; returns the values too old to count
+
+        The new records are not flushed yet, so the history does not include them.
+        """
+        first_day, history = self._history(db, user_id)
+        dropped = 0
+        for name in metrics:
+            new = [(day, value) for day, metric, value in values if metric == name]
+            kept = [(day, value) for day, value in new if day >= first_day]
+            dropped += len(new) - len(kept)
+            days, stored = history[name]
+            state[name] = offline_state(
+                np.concatenate([days, np.array([day for day, _ in kept], dtype=days.dtype)]),
+                np.concatenate([stored, np.array([value for _, value in kept], dtype=np.float64)]),
+                self.alpha
+            )
+        with self._lock:
+            self.recounts += 1
+        return dropped
+
+    def _load(self, db: Session, user_id: int) -> Tuple[UserMetricStats, Dict[str, List[float]]]:
+        """The user's row, locked until the caller commits, and its decoded state"""
+        query = db.query(UserMetricStats).filter(UserMetricStats.user_id == user_id).with_for_update()
+        row = query.first()
+        if row is None:
+            state = self._bootstrap(db, user_id)
+            values = {"user_id": user_id, "metrics": ",".join(state), "state": encode_state(state), "anomalies": {}}
+            dialect_insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+            if dialect_insert is not None:
+                # A concurrent first write may create the row too; then we use theirs
+                db.execute(dialect_insert(UserMetricStats).on_conflict_do_nothing(index_elements=["user_id"]), [values])
+            else:
+                db.execute(insert(UserMetricStats), [values])
+            row = query.one()
+        state = decode_state(row)
+        if max(metric[4] for metric in state.values()) > (date.today() + timedelta(days=1)).toordinal():
+            # Opened by a future-dated record before those were rejected; every later day would be late
+            state = self._bootstrap(db, user_id)
+        return row, state
+
+    def observe(self, db: Session, user_id: int, records: Iterable):
+        """Add new records (before they are flushed) to the user's running statistics; the caller commits"""
+        if not self.enabled:
+            return
+        # Future-dated records would become the open day and make every later record late
+        latest = (date.today() + timedelta(days=1)).toordinal()
+        values = [
+            (day, name, value)
+            for record in records
+            if (day := record.date.toordinal()) <= latest
+            for name in METRICS_BY_TYPE.get(record.data_type, ())
+            if (value := getattr(record, name, None)) is not None and math.isfinite(value)
+        ]
+        if not values:
+            return
+        values.sort(key=lambda item: item[0])
+        row, state = self._load(db, user_id)
+
+        started = time.perf_counter()
+        anomalies = dict(row.anomalies or {})
+        late = found = dropped = 0
+        recount = set()
+        for day, name, value in values:
+            if update(state[name], day, value, self.alpha):
+                found += self._check(name, state[name], anomalies)
+            else:
+                late += 1
+                recount.add(name)
+        if recount:
+            # Backfilled days change totals already folded into the baseline
+            dropped = self._recount(db, user_id, state, values, recount)
+            for name in recount:
+                found += self._check(name, state[name], anomalies)
+        row.state = encode_state(state)
+        row.metrics = ",".join(state)
+        row.anomalies = anomalies
+        with self._lock:
+            self.events += len(values)
+            self.late += late
+            self.dropped += dropped
+            self.anomalies += found
+            self.update_seconds += time.perf_counter() - started
+
+    def _check(self, name: str, state: List[float], anomalies: Dict) -> int:
+        """Record or clear the open day's anomaly for a metric; 1 when a new one is found"""
+        day = date.fromordinal(int(state[4])).isoformat()
+        previous = anomalies.get(name)
+        scored = score(state, self.min_days)
+        if scored is not None:
+            z, expected = scored
+            direction = "high" if z > 0 else "low"
+            if abs(z) >= self.threshold and direction in ANOMALY_METRICS[name][3]:
+                anomalies[name] = {
+                    "date": day,
+                    "value": round(state[5], 2),
+                    "expected": round(expected, 2),
+                    "z": round(z, 2),
+                    "direction": direction,
+                }
+                return int(previous is None or previous["date"] != day)
+        if previous is not None and previous["date"] == day:
+            del anomalies[name]
+        return 0
+
+    def recommendations(self, db: Session, user_id: int) -> List[Dict]:
+        """Recommendations for the user's anomalies of the last recent_days, newest first"""
+        if not self.enabled:
+            return []
+        row = db.get(UserMetricStats, user_id)
+        if row is None or not row.anomalies:
+            return []
+        cutoff = (date.today() - timedelta(days=self.recent_days)).isoformat()
+        recommendations = []
+        for name, anomaly in sorted(row.anomalies.items(), key=lambda item: item[1]["date"], reverse=True):
+            if name not in ANOMALY_METRICS or anomaly["date"] < cutoff:
+                continue
+            data_type, label, value_format, _ = ANOMALY_METRICS[name]
+            recommendations.append({
+                "type": data_type,
+                "priority": "high",
+                "message": (
+                    f"{label} {'spiked' if anomaly['direction'] == 'high' else 'dropped'} to "
+                    f"{value_format.format(anomaly['value'])} on {anomaly['date']}, "
+                    f"against a usual {value_format.format(anomaly['expected'])}"
+                ),
+                "anomaly": {"metric": name, **anomaly},
+            })
+        return recommendations
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "events": self.events,
+                "late": self.late,
+                "dropped": self.dropped,
+                "anomalies": self.anomalies,
+                "bootstraps": self.bootstraps,
+                "recounts": self.recounts,
+                "update_us_per_event": self.update_seconds / self.events * 1e6 if self.events else 0.0,
+            }
+
+
+anomaly_detector = AnomalyDetector(
+    enabled=settings.ANOMALY_ENABLED,
+    alpha=settings.ANOMALY_EWMA_ALPHA,
+    threshold=settings.ANOMALY_Z_THRESHOLD,
+    min_days=settings.ANOMALY_MIN_DAYS,
+    recent_days=settings.ANOMALY_RECENT_DAYS,
+    bootstrap_days=settings.ANOMALY_BOOTSTRAP_DAYS
+)
+metrics.register("anomaly_detector", anomaly_detector.stats)
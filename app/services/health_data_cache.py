@@ -0,0 +1,213 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.cache import tag_versions_sync, user_tag
+from app.core.config import settings
+from app.core.memory import memory
+from app.core.metrics import metrics
+from app.models.health_records import HEALTH_RECORD_MODELS
+
+# Numeric health record columns kept as float64 arrays (NaN for NULL)
+METRIC_COLUMNS = (
+    "duration", "calories_burned", "distance",
+    "calories", "protein", "carbs", "fats", "fiber",
+    "sleep_duration"
+)
+
+# Compact integer codes for the data_type column
+DATA_TYPE_CODES = {"exercise": 0, "diet": 1, "sleep": 2}
+UNKNOWN_DATA_TYPE = -1
+
+
+class UserHealthSeries:
+    """Columnar copy of one user's health data from window_start onwards"""
+
+    def __init__(self, window_start: date, capacity: int = 64):
+        self.window_start = window_start
+        self.loaded_at = time.monotonic()
+        # Version of the user's cache tag when loaded, on shared cache backends
+        self.version = None
+        self.size = 0
+        self._columns: Dict[str, np.ndarray] = {}
+        self._allocate(max(capacity, 1))
+
+    def _allocate(self, capacity: int):
+        old = self._columns
+        self._columns = {
+            "date": np.zeros(capacity, dtype=np.int32),
+            "data_type": np.full(capacity, UNKNOWN_DATA_TYPE, dtype=np.int8),
+        }
+        for name in METRIC_COLUMNS:
+            self._columns[name] = np.full(capacity, np.nan, dtype=np.float64)
+        for name, column in old.items():
+            self._columns[name][:self.size] = column[:self.size]
+
+    @classmethod
+    def from_parts(cls, window_start: date, parts: list) -> "UserHealthSeries":
+        """Build a series from (data_type, metric_names, rows) per storage table
+
+        Each row is a (date, *metric_names) tuple.
+        """
+        series = cls(window_start, capacity=sum(len(rows) for _, _, rows in parts))
+        for data_type, metric_names, rows in parts:
+            lo, n = series.size, len(rows)
+            hi = lo + n
+            series._columns["date"][lo:hi] = np.fromiter(
+                (row[0].toordinal() for row in rows), dtype=np.int32, count=n
+            )
+            series._columns["data_type"][lo:hi] = DATA_TYPE_CODES.get(data_type, UNKNOWN_DATA_TYPE)
+            for offset, name in enumerate(metric_names, start=1):
+                series._columns[name][lo:hi] = np.fromiter(
+                    (np.nan if row[offset] is None else row[offset] for row in rows), dtype=np.float64, count=n
+                )
+            series.size = hi
+        return series
+
+    def column(self, name: str) -> np.ndarray:
+        """Get a read-only view of a column"""
+        view = self._columns[name][:self.size]
+        view.flags.writeable = False
+        return view
+
+    def between(self, start_date: date, end_date: date) -> np.ndarray:
+        """Boolean mask of rows dated within [start_date, end_date]"""
+        dates = self.column("date")
+        return (dates >= start_date.toordinal()) & (dates <= end_date.toordinal())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self._columns.values())
+
+
+class HealthDataCache:
+    """LRU cache of recent per-user health data as NumPy columns
+
+    Writes drop the user's entry rather than appending to it, and a load
+    that raced a write is not stored, so a committed record is never
+    counted twice or missed until the TTL. Entries are per process. On a
+    shared cache backend each entry is stamped
+    with the version of the user's cache tag, which every health data write
+    bumps, so a write handled by another worker turns it into a miss.
+    """
+
+    def __init__(self, days: int, max_bytes: int, ttl_seconds: float):
+        self.days = days
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, UserHealthSeries]" = OrderedDict()
+        # user_id -> token of the load in progress; invalidate() drops it
+        self._loading: Dict[int, object] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _load(db: Session, user_id: int, start_date: date, end_date: Optional[date] = None) -> UserHealthSeries:
+        """Columnar fetch of a user's health data, one query per record table"""
+        parts = []
+        for data_type, model in HEALTH_RECORD_MODELS.items():
+            metric_names = [name for name in METRIC_COLUMNS if name in model.record_fields]
+            query = db.query(model.date, *[getattr(model, name) for name in metric_names]).filter(
+                model.user_id == user_id,
+                model.date >= start_date
+            )
+            if end_date:
+                query = query.filter(model.date <= end_date)
+            parts.append((data_type, metric_names, query.all()))
+        return UserHealthSeries.from_parts(start_date, parts)
+
+    def get_series(self, db: Session, user_id: int, start_date: date, end_date: date) -> UserHealthSeries:
+        """Get a series covering [start_date, end_date], from cache when possible"""
+        window_start = date.today() - timedelta(days=self.days)
+        if start_date < window_start or self.max_bytes <= 0:
+            # Older than the cached window; serve straight from the database
+            with self._lock:
+                self.bypasses += 1
+            return self._load(db, user_id, start_date, end_date)
+
+        # Read before loading, so a write racing the load leaves the entry stale
+        version = tag_versions_sync(user_tag(user_id))
+        with self._lock:
+            series = self._entries.get(user_id)
+            if (
+                series is not None
+                and series.window_start <= start_date
+                and series.version == version
+                and time.monotonic() - series.loaded_at < self.ttl_seconds
+            ):
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return series
+            self.misses += 1
+            token = self._loading[user_id] = object()
+
+        series = self._load(db, user_id, window_start)
+        series.version = version
+        with self._lock:
+            if self._loading.get(user_id) is not token:
+                # Invalidated while loading; the rows read may predate the write
+                return series
+            del self._loading[user_id]
+            self._remove(user_id)
+            self._entries[user_id] = series
+            self._bytes += series.nbytes
+            self._evict()
+            return series
+
+    def invalidate(self, user_id: int):
+        """Drop a user's cached series, after a write to their health data commits"""
+        with self._lock:
+            self._remove(user_id)
+            self._loading.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loading.clear()
+            self._bytes = 0
+
+    def _remove(self, user_id: int):
+        series = self._entries.pop(user_id, None)
+        if series is not None:
+            self._bytes -= series.nbytes
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, series = self._entries.popitem(last=False)
+            self._bytes -= series.nbytes
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Report memory footprint and hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+health_data_cache = HealthDataCache(
+    days=settings.HEALTH_CACHE_DAYS,
+    max_bytes=settings.HEALTH_CACHE_MAX_BYTES,
+    ttl_seconds=settings.HEALTH_CACHE_TTL_SECONDS
+)
+metrics.register("health_data_cache", health_data_cache.stats)
+memory.register("health_data_cache", lambda: {
+    key: value for key, value in health_data_cache.stats().items() if key in ("entries", "bytes", "max_bytes")
+})
@@ -1,42 +1,64 @@
 from typing import List, Optional
 from sqlalchemy.orm import Session
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from fastapi import HTTPException, status
+import numpy as np
 
-from app.models.health_data import HealthData, HealthPlan
+from app.core.cache import get_cache, invalidate_tags_sync, user_tag
+from app.core.config import settings
+from app.models.health_data import HealthPlan
+from app.models.health_records import HEALTH_RECORD_MODELS, HealthRecord
+from app.models.plan_text import PLAN_TEXT_FIELDS
 from app.schemas.health_data import HealthDataCreate, HealthPlanCreate, HealthPlanUpdate
+from app.services.adherence_tracker import adherence_tracker
+from app.services.anomaly_detector import anomaly_detector
+from app.services.health_data_cache import health_data_cache, DATA_TYPE_CODES
+from app.services.plan_text_store import plan_text_store
+
+# Numeric health record columns that can be aggregated into trends
+TREND_METRICS = (
+    "duration", "calories_burned", "distance",
+    "calories", "protein", "carbs", "fats", "fiber",
+    "sleep_duration"
+)
+TREND_BUCKETS = ("day", "week", "month")
+TREND_MAX_DAYS = 1096
+TREND_ROLLING_WINDOWS = (7, 28)
+
+# Statistics per "<user_id>:<days>", invalidated through the user's cache tag
+statistics_cache = get_cache("statistics", settings.CACHE_STATISTICS_TTL_SECONDS)
 
 
 class HealthDataService:
     @staticmethod
-    def create_health_data(db: Session, user_id: int, health_data: HealthDataCreate) -> HealthData:
+    def record_model(data_type: str):
+        """Get the storage table for a data type"""
+        model = HEALTH_RECORD_MODELS.get(data_type)
+        if model is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported data type, expected one of: {', '.join(HEALTH_RECORD_MODELS)}"
+            )
+        return model
+    
+    @staticmethod
+    def create_health_data(db: Session, user_id: int, health_data: HealthDataCreate) -> HealthRecord:
         """Create health data"""
-        db_health_data = HealthData(
+        model = HealthDataService.record_model(health_data.data_type)
+        db_health_data = model(
             user_id=user_id,
-            data_type=health_data.data_type,
             date=health_data.date,
-            exercise_type=health_data.exercise_type,
-            duration=health_data.duration,
-            calories_burned=health_data.calories_burned,
-            distance=health_data.distance,
-            intensity=health_data.intensity,
-            meal_type=health_data.meal_type,
-            food_name=health_data.food_name,
-            calories=health_data.calories,
-            protein=health_data.protein,
-            carbs=health_data.carbs,
-            fats=health_data.fats,
-            fiber=health_data.fiber,
-            sleep_duration=health_data.sleep_duration,
-            sleep_quality=health_data.sleep_quality,
-            bed_time=health_data.bed_time,
-            wake_time=health_data.wake_time,
-            notes=health_data.notes
+            notes=health_data.notes,
+            **{field: getattr(health_data, field) for field in model.record_fields}
         )
         
+        anomaly_detector.observe(db, user_id, [db_health_data])
+        adherence_tracker.observe(db, user_id, [db_health_data])
         db.add(db_health_data)
         db.commit()
         db.refresh(db_health_data)
+        health_data_cache.invalidate(user_id)
+        invalidate_tags_sync(user_tag(user_id))
         return db_health_data
     
     @staticmethod
@@ -46,20 +68,29 @@ class HealthDataService:
         data_type: Optional[str] = None,
         start_date: Optional[date] = None,
         end_date: Optional[date] = None
-    ) -> List[HealthData]:
+    ) -> List[HealthRecord]:
         """Get user's health data"""
-        query = db.query(HealthData).filter(HealthData.user_id == user_id)
-        
         if data_type:
-            query = query.filter(HealthData.data_type == data_type)
-        
-        if start_date:
-            query = query.filter(HealthData.date >= start_date)
+            if data_type not in HEALTH_RECORD_MODELS:
+                return []
+            models = [HEALTH_RECORD_MODELS[data_type]]
+        else:
+            models = list(HEALTH_RECORD_MODELS.values())
         
-        if end_date:
-            query = query.filter(HealthData.date <= end_date)
+        records = []
+        for model in models:
+            query = db.query(model).filter(model.user_id == user_id)
+            
+            if start_date:
+                query = query.filter(model.date >= start_date)
+            
+            if end_date:
+                query = query.filter(model.date <= end_date)
+            
+            records.extend(query.all())
         
-        return query.order_by(HealthData.date.desc()).all()
+        records.sort(key=lambda record: record.date, reverse=True)
+        return records
     
     @staticmethod
     def get_health_data_statistics(
@@ -69,32 +100,112 @@ class HealthDataService:
     ) -> dict:
         """Get health data statistics"""
         end_date = date.today()
-        start_date = date(end_date.year, end_date.month, end_date.day - days)
+        start_date = end_date - timedelta(days=days)
         
-        health_data = db.query(HealthData).filter(
-            HealthData.user_id == user_id,
-            HealthData.date >= start_date,
-            HealthData.date <= end_date
-        ).all()
+        series = health_data_cache.get_series(db, user_id, start_date, end_date)
+        in_range = series.between(start_date, end_date)
+        data_type = series.column("data_type")
+        exercise = in_range & (data_type == DATA_TYPE_CODES["exercise"])
+        sleep = in_range & (data_type == DATA_TYPE_CODES["sleep"])
+        diet = in_range & (data_type == DATA_TYPE_CODES["diet"])
         
         stats = {
-            "total_exercise_minutes": 0,
-            "total_calories_burned": 0,
-            "total_sleep_hours": 0,
-            "total_calories_consumed": 0
+            "total_exercise_minutes": float(np.nansum(series.column("duration")[exercise])),
+            "total_calories_burned": float(np.nansum(series.column("calories_burned")[exercise])),
+            "total_sleep_hours": float(np.nansum(series.column("sleep_duration")[sleep])),
+            "total_calories_consumed": float(np.nansum(series.column("calories")[diet]))
         }
         
-        for data in health_data:
-            if data.data_type == "exercise":
-                stats["total_exercise_minutes"] += data.duration or 0
-                stats["total_calories_burned"] += data.calories_burned or 0
-            elif data.data_type == "sleep":
-                stats["total_sleep_hours"] += data.sleep_duration or 0
-            elif data.data_type == "diet":
-                stats["total_calories_consumed"] += data.calories or 0
-        
         return stats
     
+    @staticmethod
+    def get_health_data_trends(
+        db: Session,
+        user_id: int,
+        metric: str,
+        bucket: str = "day",
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> dict:
+        """Get bucketed sums, means and rolling means for a numeric metric"""
+        if metric not in TREND_METRICS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported metric, expected one of: {', '.join(TREND_METRICS)}"
+            )
+        if bucket not in TREND_BUCKETS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported bucket, expected one of: {', '.join(TREND_BUCKETS)}"
+            )
+        
+        end_date = end_date or date.today()
+        start_date = start_date or end_date - timedelta(days=29)
+        if start_date > end_date or (end_date - start_date).days >= TREND_MAX_DAYS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Date range must be ascending and at most {TREND_MAX_DAYS} days"
+            )
+        
+        # Include enough lookback for the widest rolling window
+        lookback = max(TREND_ROLLING_WINDOWS) - 1
+        fetch_start = start_date - timedelta(days=lookback)
+        series = health_data_cache.get_series(db, user_id, fetch_start, end_date)
+        values = series.column(metric)
+        selected = series.between(fetch_start, end_date) & ~np.isnan(values)
+        day_index = series.column("date")[selected].astype(np.int64) - fetch_start.toordinal()
+        
+        # Daily totals on a dense calendar grid
+        n_days = (end_date - fetch_start).days + 1
+        daily_sum = np.bincount(day_index, weights=values[selected], minlength=n_days)
+        daily_count = np.bincount(day_index, minlength=n_days)
+        
+        # Rolling means over days that have data, evaluated at every day of the grid
+        sum_prefix = np.concatenate(([0.0], np.cumsum(daily_sum)))
+        active_prefix = np.concatenate(([0], np.cumsum(daily_count > 0)))
+        rolling = {}
+        for window in TREND_ROLLING_WINDOWS:
+            ends = np.arange(lookback, n_days) + 1
+            window_sum = sum_prefix[ends] - sum_prefix[ends - window]
+            window_days = active_prefix[ends] - active_prefix[ends - window]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                rolling[window] = np.where(window_days > 0, window_sum / window_days, np.nan)
+        
+        # Assign each requested day to its bucket
+        days = np.arange(
+            np.datetime64(start_date, "D"), np.datetime64(end_date, "D") + 1
+        )
+        if bucket == "week":
+            # 1970-01-01 was a Thursday; shift so weeks start on Monday
+            labels = days - (days.astype(np.int64) + 3) % 7
+        elif bucket == "month":
+            labels = days.astype("datetime64[M]").astype("datetime64[D]")
+        else:
+            labels = days
+        bucket_labels, inverse = np.unique(labels, return_inverse=True)
+        last_day = np.append(np.flatnonzero(np.diff(inverse)), len(days) - 1)
+        
+        bucket_sum = np.bincount(inverse, weights=daily_sum[lookback:])
+        bucket_count = np.bincount(inverse, weights=daily_count[lookback:]).astype(np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            bucket_mean = np.where(bucket_count > 0, bucket_sum / bucket_count, np.nan)
+        
+        def to_list(arr: np.ndarray) -> list:
+            return [None if np.isnan(x) else float(x) for x in arr]
+        
+        return {
+            "metric": metric,
+            "bucket": bucket,
+            "start_date": start_date,
+            "end_date": end_date,
+            "buckets": bucket_labels.astype(object).tolist(),
+            "count": bucket_count.tolist(),
+            "sum": bucket_sum.tolist(),
+            "mean": to_list(bucket_mean),
+            "rolling_7d_mean": to_list(rolling[7][last_day]),
+            "rolling_28d_mean": to_list(rolling[28][last_day])
+        }
+    
     @staticmethod
     def create_health_plan(db: Session, user_id: int, plan_data: HealthPlanCreate) -> HealthPlan:
         """Create health plan"""
@@ -102,21 +213,24 @@ class HealthDataService:
             user_id=user_id,
             plan_type=plan_data.plan_type,
             title=plan_data.title,
-            description=plan_data.description,
             duration_days=plan_data.duration_days,
             calories_target=plan_data.calories_target,
             exercise_minutes_per_day=plan_data.exercise_minutes_per_day,
             weekly_exercise_days=plan_data.weekly_exercise_days,
-            exercise_plan=plan_data.exercise_plan,
-            diet_suggestions=plan_data.diet_suggestions,
+            ai_generated_content=plan_data.ai_generated_content,
             status=plan_data.status or "active",
             start_date=plan_data.start_date,
             end_date=plan_data.end_date
         )
         
         db.add(db_plan)
+        db.flush()
+        # Description, exercise plan and diet suggestions go to the content-addressed blobs
+        plan_text_store.save(db, db_plan, {field: getattr(plan_data, field) for field in PLAN_TEXT_FIELDS})
+        adherence_tracker.start(db, db_plan)
         db.commit()
         db.refresh(db_plan)
+        plan_text_store.hydrate(db, [db_plan])
         return db_plan
     
     @staticmethod
@@ -131,7 +245,7 @@ class HealthDataService:
         if status_filter:
             query = query.filter(HealthPlan.status == status_filter)
         
-        return query.order_by(HealthPlan.created_at.desc()).all()
+        return plan_text_store.hydrate(db, query.order_by(HealthPlan.created_at.desc()).all())
     
     @staticmethod
     def update_health_plan(
@@ -153,13 +267,19 @@ class HealthDataService:
             )
         
         update_data = plan_data.model_dump(exclude_unset=True)
+        texts = None
+        if any(field in update_data for field in PLAN_TEXT_FIELDS):
+            plan_text_store.hydrate(db, [plan])
+            texts = {field: update_data.pop(field, getattr(plan, field)) for field in PLAN_TEXT_FIELDS}
         for field, value in update_data.items():
             setattr(plan, field, value)
+        if texts is not None:
+            plan_text_store.save(db, plan, texts)
         
         plan.updated_at = datetime.utcnow()
         db.commit()
         db.refresh(plan)
-        return plan
+        return plan_text_store.hydrate(db, [plan])[0]
 
 
 
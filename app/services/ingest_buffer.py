@@ -0,0 +1,516 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.core.cache import invalidate_tags_sync, user_tag
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.memory import memory
+from app.core.metrics import metrics
+from app.models.health_records import HEALTH_RECORD_MODELS
+from app.models.ingest_checkpoint import IngestCheckpoint, IngestDeadLetter
+from app.schemas.health_data import HealthDataCreate
+from app.services.adherence_tracker import adherence_tracker
+from app.services.anomaly_detector import anomaly_detector
+from app.services.health_data_cache import health_data_cache
+from app.services.segmentation_service import segmentation_service
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+LOCK_FILE = "LOCK"
+
+# (seq, user_id, received_at, record)
+PendingRecord = Tuple[int, int, float, HealthDataCreate]
+
+
+def encode_entry(seq: int, user_id: int, received_at: float, record: HealthDataCreate) -> bytes:
+    """One log line: CRC32 of the JSON payload, then the payload"""
+    payload = json.dumps({
+        "seq": seq,
+        "user_id": user_id,
+        "received_at": received_at,
+        "record": record.model_dump(mode="json", exclude_none=True)
+    }, separators=(",", ":")).encode()
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def decode_entry(line: bytes) -> Optional[PendingRecord]:
+    """Parse one log line; None when it is torn or corrupt"""
+    if not line.endswith(b"\n") or len(line) < 10:
+        return None
+    checksum, payload = line[:8], line[9:-1]
+    try:
+        if int(checksum, 16) != zlib.crc32(payload):
+            return None
+        entry = json.loads(payload)
+        seq, user_id, received_at, record = entry["seq"], entry["user_id"], entry["received_at"], entry["record"]
+    except (ValueError, KeyError):
+        return None
+    try:
+        record = HealthDataCreate.model_validate(record)
+    except ValidationError:
+        # Logged before validation was tightened; flushed as is, and dead-lettered if the database rejects it
+        record = HealthDataCreate.model_construct(**record)
+    return seq, user_id, received_at, record
+
+
+class IngestBuffer:
+    """Write-behind buffer for health records
+
+    Appends go to an append-only segment log and are acknowledged once
+    fsynced; concurrent appends share one fsync (group commit). A flusher
+    thread inserts durable records into the health record tables in
+    batches, advancing a checkpoint in the same transaction, so replaying
+    the log after a restart inserts each record exactly once.
+    """
+
+    def __init__(
+        self,
+        log_dir: str,
+        node_id: str,
+        segment_bytes: int,
+        flush_interval: float,
+        flush_batch: int,
+        max_pending: int,
+        session_factory=SessionLocal
+    ):
+        self.log_dir = log_dir
+        self.node_id = node_id
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.max_pending = max_pending
+        self.session_factory = session_factory
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock_file = None
+        self._reset_state()
+
+    def _reset_state(self):
+        self._file = None
+        self._segment_size = 0
+        # First sequence number of each segment file, oldest first
+        self._segments: List[Tuple[int, str]] = []
+        self._queue: List[Tuple[PendingRecord, bytes]] = []
+        self._pending: "deque[PendingRecord]" = deque()
+        self._pending_users: Dict[int, int] = {}
+        self._writing = False
+        self._error: Optional[Exception] = None
+        self._next_seq = 1
+        self._durable_seq = 0
+        self._flushed_seq = 0
+        self._lags = deque(maxlen=10_000)
+        self.appended = 0
+        self.fsyncs = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.replayed = 0
+        self.dead_lettered = 0
+        self.last_flush_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._file is not None
+
+    # Lifecycle
+
+    def start(self):
+        """Replay unflushed segments and start the flusher"""
+        if self.running:
+            return
+        self._reset_state()
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._lock_file = open(os.path.join(self.log_dir, LOCK_FILE), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            raise RuntimeError(f"Ingestion log {self.log_dir} is in use by another process")
+
+        db = self.session_factory()
+        try:
+            checkpoint = db.get(IngestCheckpoint, self.node_id)
+            self._flushed_seq = checkpoint.flushed_seq if checkpoint else 0
+        finally:
+            db.close()
+
+        last_seq = self._flushed_seq
+        for first_seq, path in self._list_segments():
+            self._segments.append((first_seq, path))
+            for entry in self._read_segment(path):
+                last_seq = max(last_seq, entry[0])
+                if entry[0] > self._flushed_seq:
+                    self._pending.append(entry)
+                    self._pending_users[entry[1]] = self._pending_users.get(entry[1], 0) + 1
+        self.replayed = len(self._pending)
+        self._next_seq = last_seq + 1
+        self._durable_seq = last_seq
+        # Always append to a fresh segment rather than after a possibly torn tail
+        self._open_segment(self._next_seq)
+        self._remove_flushed_segments()
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+        self._thread.start()
+        if self._pending:
+            self._flush_requested.set()
+
+    def stop(self, flush: bool = True):
+        """Stop the flusher, by default flushing everything durable first"""
+        if not self.running:
+            return
+        self._stopping.set()
+        self._flush_requested.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush:
+            self.flush()
+        with self._cond:
+            self._file.close()
+            self._file = None
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Could not flush ingestion buffer: {e}")
+                self._stopping.wait(min(self.flush_interval, 5.0))
+
+    # Segment files
+
+    def _list_segments(self) -> List[Tuple[int, str]]:
+        segments = []
+        for name in os.listdir(self.log_dir):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                first_seq = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                segments.append((first_seq, os.path.join(self.log_dir, name)))
+        return sorted(segments)
+
+    @staticmethod
+    def _read_segment(path: str) -> List[PendingRecord]:
+        """Entries of one segment, truncating a torn tail left by a crash"""
+        entries = []
+        offset, torn = 0, False
+        with open(path, "rb") as f:
+            for line in f:
+                entry = decode_entry(line)
+                if entry is None:
+                    torn = True
+                    break
+                entries.append(entry)
+                offset += len(line)
+        if torn:
+            # Nothing from a torn write onwards was ever acknowledged
+            print(f"Truncating ingestion segment {path} at byte {offset}")
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+                os.fsync(f.fileno())
+        return entries
+
+    def _open_segment(self, first_seq: int):
+        path = os.path.join(self.log_dir, f"{SEGMENT_PREFIX}{first_seq:020d}{SEGMENT_SUFFIX}")
+        self._file = open(path, "ab")
+        self._segment_size = self._file.tell()
+        with self._cond:
+            if not self._segments or self._segments[-1][1] != path:
+                self._segments.append((first_seq, path))
+        # Make the new directory entry durable too
+        dir_fd = os.open(self.log_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _write(self, batch: List[Tuple[PendingRecord, bytes]]):
+        data = b"".join(line for _, line in batch)
+        if self._segment_size and self._segment_size + len(data) > self.segment_bytes:
+            self._file.close()
+            self._open_segment(batch[0][0][0])
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._segment_size += len(data)
+
+    def _remove_flushed_segments(self):
+        with self._cond:
+            flushed_seq = self._flushed_seq
+            removable = [
+                path for (_, path), (next_first, _) in zip(self._segments, self._segments[1:])
+                if next_first - 1 <= flushed_seq
+            ]
+            self._segments = [segment for segment in self._segments if segment[1] not in removable]
+        for path in removable:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Could not remove ingestion segment {path}: {e}")
+
+    # Appends
+
+    def append(self, user_id: int, records: List[HealthDataCreate]) -> Tuple[int, int]:
+        """Durably log records; returns their first and last sequence numbers"""
+        received_at = time.time()
+        with self._cond:
+            if not self.running or self._error is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Health data ingestion is unavailable"
+                )
+            if len(self._pending) + len(self._queue) + len(records) > self.max_pending:
+                self._flush_requested.set()
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Health data ingestion is backlogged, please retry later",
+                    headers={"Retry-After": str(max(1, int(self.flush_interval)))}
+                )
+            first_seq = self._next_seq
+            for record in records:
+                entry = (self._next_seq, user_id, received_at, record)
+                self._queue.append((entry, encode_entry(*entry)))
+                self._next_seq += 1
+            self._pending_users[user_id] = self._pending_users.get(user_id, 0) + len(records)
+            last_seq = self._next_seq - 1
+            try:
+                self._wait_durable(last_seq)
+            except HTTPException:
+                # The records were queued as one batch, so none of them reached the log
+                self._uncount(user_id, len(records))
+                raise
+            if len(self._pending) >= self.flush_batch:
+                self._flush_requested.set()
+        return first_seq, last_seq
+
+    def _wait_durable(self, seq: int):
+        """Group commit: whoever finds no write in progress writes and fsyncs everything queued"""
+        while self._durable_seq < seq:
+            if self._error is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Health data ingestion is unavailable"
+                )
+            if self._writing:
+                self._cond.wait()
+                continue
+            self._writing = True
+            batch, self._queue = self._queue, []
+            self._cond.release()
+            try:
+                self._write(batch)
+            except Exception as e:
+                # The log can no longer be trusted after a failed fsync; stop accepting writes
+                print(f"Could not write ingestion log: {e}")
+                self._error = e
+            finally:
+                self._cond.acquire()
+                self._writing = False
+            if self._error is None:
+                self._pending.extend(entry for entry, _ in batch)
+                self._durable_seq = batch[-1][0][0]
+                self.appended += len(batch)
+                self.fsyncs += 1
+            self._cond.notify_all()
+
+    # Flushing
+
+    def flush(self) -> int:
+        """Insert durable records into the health record tables; returns how many"""
+        total = 0
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = [self._pending[i] for i in range(min(self.flush_batch, len(self._pending)))]
+                if not batch:
+                    break
+                started = time.perf_counter()
+                try:
+                    self._insert(batch)
+                except OperationalError:
+                    # The database is unreachable or the transaction was aborted; retry the batch later
+                    raise
+                except Exception as e:
+                    print(f"Could not flush {len(batch)} ingested records together, retrying one at a time: {e}")
+                    total += self._flush_each(batch)
+                    continue
+                self._mark_flushed(batch, started)
+                total += len(batch)
+        if total:
+            self._remove_flushed_segments()
+        return total
+
+    def _flush_each(self, batch: List[PendingRecord]) -> int:
+        """Insert records one at a time, dead-lettering those the database rejects"""
+        for entry in batch:
+            started = time.perf_counter()
+            try:
+                self._insert([entry])
+            except OperationalError:
+                raise
+            except Exception as e:
+                print(f"Could not flush ingested record {entry[0]}, dead-lettering it: {e}")
+                self._dead_letter(entry, e)
+            self._mark_flushed([entry], started)
+        return len(batch)
+
+    def _mark_flushed(self, batch: List[PendingRecord], started: float):
+        flushed_at = time.time()
+        with self._cond:
+            for _ in batch:
+                self._pending.popleft()
+            users = set()
+            for _, user_id, received_at, _ in batch:
+                users.add(user_id)
+                self._lags.append(flushed_at - received_at)
+                self._uncount(user_id, 1)
+            self._flushed_seq = batch[-1][0]
+            self.flushed += len(batch)
+            self.flushes += 1
+            self.last_flush_seconds = time.perf_counter() - started
+            self._cond.notify_all()
+        for user_id in users:
+            health_data_cache.invalidate(user_id)
+            invalidate_tags_sync(user_tag(user_id))
+            segmentation_service.schedule(user_id)
+
+    def _uncount(self, user_id: int, count: int):
+        """Drop records from a user's pending count; the caller holds _cond"""
+        remaining = self._pending_users.get(user_id, 0) - count
+        if remaining > 0:
+            self._pending_users[user_id] = remaining
+        else:
+            self._pending_users.pop(user_id, None)
+
+    def _advance_checkpoint(self, db: Session, seq: int):
+        checkpoint = db.get(IngestCheckpoint, self.node_id)
+        if checkpoint is None:
+            checkpoint = IngestCheckpoint(node=self.node_id)
+            db.add(checkpoint)
+        checkpoint.flushed_seq = seq
+        checkpoint.updated_at = datetime.utcnow()
+
+    def _dead_letter(self, entry: PendingRecord, error: Exception):
+        """Move a rejected record to ingest_dead_letters, advancing the checkpoint past it"""
+        seq, user_id, received_at, record = entry
+        db = self.session_factory()
+        try:
+            db.add(IngestDeadLetter(
+                node=self.node_id,
+                seq=seq,
+                user_id=user_id,
+                record=json.dumps(record.model_dump(mode="json", exclude_none=True, warnings=False), default=str),
+                error=str(error)[:2000],
+                received_at=datetime.utcfromtimestamp(received_at)
+            ))
+            self._advance_checkpoint(db, seq)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        with self._cond:
+            self.dead_lettered += 1
+
+    def _insert(self, batch: List[PendingRecord]):
+        rows: Dict[str, List[Dict]] = {}
+        by_user: Dict[int, List[HealthDataCreate]] = {}
+        for _, user_id, received_at, record in batch:
+            by_user.setdefault(user_id, []).append(record)
+            model = HEALTH_RECORD_MODELS[record.data_type]
+            created_at = datetime.utcfromtimestamp(received_at)
+            rows.setdefault(record.data_type, []).append({
+                "user_id": user_id,
+                "date": record.date,
+                "notes": record.notes,
+                "created_at": created_at,
+                "updated_at": created_at,
+                **{field: getattr(record, field) for field in model.record_fields}
+            })
+
+        db = self.session_factory()
+        try:
+            # Before the inserts, so rows created here are built from the older records only
+            for user_id, user_records in by_user.items():
+                anomaly_detector.observe(db, user_id, user_records)
+                adherence_tracker.observe(db, user_id, user_records)
+            for data_type, data_type_rows in rows.items():
+                db.execute(insert(HEALTH_RECORD_MODELS[data_type]), data_type_rows)
+            self._advance_checkpoint(db, batch[-1][0])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def has_pending(self, user_id: int) -> bool:
+        return user_id in self._pending_users
+
+    def flush_user(self, user_id: int):
+        """Make a user's acknowledged records visible to reads"""
+        with self._cond:
+            if user_id not in self._pending_users:
+                return
+            target = self._durable_seq
+        if self._flushed_seq < target:
+            self.flush()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            lags = np.array(self._lags) if self._lags else None
+            oldest = self._pending[0][2] if self._pending else None
+            return {
+                "running": self.running,
+                "pending": len(self._pending),
+                "oldest_pending_seconds": time.time() - oldest if oldest else 0.0,
+                "segments": len(self._segments),
+                "appended": self.appended,
+                "fsyncs": self.fsyncs,
+                "records_per_fsync": self.appended / self.fsyncs if self.fsyncs else 0.0,
+                "flushed": self.flushed,
+                "flushes": self.flushes,
+                "replayed": self.replayed,
+                "dead_lettered": self.dead_lettered,
+                "last_flush_seconds": self.last_flush_seconds,
+                "lag_p50_seconds": float(np.percentile(lags, 50)) if lags is not None else None,
+                "lag_p99_seconds": float(np.percentile(lags, 99)) if lags is not None else None,
+            }
+
+
+ingest_buffer = IngestBuffer(
+    log_dir=settings.INGEST_LOG_DIR,
+    node_id=settings.INGEST_NODE_ID,
+    segment_bytes=settings.INGEST_SEGMENT_BYTES,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL_SECONDS,
+    flush_batch=settings.INGEST_FLUSH_BATCH,
+    max_pending=settings.INGEST_MAX_PENDING
+)
+metrics.register("ingest_buffer", ingest_buffer.stats)
+memory.register("ingest_buffer", lambda: {"pending_records": len(ingest_buffer._pending)})
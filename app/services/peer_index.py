@@ -0,0 +1,380 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.memory import array_bytes, memory
+from app.models.user_segment import UserSegment
+
+# Training sample size for the coarse quantizer
+QUANTIZER_SAMPLE = 100_000
+ASSIGN_CHUNK = 100_000
+# Vectors are stamped before their commit; replay this far back on load
+REPLAY_MARGIN = timedelta(minutes=5)
+
+
+class _IndexState:
+    """IVF layout: vectors grouped by coarse cell, CSR-style; only the stale mask changes after build
+
+    built_at is when the stored vectors it was built from were read (None:
+    unknown); vectors updated since then are replayed when it is loaded.
+    """
+
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        features: np.ndarray,
+        seed: int = 42,
+        built_at: Optional[datetime] = None
+    ):
+        self.built_at = built_at
+        self.mean = features.mean(axis=0)
+        scale = features.std(axis=0)
+        self.scale = np.where(scale > 0, scale, 1.0)
+        scaled = self.transform(features)
+
+        n = len(user_ids)
+        n_cells = int(np.clip(np.sqrt(n), 1, 4096)) if n >= 256 else 1
+        if n_cells > 1:
+            rng = np.random.default_rng(seed)
+            sample = scaled[rng.choice(n, min(n, QUANTIZER_SAMPLE), replace=False)]
+            quantizer = MiniBatchKMeans(
+                n_clusters=n_cells, batch_size=4096, n_init=1, max_iter=50, random_state=seed
+            ).fit(sample)
+            self.centroids = quantizer.cluster_centers_.astype(np.float32)
+        else:
+            self.centroids = scaled.mean(axis=0, keepdims=True) if n else np.zeros((1, features.shape[1]), np.float32)
+
+        cells = np.concatenate([
+            self._nearest_cells(scaled[start:start + ASSIGN_CHUNK], 1)[:, 0]
+            for start in range(0, n, ASSIGN_CHUNK)
+        ]) if n else np.zeros(0, dtype=np.int64)
+        order = np.argsort(cells, kind="stable")
+        self.offsets = np.searchsorted(cells[order], np.arange(len(self.centroids) + 1))
+        self.vectors = scaled[order]
+        self.features = features[order].astype(np.float32)
+        self.user_ids = user_ids[order]
+        self.stale = np.zeros(n, dtype=bool)
+
+        # Sorted id -> row lookup without a per-user Python dict
+        self._id_order = np.argsort(self.user_ids)
+        self._sorted_ids = self.user_ids[self._id_order]
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def transform(self, features: np.ndarray) -> np.ndarray:
+        return ((features - self.mean) / self.scale).astype(np.float32)
+
+    def _nearest_cells(self, vectors: np.ndarray, n: int) -> np.ndarray:
+        norms = (self.centroids ** 2).sum(axis=1)
+        distances = norms[None, :] - 2 * vectors @ self.centroids.T
+        if n >= distances.shape[1]:
+            return np.argsort(distances, axis=1)
+        return np.argpartition(distances, n, axis=1)[:, :n]
+
+    def row_of(self, user_id: int) -> Optional[int]:
+        i = np.searchsorted(self._sorted_ids, user_id)
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == user_id:
+            return int(self._id_order[i])
+        return None
+
+    def candidates(self, vector: np.ndarray, nprobe: int) -> np.ndarray:
+        """Rows in the nprobe cells closest to vector"""
+        cells = self._nearest_cells(vector[None, :], nprobe)[0]
+        return np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in cells])
+
+
+class PeerIndex:
+    """Approximate nearest-neighbour index over user feature vectors
+
+    Vectors live in an inverted-file (IVF) layout that is rebuilt periodically.
+    Inserts between rebuilds mark the user's old row stale and go to a small
+    delta buffer that is searched exhaustively, and is folded into a new,
+    persisted layout once it grows past max_delta. Loading a persisted index
+    replays the vectors stored since it was built into the delta. Without a
+    persisted index, one is built in the background; until then queries see
+    the delta only.
+    """
+
+    def __init__(
+        self,
+        index_path: str,
+        nprobe: int,
+        max_delta: int,
+        reload_seconds: float,
+        session_factory=SessionLocal
+    ):
+        self.index_path = index_path
+        self.nprobe = nprobe
+        self.max_delta = max_delta
+        self.reload_seconds = reload_seconds
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        # Held for the duration of a rebuild, so concurrent callers never run two
+        self._rebuild_lock = threading.Lock()
+        self._state: Optional[_IndexState] = None
+        self._delta: Dict[int, np.ndarray] = {}
+        self._loaded_mtime = None
+        self._checked_at = 0.0
+        self._compacting = False
+
+    def reset(self):
+        with self._lock:
+            self._state = None
+            self._delta = {}
+            self._loaded_mtime = None
+            self._checked_at = 0.0
+
+    @property
+    def size(self) -> int:
+        state = self._state
+        return (len(state) - int(state.stale.sum()) if state else 0) + len(self._delta)
+
+    def memory_footprint(self) -> Dict:
+        with self._lock:
+            state, delta = self._state, dict(self._delta)
+        return {
+            "users": self.size,
+            "index_bytes": array_bytes(state),
+            "delta_users": len(delta),
+            "delta_bytes": array_bytes(delta),
+        }
+
+    def build(self, user_ids, features) -> _IndexState:
+        """Build a fresh index from aligned user ids and unscaled feature vectors"""
+        state = _IndexState(
+            np.asarray(user_ids, dtype=np.int64),
+            np.asarray(features, dtype=np.float64).reshape(len(user_ids), -1)
+        )
+        with self._lock:
+            self._state = state
+            self._delta = {}
+        return state
+
+    def rebuild(self, db: Optional[Session] = None) -> Dict:
+        """Rebuild from every stored feature vector and persist the result, waiting for a running rebuild first"""
+        with self._rebuild_lock:
+            return self._rebuild(db)
+
+    def start_rebuild(self) -> bool:
+        """Rebuild in a background thread; False when a rebuild is already running"""
+        if not self._rebuild_lock.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self._rebuild()
+            except Exception as e:
+                print(f"Could not rebuild peer index: {e}")
+            finally:
+                self._rebuild_lock.release()
+
+        threading.Thread(target=run, name="peer-index-rebuild", daemon=True).start()
+        return True
+
+    def _rebuild(self, db: Optional[Session] = None) -> Dict:
+        started = time.perf_counter()
+        built_at = datetime.utcnow()
+        with self._lock:
+            delta = dict(self._delta)
+        if db is None:
+            own_db = self.session_factory()
+            try:
+                rows = own_db.query(UserSegment.user_id, UserSegment.features).all()
+            finally:
+                own_db.close()
+        else:
+            rows = db.query(UserSegment.user_id, UserSegment.features).all()
+        if not rows:
+            return {"users": 0, "seconds": 0.0}
+        state = _IndexState(
+            np.array([user_id for user_id, _ in rows], dtype=np.int64),
+            np.array([features for _, features in rows], dtype=np.float64),
+            built_at=built_at
+        )
+        with self._lock:
+            for user_id, vector in list(self._delta.items()):
+                row = state.row_of(user_id)
+                if row is None:
+                    # Not stored yet when the rows were read
+                    continue
+                if delta.get(user_id) is vector:
+                    del self._delta[user_id]
+                else:
+                    # Inserted while rebuilding
+                    state.stale[row] = True
+            self._state = state
+        self.save()
+        return {"users": len(rows), "seconds": time.perf_counter() - started}
+
+    def compact(self):
+        """Fold the delta buffer into a new IVF layout and persist it"""
+        with self._lock:
+            state, delta = self._state, dict(self._delta)
+        ids, features = [], []
+        if state is not None:
+            live = ~state.stale
+            ids.append(state.user_ids[live])
+            features.append(state.features[live])
+        if delta:
+            ids.append(np.fromiter(delta.keys(), dtype=np.int64, count=len(delta)))
+            features.append(np.vstack(list(delta.values())))
+        try:
+            if ids:
+                # Other workers' inserts are not in this delta; loading the file replays them
+                new_state = _IndexState(
+                    np.concatenate(ids), np.vstack(features), built_at=getattr(state, "built_at", None)
+                )
+                with self._lock:
+                    # Keep inserts that arrived while compacting
+                    for user_id, vector in list(self._delta.items()):
+                        if delta.get(user_id) is vector:
+                            del self._delta[user_id]
+                        else:
+                            row = new_state.row_of(user_id)
+                            if row is not None:
+                                new_state.stale[row] = True
+                    self._state = new_state
+                self.save()
+        except Exception as e:
+            print(f"Could not compact peer index: {e}")
+        finally:
+            self._compacting = False
+
+    def insert(self, user_id: int, features: np.ndarray):
+        """Add or replace one user's vector"""
+        with self._lock:
+            state = self._state
+            if state is not None:
+                row = state.row_of(user_id)
+                if row is not None:
+                    state.stale[row] = True
+            self._delta[user_id] = np.asarray(features, dtype=np.float64).ravel()
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        with self._lock:
+            start_compaction = len(self._delta) > self.max_delta and not self._compacting
+            if start_compaction:
+                self._compacting = True
+        if start_compaction:
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def _stored_since(self, since: Optional[datetime]) -> List[Tuple[int, list]]:
+        """Stored vectors updated since a time (all of them for None)"""
+        db = self.session_factory()
+        try:
+            query = db.query(UserSegment.user_id, UserSegment.features)
+            if since is not None:
+                query = query.filter(UserSegment.updated_at >= since - REPLAY_MARGIN)
+            return query.all()
+        finally:
+            db.close()
+
+    def save(self):
+        with self._lock:
+            state = self._state
+        if state is None:
+            return
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        joblib.dump(state, tmp_path)
+        os.replace(tmp_path, self.index_path)
+        self._loaded_mtime = os.path.getmtime(self.index_path)
+
+    def ensure_ready(self, background: bool = True) -> bool:
+        """Load the persisted index, reloading it after an external rebuild; True once there is an index
+
+        Without a persisted index, one is rebuilt from the stored feature
+        vectors, in a background thread unless background is False.
+        """
+        now = time.monotonic()
+        if self._state is not None and now - self._checked_at < self.reload_seconds:
+            return True
+        self._checked_at = now
+        if os.path.exists(self.index_path):
+            mtime = os.path.getmtime(self.index_path)
+            if mtime != self._loaded_mtime:
+                state = joblib.load(self.index_path)
+                # Files written before built_at was recorded: their mtime is a later bound
+                since = state.built_at if hasattr(state, "built_at") else datetime.utcfromtimestamp(mtime)
+                replayed = self._stored_since(since)
+                with self._lock:
+                    for user_id, features in replayed:
+                        # The delta may hold a newer vector than the committed one
+                        self._delta.setdefault(user_id, np.asarray(features, dtype=np.float64))
+                    for user_id in self._delta:
+                        row = state.row_of(user_id)
+                        if row is not None:
+                            state.stale[row] = True
+                    self._state = state
+                    self._loaded_mtime = mtime
+                self._maybe_compact()
+        elif self._state is None:
+            if background:
+                self.start_rebuild()
+            else:
+                self.rebuild()
+        return self._state is not None
+
+    def query(
+        self,
+        features: np.ndarray,
+        k: int,
+        exclude_user_id: Optional[int] = None
+    ) -> List[Tuple[int, float, np.ndarray]]:
+        """k nearest users as (user_id, distance, unscaled features)"""
+        with self._lock:
+            state = self._state
+            delta = list(self._delta.items())
+        if state is None:
+            if not delta:
+                return []
+            state = _IndexState(
+                np.array([user_id for user_id, _ in delta], dtype=np.int64),
+                np.vstack([vector for _, vector in delta])
+            )
+            delta = []
+
+        vector = state.transform(np.asarray(features, dtype=np.float64).ravel())
+        rows = state.candidates(vector, self.nprobe)
+        rows = rows[~state.stale[rows]]
+        if exclude_user_id is not None:
+            rows = rows[state.user_ids[rows] != exclude_user_id]
+
+        ids = state.user_ids[rows]
+        raw = state.features[rows]
+        distances = ((state.vectors[rows] - vector) ** 2).sum(axis=1)
+        delta = [(user_id, v) for user_id, v in delta if user_id != exclude_user_id]
+        if delta:
+            delta_raw = np.vstack([v for _, v in delta])
+            ids = np.concatenate([ids, [user_id for user_id, _ in delta]])
+            raw = np.vstack([raw, delta_raw])
+            distances = np.concatenate([distances, ((state.transform(delta_raw) - vector) ** 2).sum(axis=1)])
+
+        if len(distances) > k:
+            top = np.argpartition(distances, k)[:k]
+        else:
+            top = np.arange(len(distances))
+        top = top[np.argsort(distances[top])]
+        return [(int(ids[i]), float(np.sqrt(distances[i])), raw[i]) for i in top]
+
+
+peer_index = PeerIndex(
+    index_path=settings.PEER_INDEX_PATH,
+    nprobe=settings.PEER_INDEX_NPROBE,
+    max_delta=settings.PEER_INDEX_MAX_DELTA,
+    reload_seconds=settings.PEER_INDEX_RELOAD_SECONDS
+)
+memory.register("peer_index", peer_index.memory_footprint)
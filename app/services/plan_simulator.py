@@ -0,0 +1,135 @@
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.health_data import HealthPlan
+from app.models.user import User
+from app.schemas.health_data import PlanSimulationRequest
+from app.services.ai_service import get_ai_service
+
+# Energy stored in a kilogram of body weight
+KCAL_PER_KG = 7700
+# Moderate exercise (6 MET): 6 * 3.5 ml O2/kg/min at ~5 kcal per litre
+EXERCISE_KCAL_PER_KG_MINUTE = 0.105
+
+
+def project(
+    start_weight: float,
+    multiplier: float,
+    offset: float,
+    exercise_minutes: np.ndarray,
+    weekly_days: np.ndarray,
+    calories: np.ndarray,
+    duration_days: int
+) -> Dict[str, np.ndarray]:
+    """Daily weight and calorie balance of each scenario, as (scenarios, days) arrays
+
+    Expenditure is multiplier * (10 * weight + offset), the activity-adjusted
+    Mifflin-St Jeor BMR, plus exercise on the first weekly_days days of each
+    week; both follow the projected weight. All scenarios advance together,
+    one vectorised step per day.
+    """
+    n = len(calories)
+    exercise_days = (np.arange(duration_days) % 7)[None, :] < weekly_days[:, None]
+    exercise_rate = EXERCISE_KCAL_PER_KG_MINUTE * exercise_minutes[:, None] * exercise_days
+    weight = np.empty((n, duration_days))
+    balance = np.empty((n, duration_days))
+    current = np.full(n, float(start_weight))
+    for day in range(duration_days):
+        expenditure = multiplier * (10 * current + offset) + exercise_rate[:, day] * current
+        np.subtract(calories, expenditure, out=balance[:, day])
+        current = current + balance[:, day] / KCAL_PER_KG
+        weight[:, day] = current
+    return {"weight": weight, "calorie_balance": balance}
+
+
+class PlanSimulator:
+    """What-if projections of a plan's parameters over its duration"""
+
+    def __init__(self, max_scenarios: int, max_days: int):
+        self.max_scenarios = max_scenarios
+        self.max_days = max_days
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.scenarios = 0
+        self.seconds = 0.0
+
+    @staticmethod
+    def _grid(values: Sequence, plan_value, default) -> np.ndarray:
+        if values:
+            return np.unique(np.asarray(values, dtype=np.float64))
+        return np.array([plan_value if plan_value is not None else default], dtype=np.float64)
+
+    def simulate(self, user: User, request: PlanSimulationRequest, plan: Optional[HealthPlan] = None) -> Dict:
+        """Project every combination of the request's grids for user"""
+        coefficients = get_ai_service().bmr_coefficients(user)
+        if coefficients is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Weight, height and date of birth are required for projections"
+            )
+        multiplier, offset = coefficients
+        maintenance = multiplier * (10 * user.weight + offset)
+
+        duration_days = request.duration_days or (plan and plan.duration_days) or 30
+        if duration_days > self.max_days:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"duration_days is limited to {self.max_days}"
+            )
+        minutes = self._grid(request.exercise_minutes_per_day, plan and plan.exercise_minutes_per_day, 0)
+        days = self._grid(request.weekly_exercise_days, plan and plan.weekly_exercise_days, 0)
+        calories = self._grid(request.calories_target, plan and plan.calories_target, round(maintenance))
+        count = len(minutes) * len(days) * len(calories)
+        if count > self.max_scenarios:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{count} scenarios requested, at most {self.max_scenarios} allowed"
+            )
+
+        started = time.perf_counter()
+        minutes, days, calories = (grid.ravel() for grid in np.meshgrid(minutes, days, calories, indexing="ij"))
+        projection = project(user.weight, multiplier, offset, minutes, days, calories, duration_days)
+        final_weight = projection["weight"][:, -1]
+        result = {
+            "start_weight": user.weight,
+            "maintenance_calories": round(maintenance, 1),
+            "duration_days": duration_days,
+            "scenarios": count,
+            "exercise_minutes_per_day": minutes.tolist(),
+            "weekly_exercise_days": days.astype(int).tolist(),
+            "calories_target": calories.tolist(),
+            "final_weight": np.round(final_weight, 2).tolist(),
+            "weight_change": np.round(final_weight - user.weight, 2).tolist(),
+            "average_daily_balance": np.round(projection["calorie_balance"].mean(axis=1), 1).tolist(),
+        }
+        if request.trajectories:
+            result["weight"] = np.round(projection["weight"], 2).tolist()
+            result["calorie_balance"] = np.round(projection["calorie_balance"], 1).tolist()
+
+        with self._lock:
+            self.runs += 1
+            self.scenarios += count
+            self.seconds += time.perf_counter() - started
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "scenarios": self.scenarios,
+                "seconds": self.seconds,
+                "scenarios_per_second": self.scenarios / self.seconds if self.seconds else 0.0,
+            }
+
+
+plan_simulator = PlanSimulator(
+    max_scenarios=settings.SIMULATION_MAX_SCENARIOS,
+    max_days=settings.SIMULATION_MAX_DAYS
+)
+metrics.register("plan_simulator", plan_simulator.stats)
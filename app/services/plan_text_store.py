@@ -0,0 +1,167 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core.config import settings
+from app.core.memory import memory
+from app.core.metrics import metrics
+from app.models.plan_text import PLAN_TEXT_FIELDS, HealthPlanText, PlanTextBlob
+
+# Dialects with INSERT ... ON CONFLICT DO NOTHING
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+# Session.info key of blobs written in the session's transaction, interned once it commits
+PENDING_BLOBS = "plan_text_blobs"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class PlanTextStore:
+    """Content-addressed storage of health plan text
+
+    Generated plans share a handful of templates, so their text fields are
+    stored once per distinct content in plan_text_blobs and referenced by
+    hash from health_plan_texts. Hot blobs are interned in an LRU of at most
+    max_bytes: plans built into responses share one string per blob, and
+    cached blobs are known to exist, so saving them needs no query. Blobs
+    written by a transaction are only interned once it commits. Plans
+    written before the blob tables (without a health_plan_texts row) keep
+    their text inline and are read as before.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._blobs: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.blobs_written = 0
+
+    def _cached(self, hashes: Iterable[str]) -> Dict[str, str]:
+        found = {}
+        with self._lock:
+            for blob_hash in hashes:
+                text = self._blobs.get(blob_hash)
+                if text is not None:
+                    self._blobs.move_to_end(blob_hash)
+                    found[blob_hash] = text
+            return found
+
+    def _intern(self, blobs: Dict[str, str]):
+        with self._lock:
+            for blob_hash, text in blobs.items():
+                if blob_hash not in self._blobs:
+                    self._blobs[blob_hash] = text
+                    self._bytes += len(text)
+            while self._bytes > self.max_bytes and self._blobs:
+                _, text = self._blobs.popitem(last=False)
+                self._bytes -= len(text)
+
+    def _write_blobs(self, db: Session, blobs: Dict[str, str]):
+        cached = self._cached(blobs)
+        missing = {blob_hash: text for blob_hash, text in blobs.items() if blob_hash not in cached}
+        if missing:
+            existing = set(db.scalars(select(PlanTextBlob.hash).where(PlanTextBlob.hash.in_(list(missing)))))
+            rows = [
+                {"hash": blob_hash, "text": text, "size": len(text.encode())}
+                for blob_hash, text in missing.items() if blob_hash not in existing
+            ]
+            if rows:
+                dialect_insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+                if dialect_insert is not None:
+                    # Another request may store the same text concurrently
+                    db.execute(dialect_insert(PlanTextBlob).on_conflict_do_nothing(index_elements=["hash"]), rows)
+                else:
+                    db.execute(insert(PlanTextBlob), rows)
+                with self._lock:
+                    self.blobs_written += len(rows)
+        db.info.setdefault(PENDING_BLOBS, {}).update(blobs)
+
+    def save(self, db: Session, plan, texts: Dict[str, Optional[str]]):
+        """Store a flushed plan's text fields as blobs and clear its inline columns; the caller commits"""
+        hashes = {field: text_hash(text) if text is not None else None for field, text in texts.items()}
+        self._write_blobs(db, {hashes[field]: text for field, text in texts.items() if text is not None})
+        db.merge(HealthPlanText(plan_id=plan.id, **{f"{field}_hash": hashes.get(field) for field in PLAN_TEXT_FIELDS}))
+        for field in PLAN_TEXT_FIELDS:
+            setattr(plan, field, None)
+
+    def hydrate(self, db: Session, plans: List) -> List:
+        """Fill plans' text fields from their blobs, without marking them modified"""
+        if not plans:
+            return plans
+        links = {
+            link.plan_id: link
+            for link in db.query(HealthPlanText).filter(HealthPlanText.plan_id.in_([plan.id for plan in plans]))
+        }
+        if not links:
+            return plans
+        hashes = {
+            getattr(link, f"{field}_hash") for link in links.values() for field in PLAN_TEXT_FIELDS
+        } - {None}
+        texts = self._cached(hashes)
+        missing = hashes - texts.keys()
+        with self._lock:
+            self.hits += len(texts)
+            self.misses += len(missing)
+        if missing:
+            loaded = dict(db.execute(select(PlanTextBlob.hash, PlanTextBlob.text).where(PlanTextBlob.hash.in_(list(missing)))).all())
+            self._intern(loaded)
+            texts.update(loaded)
+
+        for plan in plans:
+            link = links.get(plan.id)
+            if link is None:
+                continue
+            for field in PLAN_TEXT_FIELDS:
+                blob_hash = getattr(link, f"{field}_hash")
+                set_committed_value(plan, field, texts.get(blob_hash) if blob_hash else None)
+        return plans
+
+    def clear(self):
+        with self._lock:
+            self._blobs.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "interned": len(self._blobs),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "blobs_written": self.blobs_written,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+plan_text_store = PlanTextStore(max_bytes=settings.PLAN_TEXT_CACHE_MAX_BYTES)
+
+
+@event.listens_for(Session, "after_commit")
+def _intern_committed_blobs(session: Session):
+    blobs = session.info.pop(PENDING_BLOBS, None)
+    if blobs:
+        plan_text_store._intern(blobs)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_uncommitted_blobs(session: Session, transaction):
+    # A rolled-back insert must not leave its blobs looking stored
+    if transaction.parent is None:
+        session.info.pop(PENDING_BLOBS, None)
+
+
+metrics.register("plan_text", plan_text_store.stats)
+memory.register("plan_text", lambda: {
+    key: value for key, value in plan_text_store.stats().items() if key in ("interned", "bytes", "max_bytes")
+})
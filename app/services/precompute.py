@@ -0,0 +1,324 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, union, update
+from sqlalchemy.exc import IntegrityError
+
+from app.core.cache import user_tag
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.metrics import metrics
+from app.core.profiling import run_in_threadpool
+from app.models.health_records import HEALTH_RECORD_MODELS
+from app.models.precompute_checkpoint import PrecomputeCheckpoint
+from app.services.ai_service import get_ai_service
+from app.services.anomaly_detector import anomaly_detector
+from app.services.health_data_service import HealthDataService, statistics_cache
+from app.services.recommendation_service import RecommendationService, recommendation_cache
+
+
+class PrecomputeScheduler:
+    """Precomputes analyses, statistics and recommendations for recently active users
+
+    Runs once a day at run_at (server local time, "HH:MM"), ahead of peak
+    hours, and fills the caches the endpoints read first. Users are processed
+    in id order and progress is checkpointed after every batch, so an
+    interrupted run resumes where it stopped. A lease on the checkpoint row
+    keeps one runner across workers and hosts. Work is paced to
+    max_users_per_second and pauses while online requests hold
+    busy_connections or more database connections.
+    """
+
+    JOB = "daily"
+
+    def __init__(
+        self,
+        run_at: str,
+        active_days: int,
+        batch_size: int,
+        concurrency: int,
+        max_users_per_second: float,
+        busy_connections: int,
+        ttl_seconds: float,
+        statistics_days: int = 7,
+        lease_seconds: float = 300
+    ):
+        hour, minute = run_at.split(":")
+        self.run_at = (int(hour), int(minute))
+        self.active_days = active_days
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_users_per_second = max_users_per_second
+        self.busy_connections = busy_connections
+        self.ttl_seconds = ttl_seconds
+        self.statistics_days = statistics_days
+        self.lease_seconds = lease_seconds
+        self.session_factory = SessionLocal
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        # Connections held by our own worker threads, not counted as online load
+        self._own_connections = 0
+        self.running = False
+        self.runs = 0
+        self.users = 0
+        self.errors = 0
+        self.throttled_seconds = 0.0
+        self.last_run_date: Optional[date] = None
+        self.last_run_seconds: Optional[float] = None
+
+    @property
+    def owner(self) -> str:
+        # Evaluated on use: pre-fork workers share the parent's object
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    # Scheduling
+
+    def next_run(self, now: datetime) -> datetime:
+        scheduled = now.replace(hour=self.run_at[0], minute=self.run_at[1], second=0, microsecond=0)
+        return scheduled if scheduled > now else scheduled + timedelta(days=1)
+
+    async def run_forever(self):
+        """Run today's job if it is due or unfinished, then once a day
+
+        When another runner holds the lease of an unfinished run, retry once
+        the lease expires: the runner may have died, and its replacement (with
+        a new owner id) picks the run up from the checkpoint.
+        """
+        while True:
+            now = datetime.now()
+            delay = (self.next_run(now) - now).total_seconds()
+            if now >= now.replace(hour=self.run_at[0], minute=self.run_at[1], second=0, microsecond=0):
+                try:
+                    report = await self.run()
+                    if report.get("retry_at"):
+                        retry = (datetime.fromisoformat(report["retry_at"]) - datetime.utcnow()).total_seconds()
+                        delay = min(delay, max(retry, 1.0))
+                except Exception as e:
+                    print(f"Could not precompute recommendations: {e}")
+                    delay = (self.next_run(datetime.now()) - datetime.now()).total_seconds()
+            await asyncio.sleep(delay)
+
+    def start(self):
+        """Start the daily schedule on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # Checkpoint and lease
+
+    def _claim(self, run_date: date, force: bool) -> Tuple[Optional[int], Optional[datetime]]:
+        """Take the lease
+
+        Returns the user id to resume after, or None when there is nothing to
+        do, together with the expiry of the lease when another runner holds it.
+        """
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            if db.get(PrecomputeCheckpoint, self.JOB) is None:
+                try:
+                    db.add(PrecomputeCheckpoint(job=self.JOB, run_date=run_date))
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+            claimed = db.execute(
+                update(PrecomputeCheckpoint)
+                .where(PrecomputeCheckpoint.job == self.JOB)
+                .where(
+                    (PrecomputeCheckpoint.lease_expires_at.is_(None))
+                    | (PrecomputeCheckpoint.lease_expires_at < now)
+                    | (PrecomputeCheckpoint.lease_owner == self.owner)
+                )
+                .values(lease_owner=self.owner, lease_expires_at=now + timedelta(seconds=self.lease_seconds))
+            ).rowcount
+            db.commit()
+            if not claimed:
+                return None, db.get(PrecomputeCheckpoint, self.JOB).lease_expires_at
+
+            checkpoint = db.get(PrecomputeCheckpoint, self.JOB)
+            if checkpoint.run_date != run_date or force:
+                checkpoint.run_date = run_date
+                checkpoint.last_user_id = 0
+                checkpoint.users_done = 0
+                checkpoint.completed = False
+            elif checkpoint.completed:
+                checkpoint.lease_owner = None
+                checkpoint.lease_expires_at = None
+                db.commit()
+                return None, None
+            db.commit()
+            return checkpoint.last_user_id, None
+        finally:
+            db.close()
+
+    def _checkpoint(self, last_user_id: int, users_done: int, completed: bool = False):
+        """Record progress and renew the lease; raises if another runner took it over"""
+        db = self.session_factory()
+        try:
+            values = {
+                "last_user_id": last_user_id,
+                "users_done": PrecomputeCheckpoint.users_done + users_done,
+                "completed": completed,
+                "lease_expires_at": datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+            }
+            if completed:
+                values.update(lease_owner=None, lease_expires_at=None)
+            updated = db.execute(
+                update(PrecomputeCheckpoint)
+                .where(PrecomputeCheckpoint.job == self.JOB, PrecomputeCheckpoint.lease_owner == self.owner)
+                .values(**values)
+            ).rowcount
+            db.commit()
+            if not updated:
+                raise RuntimeError("Precomputation lease lost to another runner")
+        finally:
+            db.close()
+
+    # Work
+
+    def _active_users(self, after: int, limit: int) -> List[int]:
+        """Ids of users with health records in the last active_days, in id order"""
+        cutoff = date.today() - timedelta(days=self.active_days)
+        users = union(*[
+            select(model.user_id).where(model.user_id > after, model.date >= cutoff)
+            for model in HEALTH_RECORD_MODELS.values()
+        ]).subquery()
+        db = self.session_factory()
+        try:
+            return list(db.execute(select(users.c.user_id).order_by(users.c.user_id).limit(limit)).scalars())
+        finally:
+            db.close()
+
+    def _online_connections(self) -> int:
+        pool = getattr(self.session_factory.kw.get("bind"), "pool", None)
+        if pool is None or not hasattr(pool, "checkedout"):
+            return 0
+        with self._lock:
+            return max(0, pool.checkedout() - self._own_connections)
+
+    async def _wait_for_capacity(self):
+        """Yield to online traffic while it is using the database"""
+        while self._online_connections() >= self.busy_connections:
+            await asyncio.sleep(0.5)
+            with self._lock:
+                self.throttled_seconds += 0.5
+
+    def _analyze(self, user_id: int) -> Tuple[Dict, Dict, List[Dict]]:
+        with self._lock:
+            self._own_connections += 1
+        db = self.session_factory()
+        try:
+            analysis = get_ai_service().analyze_health_data(db, user_id)
+            statistics = HealthDataService.get_health_data_statistics(db, user_id, self.statistics_days)
+            return analysis, statistics, anomaly_detector.recommendations(db, user_id)
+        finally:
+            db.close()
+            with self._lock:
+                self._own_connections -= 1
+
+    async def _process_batch(self, user_ids: List[int], semaphore: asyncio.Semaphore) -> int:
+        async def compute(user_id: int):
+            async with semaphore:
+                await self._wait_for_capacity()
+                # Read before computing, so a write during the computation invalidates the result
+                versions = await recommendation_cache.tag_versions([user_tag(user_id)])
+                try:
+                    return user_id, versions, await run_in_threadpool(self._analyze, user_id)
+                except Exception as e:
+                    print(f"Could not precompute for user {user_id}: {e}")
+                    with self._lock:
+                        self.errors += 1
+                    return None
+
+        results = [result for result in await asyncio.gather(*map(compute, user_ids)) if result is not None]
+        recommendations = RecommendationService.generate_recommendations_batch(
+            [analysis for _, _, (analysis, _, _) in results]
+        )
+        for (user_id, versions, (analysis, statistics, anomalies)), user_recommendations in zip(results, recommendations):
+            await recommendation_cache.set(
+                user_id,
+                {"user_id": user_id, "analysis": analysis, "recommendations": anomalies + user_recommendations},
+                ttl=self.ttl_seconds,
+                versions=versions
+            )
+            await statistics_cache.set(
+                f"{user_id}:{self.statistics_days}", statistics, ttl=self.ttl_seconds, versions=versions
+            )
+        return len(results)
+
+    async def run(self, run_date: Optional[date] = None, force: bool = False) -> Dict:
+        """Process the day's active users, resuming from the checkpoint"""
+        run_date = run_date or date.today()
+        after, lease_expires_at = await run_in_threadpool(self._claim, run_date, force)
+        if after is None:
+            report = {"run_date": str(run_date), "skipped": True}
+            if lease_expires_at is not None:
+                report["retry_at"] = lease_expires_at.isoformat()
+            return report
+
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self.running = True
+        done = 0
+        try:
+            while True:
+                user_ids = await run_in_threadpool(self._active_users, after, self.batch_size)
+                if not user_ids:
+                    break
+                batch_started = time.perf_counter()
+                done += await self._process_batch(user_ids, semaphore)
+                after = user_ids[-1]
+                await run_in_threadpool(self._checkpoint, after, len(user_ids))
+                # Pace to max_users_per_second
+                if self.max_users_per_second > 0:
+                    pause = len(user_ids) / self.max_users_per_second - (time.perf_counter() - batch_started)
+                    if pause > 0:
+                        await asyncio.sleep(pause)
+            await run_in_threadpool(self._checkpoint, after, 0, True)
+        finally:
+            self.running = False
+            with self._lock:
+                self.users += done
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.runs += 1
+            self.last_run_date = run_date
+            self.last_run_seconds = elapsed
+        return {"run_date": str(run_date), "skipped": False, "users": done, "seconds": elapsed}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "runs": self.runs,
+                "users": self.users,
+                "errors": self.errors,
+                "throttled_seconds": self.throttled_seconds,
+                "last_run_date": str(self.last_run_date) if self.last_run_date else None,
+                "last_run_seconds": self.last_run_seconds,
+            }
+
+
+precompute_scheduler = PrecomputeScheduler(
+    run_at=settings.PRECOMPUTE_AT,
+    active_days=settings.PRECOMPUTE_ACTIVE_DAYS,
+    batch_size=settings.PRECOMPUTE_BATCH_SIZE,
+    concurrency=settings.PRECOMPUTE_CONCURRENCY,
+    max_users_per_second=settings.PRECOMPUTE_MAX_USERS_PER_SECOND,
+    busy_connections=settings.PRECOMPUTE_BUSY_CONNECTIONS,
+    ttl_seconds=settings.PRECOMPUTE_TTL_SECONDS
+)
+metrics.register("precompute", precompute_scheduler.stats)
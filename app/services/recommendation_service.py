@@ -0,0 +1,38 @@
+from typing import Dict, List
+
+from sqlalchemy.orm import Session
+
+from app.core.cache import get_cache
+from app.core.config import settings
+from app.services.ai_service import get_ai_service
+from app.services.anomaly_detector import anomaly_detector
+from app.services.rule_engine import rule_sets
+
+
+class RecommendationService:
+    @staticmethod
+    def generate_recommendations(analysis: Dict) -> List[Dict]:
+        """Rule-based recommendations for one health data analysis"""
+        return rule_sets["recommendations"].evaluate(analysis)
+
+    @staticmethod
+    def generate_recommendations_batch(analyses: List[Dict]) -> List[List[Dict]]:
+        """Rule-based recommendations for many analyses in one vectorized pass"""
+        return rule_sets["recommendations"].evaluate_batch(analyses)
+
+    @staticmethod
+    def get_recommendations(db: Session, user_id: int) -> Dict:
+        """Analyze a user's health data and generate recommendations, recent anomalies first"""
+        analysis = get_ai_service().analyze_health_data(db, user_id)
+        return {
+            "user_id": user_id,
+            "analysis": analysis,
+            "recommendations": (
+                anomaly_detector.recommendations(db, user_id)
+                + RecommendationService.generate_recommendations(analysis)
+            )
+        }
+
+
+# Per-user results, invalidated through the user's cache tag on profile or health data writes
+recommendation_cache = get_cache("recommendations", settings.RECOMMENDATION_CACHE_TTL_SECONDS)
@@ -0,0 +1,177 @@
+import json
+import string
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+
+COMPARISONS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+MEMBERSHIP = "in"
+# Code for string values no rule mentions
+UNKNOWN_CODE = -1.0
+
+
+class RuleSet:
+    """Declarative rules compiled into vectorized condition checks
+
+    Each rule holds a "when" list of conditions on context fields, all of which
+    must hold, and a message template; any other keys are copied to the output.
+    String-valued fields are compared through integer codes, so a whole batch
+    of contexts is evaluated as one float matrix.
+    """
+
+    def __init__(self, rules: List[Dict]):
+        self.rules = rules
+        self.fields: List[str] = []
+        self.vocab: Dict[str, Dict[str, float]] = {}
+        self._outputs = []
+        self._templates = []
+
+        field_index: Dict[str, int] = {}
+        field_kinds: Dict[str, type] = {}
+        cond_field, cond_value, cond_op, cond_rule = [], [], [], []
+        memberships = []
+        for r, rule in enumerate(rules):
+            rule_id = rule.get("id", r)
+            if "message" not in rule:
+                raise ValueError(f"Rule {rule_id}: missing message")
+            for condition in rule.get("when", []):
+                field, op, value = condition.get("field"), condition.get("op"), condition.get("value")
+                if op not in COMPARISONS and op != MEMBERSHIP:
+                    raise ValueError(f"Rule {rule_id}: unknown operator {op!r}")
+                if field not in field_index:
+                    field_index[field] = len(self.fields)
+                    self.fields.append(field)
+                if op == MEMBERSHIP and not isinstance(value, list):
+                    raise ValueError(f"Rule {rule_id}: in needs a list of values")
+                values = value if op == MEMBERSHIP else [value]
+                kinds = {str if isinstance(v, str) else float for v in values}
+                if not values or len(kinds) > 1 or any(v is None or isinstance(v, bool) for v in values):
+                    raise ValueError(f"Rule {rule_id}: invalid value for {field}")
+                kind = kinds.pop()
+                if field_kinds.setdefault(field, kind) is not kind:
+                    raise ValueError(f"Rule {rule_id}: {field} compared with both numbers and strings")
+                if kind is str:
+                    if op not in ("==", "!=", MEMBERSHIP):
+                        raise ValueError(f"Rule {rule_id}: strings only support ==, != and in")
+                    vocab = self.vocab.setdefault(field, {})
+                    codes = [vocab.setdefault(v, float(len(vocab))) for v in values]
+                else:
+                    codes = [float(v) for v in values]
+                if op == MEMBERSHIP:
+                    memberships.append((len(cond_field), kind, codes))
+                cond_field.append(field_index[field])
+                cond_value.append(codes[0])
+                cond_op.append(op)
+                cond_rule.append(r)
+            self._outputs.append({key: v for key, v in rule.items() if key not in ("id", "when", "message")})
+            self._templates.append((rule["message"], self._has_placeholders(rule["message"])))
+
+        self._cond_field = np.array(cond_field, dtype=np.intp)
+        self._cond_value = np.array(cond_value, dtype=np.float64)
+        cond_op = np.array(cond_op, dtype=object)
+        self._op_groups = [
+            (func, np.flatnonzero(cond_op == op))
+            for op, func in COMPARISONS.items()
+            if np.any(cond_op == op)
+        ]
+        # Each rule gets the same number of condition slots; unused slots always pass
+        self.slots = max((len(rule.get("when", [])) for rule in rules), default=0)
+        cond_rule = np.array(cond_rule, dtype=np.intp)
+        first = np.searchsorted(cond_rule, cond_rule)
+        self._cond_slot = cond_rule * self.slots + (np.arange(len(cond_rule)) - first)
+
+        # String memberships become one lookup table indexed by (code + 1, condition);
+        # row 0 holds unknown and missing values
+        string_members = [(i, codes) for i, kind, codes in memberships if kind is str]
+        self._member_index = np.array([i for i, _ in string_members], dtype=np.intp)
+        width = max((len(vocab) for vocab in self.vocab.values()), default=0) + 1
+        self._member_table = np.zeros((width, len(string_members)), dtype=bool)
+        for j, (_, codes) in enumerate(string_members):
+            self._member_table[np.array(codes, dtype=np.intp) + 1, j] = True
+        self._numeric_members = [(i, np.array(codes)) for i, kind, codes in memberships if kind is not str]
+        self._row_encoders = [(j, self.vocab.get(field)) for j, field in enumerate(self.fields)]
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    @staticmethod
+    def _has_placeholders(template: str) -> bool:
+        return any(name is not None for _, name, _, _ in string.Formatter().parse(template))
+
+    def _encode(self, field: str, values: Sequence) -> np.ndarray:
+        vocab = self.vocab.get(field)
+        if vocab is None:
+            return np.array(values, dtype=np.float64)
+        return np.array([vocab.get(v, UNKNOWN_CODE) for v in values], dtype=np.float64)
+
+    def matrix(self, columns: Dict[str, Sequence], n: int) -> np.ndarray:
+        """Encode per-field columns of n contexts into an n x fields matrix; absent fields are NaN"""
+        X = np.full((n, len(self.fields)), np.nan)
+        for j, field in enumerate(self.fields):
+            if field in columns:
+                X[:, j] = self._encode(field, columns[field])
+        return X
+
+    def evaluate_matrix(self, X: np.ndarray) -> np.ndarray:
+        """Boolean n x rules mask of the rules each encoded context satisfies"""
+        # Conditions x contexts, so every gather below copies contiguous rows
+        values = np.ascontiguousarray(X.T)[self._cond_field]
+        passed = np.empty(values.shape, dtype=bool)
+        for func, indices in self._op_groups:
+            passed[indices] = func(values[indices], self._cond_value[indices, None])
+        if len(self._member_index):
+            codes = values[self._member_index]
+            rows = np.where(np.isnan(codes), 0, codes + 1).astype(np.intp)
+            passed[self._member_index] = self._member_table[rows, np.arange(len(self._member_index))[:, None]]
+        for index, codes in self._numeric_members:
+            passed[index] = np.isin(values[index], codes)
+
+        slots = np.ones((len(self.rules) * self.slots, X.shape[0]), dtype=bool)
+        slots[self._cond_slot] = passed
+        return slots.reshape(len(self.rules), self.slots, X.shape[0]).all(axis=1).T
+
+    def render(self, index: int, context: Dict) -> Dict:
+        """Output of one matched rule for a context"""
+        template, has_placeholders = self._templates[index]
+        output = dict(self._outputs[index])
+        output["message"] = template.format_map(context) if has_placeholders else template
+        return output
+
+    def evaluate(self, context: Dict) -> List[Dict]:
+        """Outputs of the rules one context satisfies, in rule order"""
+        X = np.full((1, len(self.fields)), np.nan)
+        for j, vocab in self._row_encoders:
+            value = context.get(self.fields[j])
+            if vocab is not None:
+                X[0, j] = vocab.get(value, UNKNOWN_CODE)
+            elif value is not None:
+                X[0, j] = value
+        return [self.render(i, context) for i in np.flatnonzero(self.evaluate_matrix(X)[0])]
+
+    def evaluate_batch(self, contexts: List[Dict]) -> List[List[Dict]]:
+        """Outputs of the rules each context satisfies"""
+        columns = {field: [context.get(field) for context in contexts] for field in self.fields}
+        mask = self.evaluate_matrix(self.matrix(columns, len(contexts)))
+        return [
+            [self.render(i, context) for i in np.flatnonzero(row)]
+            for context, row in zip(contexts, mask)
+        ]
+
+
+def load_rule_sets(path: str) -> Dict[str, RuleSet]:
+    """Compile every named rule list in a JSON rule file"""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    return {name: RuleSet(rules) for name, rules in config.items()}
+
+
+rule_sets = load_rule_sets(settings.RECOMMENDATION_RULES_PATH)
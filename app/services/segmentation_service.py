@@ -0,0 +1,288 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_argmin_min
+from sklearn.preprocessing import StandardScaler
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.memory import array_bytes, memory
+from app.models.user import User
+from app.models.user_segment import UserSegment
+from app.services.ai_service import get_ai_service
+from app.services.peer_index import peer_index
+
+
+class UserSegmentationService:
+    """Online user segmentation with incrementally updated centroids
+
+    Feature vectors are queued per user, replacing the user's earlier
+    vector, and folded into the scaler and centroids in batches of
+    batch_users distinct users (or after fold_seconds), so a user counts
+    once per batch however often they write. Writes only schedule the
+    user: a background thread recomputes their features from their history
+    in its own session, off the request path.
+    """
+
+    def __init__(
+        self,
+        n_clusters: int,
+        model_path: str,
+        save_every: int,
+        drift_threshold: float,
+        batch_users: int = 256,
+        fold_seconds: float = 60.0,
+        background: bool = True
+    ):
+        self.n_clusters = n_clusters
+        self.model_path = model_path
+        self.save_every = save_every
+        self.drift_threshold = drift_threshold
+        self.batch_users = batch_users
+        self.fold_seconds = fold_seconds
+        # Without the background thread, scheduled users wait for drain()
+        self.background = background
+        self.session_factory = SessionLocal
+        self._lock = threading.Lock()
+        # Held for a whole drain, so drain() also waits for the one in progress
+        self._drain_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self.reset()
+        self.load()
+
+    def reset(self):
+        """Forget all centroids and buffered samples"""
+        with self._lock:
+            self.scaler = StandardScaler()
+            self.kmeans = self._new_kmeans()
+            # Latest vector of each user seen since the last fold
+            self._pending: Dict[int, np.ndarray] = {}
+            # Users whose features are out of date, waiting for drain()
+            self._scheduled: Set[int] = set()
+            self._folded_at = time.monotonic()
+            self._unsaved = 0
+            self.updates = 0
+
+    def _new_kmeans(self, init="k-means++", n_init: int = 3) -> MiniBatchKMeans:
+        return MiniBatchKMeans(
+            n_clusters=self.n_clusters, init=init, n_init=n_init,
+            batch_size=256, random_state=42
+        )
+
+    @property
+    def is_fitted(self) -> bool:
+        return hasattr(self.kmeans, "cluster_centers_")
+
+    def load(self):
+        """Load persisted centroids, if any"""
+        if not os.path.exists(self.model_path):
+            return
+        try:
+            state = joblib.load(self.model_path)
+            with self._lock:
+                self.scaler = state["scaler"]
+                self.kmeans = state["kmeans"]
+                self.updates = state.get("updates", 0)
+        except Exception as e:
+            print(f"Could not load segmentation model: {e}")
+
+    def save(self):
+        """Persist centroids atomically"""
+        directory = os.path.dirname(self.model_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.model_path}.tmp"
+        joblib.dump({"scaler": self.scaler, "kmeans": self.kmeans, "updates": self.updates}, tmp_path)
+        os.replace(tmp_path, self.model_path)
+
+    def assign(self, features: np.ndarray) -> Optional[int]:
+        """Nearest centroid for one unscaled feature vector"""
+        if not self.is_fitted:
+            return None
+        # Same as scaler.transform, minus per-call input validation
+        scaled = (features - self.scaler.mean_) / self.scaler.scale_
+        distances = ((self.kmeans.cluster_centers_ - scaled) ** 2).sum(axis=1)
+        return int(np.argmin(distances))
+
+    def update(self, user_id: int, features: np.ndarray) -> Optional[int]:
+        """Queue one user's feature vector, folding the queue when due, and assign a segment"""
+        features = np.asarray(features, dtype=np.float64).ravel()
+        with self._lock:
+            self._pending[user_id] = features
+            # The first fold initialises the centroids as soon as there is one user per cluster
+            due = self.batch_users if self.is_fitted else self.n_clusters
+            if len(self._pending) >= due or (
+                self.is_fitted and time.monotonic() - self._folded_at >= self.fold_seconds
+            ):
+                self._fold()
+            return self.assign(features)
+
+    def _fold(self):
+        """Fold the queued vectors into the scaler and centroids; the caller holds the lock"""
+        batch = np.vstack(list(self._pending.values()))
+        self._pending.clear()
+        self._folded_at = time.monotonic()
+        if self.is_fitted:
+            mean, scale = self.scaler.mean_.copy(), self.scaler.scale_.copy()
+            self.scaler.partial_fit(batch)
+            # Move the centroids into the updated scaled space, so they keep their place in feature space
+            centers = self.kmeans.cluster_centers_
+            centers[:] = (centers * scale + mean - self.scaler.mean_) / self.scaler.scale_
+        else:
+            self.scaler.partial_fit(batch)
+        self.kmeans.partial_fit(self.scaler.transform(batch))
+        self.updates += len(batch)
+        self._unsaved += len(batch)
+        if self.save_every and self._unsaved >= self.save_every:
+            self.save()
+            self._unsaved = 0
+
+    def observe(self, db: Session, user: User) -> Optional[int]:
+        """Recompute a user's features after a profile or health data change"""
+        ai_service = get_ai_service()
+        analysis = ai_service.analyze_health_data(db, user.id)
+        features = ai_service._extract_user_features(user, analysis)[0]
+        segment_id = self.update(user.id, features)
+        # The stored vectors also feed the similar-user index
+        peer_index.insert(user.id, features)
+
+        record = db.get(UserSegment, user.id)
+        if record is None:
+            record = UserSegment(user_id=user.id)
+            db.add(record)
+        record.features = [float(x) for x in features]
+        record.segment_id = segment_id
+        record.updated_at = datetime.utcnow()
+        db.commit()
+        return segment_id
+
+    def schedule(self, user_id: int):
+        """Queue a user for observe() after a profile or health data change"""
+        with self._lock:
+            self._scheduled.add(user_id)
+            if self.background and (self._worker is None or not self._worker.is_alive()):
+                # Threads do not survive a fork, so each worker starts its own
+                self._worker = threading.Thread(target=self._run, name="segment-observer", daemon=True)
+                self._worker.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"Could not update user segments: {e}")
+
+    def drain(self) -> int:
+        """Observe every scheduled user in a session of our own; returns how many were scheduled"""
+        with self._drain_lock:
+            with self._lock:
+                user_ids, self._scheduled = self._scheduled, set()
+            if not user_ids:
+                return 0
+            db = self.session_factory()
+            try:
+                for user_id in sorted(user_ids):
+                    try:
+                        user = db.get(User, user_id)
+                        if user is not None:
+                            self.observe(db, user)
+                    except Exception as e:
+                        db.rollback()
+                        print(f"Could not update segment of user {user_id}: {e}")
+                    db.expunge_all()
+            finally:
+                db.close()
+            return len(user_ids)
+
+    def get_segment(self, db: Session, user: User) -> UserSegment:
+        """Get a user's stored segment, computing it on first access or when a change is still queued"""
+        record = db.get(UserSegment, user.id)
+        with self._lock:
+            scheduled = user.id in self._scheduled
+            self._scheduled.discard(user.id)
+        if record is None or scheduled or (record.segment_id is None and self.is_fitted):
+            self.observe(db, user)
+            record = db.get(UserSegment, user.id)
+        return record
+
+    @staticmethod
+    def _inertia(X: np.ndarray, centers: np.ndarray) -> float:
+        _, distances = pairwise_distances_argmin_min(X, centers)
+        return float((distances ** 2).sum())
+
+    def refit(self, db: Session, force: bool = False) -> Dict:
+        """Full refit over all stored feature vectors, adopted when centroids have drifted
+
+        The refit is seeded with the online centroids so segment ids stay stable.
+        """
+        rows = db.query(UserSegment.user_id, UserSegment.features).all()
+        report = {"users": len(rows), "drift": None, "replaced": False}
+        if len(rows) < self.n_clusters:
+            return report
+
+        X = np.array([features for _, features in rows], dtype=np.float64)
+        scaler = StandardScaler().fit(X)
+        X_scaled = scaler.transform(X)
+
+        # Fit without the lock, so online updates carry on meanwhile; take it only to swap the model
+        with self._lock:
+            seed = (
+                scaler.transform(self.scaler.inverse_transform(self.kmeans.cluster_centers_))
+                if self.is_fitted else None
+            )
+        if seed is not None:
+            kmeans = self._new_kmeans(init=seed, n_init=1).fit(X_scaled)
+            drift = float(np.linalg.norm(kmeans.cluster_centers_ - seed, axis=1).mean())
+            report["online_inertia"] = self._inertia(X_scaled, seed)
+        else:
+            kmeans = self._new_kmeans().fit(X_scaled)
+            drift = None
+        report["drift"] = drift
+        report["refit_inertia"] = self._inertia(X_scaled, kmeans.cluster_centers_)
+
+        if not (force or drift is None or drift > self.drift_threshold):
+            return report
+        with self._lock:
+            self.scaler, self.kmeans = scaler, kmeans
+            self._pending.clear()
+            self.save()
+
+        labels = kmeans.predict(X_scaled)
+        db.bulk_update_mappings(UserSegment, [
+            {"user_id": user_id, "segment_id": int(label)}
+            for (user_id, _), label in zip(rows, labels)
+        ])
+        db.commit()
+        report["replaced"] = True
+        return report
+
+    def memory_footprint(self) -> Dict:
+        with self._lock:
+            return {
+                "model_bytes": array_bytes(self.scaler) + array_bytes(self.kmeans),
+                "pending_users": len(self._pending),
+                "scheduled_users": len(self._scheduled),
+                "pending_bytes": array_bytes(self._pending),
+            }
+
+
+segmentation_service = UserSegmentationService(
+    n_clusters=settings.SEGMENTATION_CLUSTERS,
+    model_path=settings.SEGMENTATION_MODEL_PATH,
+    save_every=settings.SEGMENTATION_SAVE_EVERY,
+    drift_threshold=settings.SEGMENTATION_DRIFT_THRESHOLD,
+    batch_users=settings.SEGMENTATION_BATCH_USERS,
+    fold_seconds=settings.SEGMENTATION_FOLD_SECONDS
+)
+memory.register("segmentation", segmentation_service.memory_footprint)
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.cache import invalidate_tags_sync, user_tag
+from app.core.config import settings
+from app.core.revocation import token_denylist
+from app.core.security import (
+    create_access_token, create_refresh_token, decode_refresh_token, get_password_hash, new_token_id, verify_password
+)
+from app.models.auth_session import AuthSession, RevokedToken
+from app.models.user import User
+
+
+class SessionService:
+    """Login sessions: an access token plus a rotating refresh token, both carrying the session id (sid)"""
+
+    @staticmethod
+    def _issue(session: AuthSession) -> Dict:
+        access_token = create_access_token(
+            data={"sub": str(session.user_id), "sid": session.id},
+            expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+        refresh_token = create_refresh_token(session.user_id, session.id, session.refresh_jti, session.expires_at)
+        return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+    @staticmethod
+    def create_session(db: Session, user_id: int) -> Dict:
+        """Start a session and return its tokens"""
+        session = AuthSession(
+            id=new_token_id(),
+            user_id=user_id,
+            refresh_jti=new_token_id(),
+            expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        )
+        db.add(session)
+        db.commit()
+        return SessionService._issue(session)
+
+    @staticmethod
+    def refresh(db: Session, refresh_token: str) -> Optional[Dict]:
+        """New tokens for a valid refresh token, which is used up
+
+        Presenting an already used refresh token means it was copied, so the
+        whole session is revoked.
+        """
+        payload = decode_refresh_token(refresh_token)
+        if payload is None:
+            return None
+        session = db.get(AuthSession, payload["sid"])
+        if session is None or session.revoked_at is not None or session.expires_at <= datetime.utcnow():
+            return None
+        if session.refresh_jti != payload["jti"]:
+            SessionService.revoke_sessions(db, [session])
+            return None
+        session.refresh_jti = new_token_id()
+        db.commit()
+        return SessionService._issue(session)
+
+    @staticmethod
+    def revoke_sessions(db: Session, sessions: List[AuthSession]):
+        """End sessions: their refresh tokens stop working, and their access tokens are denylisted until they expire"""
+        if not sessions:
+            return
+        now = datetime.utcnow()
+        access_expiry = now + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        for session in sessions:
+            session.revoked_at = now
+            db.merge(RevokedToken(jti=session.id, revoked_at=now, expires_at=access_expiry))
+        db.commit()
+        token_denylist.add(*[session.id for session in sessions])
+
+    @staticmethod
+    def logout(db: Session, sid: Optional[str]):
+        session = db.get(AuthSession, sid) if sid else None
+        if session is not None and session.revoked_at is None:
+            SessionService.revoke_sessions(db, [session])
+
+    @staticmethod
+    def change_password(db: Session, user_id: int, current_password: str, new_password: str) -> Optional[Dict]:
+        """Set a new password, end every session of the user and start a new one; None if current_password is wrong"""
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None or not verify_password(current_password, user.hashed_password):
+            return None
+        user.hashed_password = get_password_hash(new_password)
+        user.updated_at = datetime.utcnow()
+        db.commit()
+        invalidate_tags_sync(user_tag(user_id))
+        SessionService.revoke_sessions(db, db.query(AuthSession).filter(
+            AuthSession.user_id == user_id, AuthSession.revoked_at.is_(None)
+        ).all())
+        return SessionService.create_session(db, user_id)
@@ -0,0 +1,252 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.memory import memory
+from app.core.metrics import metrics
+
+try:
+    from transformers import AutoTokenizer, StoppingCriteria, StoppingCriteriaList, TextStreamer, pipeline
+    HAS_TRANSFORMERS = True
+except ImportError:
+    HAS_TRANSFORMERS = False
+
+try:
+    from onnxruntime import SessionOptions
+    from optimum.onnxruntime import ORTModelForCausalLM
+    HAS_ONNXRUNTIME = True
+except ImportError:
+    HAS_ONNXRUNTIME = False
+
+BACKENDS = ("pytorch", "onnx", "none")
+# Written by scripts/export_text_generator.py --quantize; preferred over model.onnx
+QUANTIZED_FILE = "model_quantized.onnx"
+_END = object()
+
+
+class GenerationStream:
+    """Text chunks produced by a background thread through a bounded buffer
+
+    produce(emit, cancelled) runs in its own thread and calls emit(text) per
+    chunk. When the buffer is full, emit blocks, so a slow reader slows the
+    producer down. cancel() unblocks it and sets the cancelled event that
+    the producer polls to stop early.
+    """
+
+    def __init__(self, produce: Callable[[Callable[[str], None], threading.Event], None], max_buffered: int = 64):
+        self.cancelled = threading.Event()
+        self.error: Optional[Exception] = None
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_buffered)
+        self._thread = threading.Thread(target=self._run, args=(produce,), daemon=True)
+        self._thread.start()
+
+    def _run(self, produce):
+        try:
+            produce(self._put, self.cancelled)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(_END)
+
+    def _put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Next chunk, or None once finished; raises queue.Empty on timeout"""
+        item = self._queue.get(timeout=timeout)
+        if item is _END:
+            if self.error is not None:
+                raise self.error
+            return None
+        return item
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def join(self, timeout: Optional[float] = None):
+        self._thread.join(timeout)
+
+
+if HAS_TRANSFORMERS:
+    class _CallbackStreamer(TextStreamer):
+        """Forwards decoded text to a callback instead of stdout"""
+
+        def __init__(self, tokenizer, callback: Callable[[str], None]):
+            super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+            self.callback = callback
+
+        def on_finalized_text(self, text: str, stream_end: bool = False):
+            if text:
+                self.callback(text)
+
+    class _StopWhenSet(StoppingCriteria):
+        def __init__(self, event: threading.Event):
+            self.event = event
+
+        def __call__(self, input_ids, scores, **kwargs) -> bool:
+            return self.event.is_set()
+
+
+class TextGenerator:
+    """Causal language model text generation on CPU
+
+    Backends:
+        pytorch  full-precision transformers model (a hub name or local directory)
+        onnx     ONNX Runtime export, int8-quantized when the directory holds one
+    """
+
+    def __init__(self, backend: str, model_path: str, max_new_tokens: int, threads: int = 0):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown text generator backend: {backend}")
+        self.backend = backend
+        self.model_path = model_path
+        self.max_new_tokens = max_new_tokens
+        self.threads = threads
+        self.pipeline = None
+        self.model_file: Optional[str] = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.tokens = 0
+        self.seconds = 0.0
+
+    def load(self):
+        """Load the model; raises when the backend's dependencies or files are missing"""
+        if self.backend == "none":
+            return
+        if not HAS_TRANSFORMERS:
+            raise RuntimeError("Text generation requires the transformers package")
+        if self.backend == "pytorch":
+            if self.threads > 0:
+                import torch
+                torch.set_num_threads(self.threads)
+            self.pipeline = pipeline("text-generation", model=self.model_path, device=-1)
+            return
+
+        if not HAS_ONNXRUNTIME:
+            raise RuntimeError("TEXT_GENERATOR_BACKEND=onnx requires optimum[onnxruntime]")
+        if not os.path.isdir(self.model_path):
+            raise RuntimeError(
+                f"ONNX model directory {self.model_path} not found; "
+                "create it with scripts/export_text_generator.py"
+            )
+        quantized = os.path.exists(os.path.join(self.model_path, QUANTIZED_FILE))
+        self.model_file = QUANTIZED_FILE if quantized else "model.onnx"
+        session_options = SessionOptions()
+        if self.threads > 0:
+            session_options.intra_op_num_threads = self.threads
+        model = ORTModelForCausalLM.from_pretrained(
+            self.model_path, file_name=self.model_file, session_options=session_options
+        )
+        tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        self.pipeline = pipeline("text-generation", model=model, tokenizer=tokenizer)
+
+    @property
+    def ready(self) -> bool:
+        return self.pipeline is not None
+
+    def generate(self, prompt: str, max_new_tokens: Optional[int] = None, **kwargs) -> str:
+        """Continuation of prompt (without the prompt itself)"""
+        if self.pipeline is None:
+            raise RuntimeError("Text generator is not loaded")
+        max_new_tokens = max_new_tokens or self.max_new_tokens
+        started = time.perf_counter()
+        output = self.pipeline(
+            prompt,
+            max_new_tokens=max_new_tokens,
+            return_full_text=False,
+            pad_token_id=self.pipeline.tokenizer.eos_token_id,
+            **kwargs
+        )[0]["generated_text"]
+        elapsed = time.perf_counter() - started
+        tokens = len(self.pipeline.tokenizer.encode(output))
+        with self._lock:
+            self.calls += 1
+            self.tokens += tokens
+            self.seconds += elapsed
+        return output
+
+    def stream(self, prompt: str, max_new_tokens: Optional[int] = None, max_buffered: int = 64) -> GenerationStream:
+        """Continuation of prompt, streamed as it is decoded; cancel() stops generation"""
+        if self.pipeline is None:
+            raise RuntimeError("Text generator is not loaded")
+        max_new_tokens = max_new_tokens or self.max_new_tokens
+        model, tokenizer = self.pipeline.model, self.pipeline.tokenizer
+
+        def produce(emit, cancelled):
+            started = time.perf_counter()
+            inputs = tokenizer(prompt, return_tensors="pt")
+            output = model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                do_sample=True,
+                pad_token_id=tokenizer.eos_token_id,
+                streamer=_CallbackStreamer(tokenizer, emit),
+                stopping_criteria=StoppingCriteriaList([_StopWhenSet(cancelled)])
+            )
+            with self._lock:
+                self.calls += 1
+                self.tokens += output.shape[1] - inputs["input_ids"].shape[1]
+                self.seconds += time.perf_counter() - started
+
+        return GenerationStream(produce, max_buffered)
+
+    def memory_footprint(self) -> Dict:
+        """Parameter and buffer bytes of the PyTorch model; ONNX Runtime holds the model file's weights natively"""
+        report = {"backend": self.backend, "loaded": self.pipeline is not None}
+        if self.pipeline is None:
+            return report
+        model = self.pipeline.model
+        if self.backend == "pytorch":
+            report["parameters"] = sum(p.numel() for p in model.parameters())
+            report["parameter_bytes"] = sum(p.numel() * p.element_size() for p in model.parameters())
+            report["buffer_bytes"] = sum(b.numel() * b.element_size() for b in model.buffers())
+        else:
+            report["model_file_bytes"] = os.path.getsize(os.path.join(self.model_path, self.model_file))
+        return report
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "model_path": self.model_path,
+                "model_file": self.model_file,
+                "loaded": self.pipeline is not None,
+                "calls": self.calls,
+                "tokens": self.tokens,
+                "tokens_per_second": self.tokens / self.seconds if self.seconds else 0.0,
+            }
+
+
+def load_text_generator(
+    backend: Optional[str] = None,
+    model_path: Optional[str] = None,
+    threads: Optional[int] = None
+) -> Optional[TextGenerator]:
+    """Configured text generator, or None when disabled or unavailable"""
+    backend = backend or settings.TEXT_GENERATOR_BACKEND
+    if backend == "none":
+        return None
+    if model_path is None:
+        model_path = settings.TEXT_GENERATOR_ONNX_PATH if backend == "onnx" else settings.TEXT_GENERATOR_MODEL
+    generator = TextGenerator(
+        backend,
+        model_path,
+        max_new_tokens=settings.TEXT_GENERATOR_MAX_NEW_TOKENS,
+        threads=settings.TEXT_GENERATOR_THREADS if threads is None else threads
+    )
+    try:
+        generator.load()
+    except Exception as e:
+        print(f"Could not load text generation model: {e}")
+        return None
+    metrics.register("text_generator", generator.stats)
+    memory.register("text_generator", generator.memory_footprint)
+    return generator
@@ -4,6 +4,8 @@ from fastapi import HTTPException, status
 
 from app.models.user import User
 from app.schemas.user import UserCreate, UserUpdate
+from app.core.cache import invalidate_tags_sync, user_tag
+from app.core.profiling import run_in_threadpool
 from app.core.security import get_password_hash, verify_password, create_access_token
 from datetime import datetime, timedelta
 
@@ -29,7 +31,7 @@ class UserService:
             )
         
         # Create new user
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
         db_user = User(
             username=user_data.username,
             email=user_data.email,
@@ -80,6 +82,7 @@ class UserService:
         user.updated_at = datetime.utcnow()
         db.commit()
         db.refresh(user)
+        invalidate_tags_sync(user_tag(user_id))
         return user
 
 
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Load test: read latency while plan generation is saturated
+
+Floods POST /api/health/plan from many users while probing GET
+/api/health/statistics, then reports read latency percentiles and the
+plan request outcomes (201 / 429 / 503). By default the app runs
+in-process against DATABASE_URL, once with admission control and once
+without; pass --base-url to load a running server instead:
+
+    python benchmarks/admission_control.py --users 50 --flooders 32 --seconds 20
+    python benchmarks/admission_control.py --base-url http://localhost:8000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import numpy as np
+
+
+async def create_users(client, n, prefix):
+    headers = []
+    for i in range(n):
+        username = f"{prefix}{i}"
+        await client.post("/api/auth/register", json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": "loadtest123",
+            "gender": "female",
+            "height": 165,
+            "weight": 60,
+            "date_of_birth": "1990-01-01",
+            "activity_level": "moderately_active",
+            "health_goal": "weight_loss"
+        })
+        response = await client.post("/api/auth/login", data={"username": username, "password": "loadtest123"})
+        response.raise_for_status()
+        headers.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+    return headers
+
+
+async def flood(client, headers, deadline, outcomes):
+    i = 0
+    while time.perf_counter() < deadline:
+        response = await client.post("/api/health/plan", headers=headers[i % len(headers)])
+        outcomes[response.status_code] += 1
+        if response.status_code in (429, 503):
+            # Well-behaved clients back off; keep the pressure on without a hot loop
+            await asyncio.sleep(0.05)
+        i += 1
+
+
+async def probe(client, headers, deadline, interval, latencies, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get("/api/health/statistics", headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            errors[response.status_code] += 1
+        await asyncio.sleep(interval)
+
+
+async def run_load(client, headers, args) -> dict:
+    deadline = time.perf_counter() + args.seconds
+    outcomes, errors, latencies = Counter(), Counter(), []
+    await asyncio.gather(
+        *[flood(client, headers, deadline, outcomes) for _ in range(args.flooders)],
+        *[
+            probe(client, headers[i % len(headers)], deadline, args.probe_interval, latencies, errors)
+            for i in range(args.probers)
+        ]
+    )
+    latencies = np.array(latencies)
+    return {
+        "read_requests": int(len(latencies)),
+        "read_p50_ms": float(np.percentile(latencies, 50)),
+        "read_p95_ms": float(np.percentile(latencies, 95)),
+        "read_p99_ms": float(np.percentile(latencies, 99)),
+        "read_max_ms": float(latencies.max()),
+        "read_errors": dict(errors),
+        "plan_outcomes": dict(outcomes),
+        "plans_per_second": outcomes[201] / args.seconds,
+    }
+
+
+async def main_async(args):
+    prefix = f"load{int(time.time())}_"
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=120) as client:
+            headers = await create_users(client, args.users, prefix)
+            return {"server": args.base_url, "load": await run_load(client, headers, args)}
+
+    from app.main import app
+    from app.core.rate_limit import admission_controller
+
+    # Report app errors as 500s, as a real server would
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120) as client:
+        admission_controller.enabled = False
+        headers = await create_users(client, args.users, prefix)
+        report = {}
+        for label, enabled in (("admission_control", True), ("no_admission_control", False)):
+            admission_controller.enabled = enabled
+            await admission_controller.reset()
+            report[label] = await run_load(client, headers, args)
+            if enabled:
+                report[label]["admission"] = admission_controller.stats()
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Load a running server instead of the in-process app")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--flooders", type=int, default=32, help="Concurrent plan generation clients")
+    parser.add_argument("--probers", type=int, default=4, help="Concurrent read clients")
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    parser.add_argument("--seconds", type=float, default=20)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Per-event cost and correctness of streaming anomaly detection
+
+Generates --users synthetic histories of --days days with one to four
+records a day, then:
+
+- update_us: update() and score() per record on in-memory state, the
+  arithmetic a write adds
+- offline_us: recomputing the same state from the user's whole history
+  with offline_state() on every record, the approach the stream avoids
+- observe_us: AnomalyDetector.observe() per single-record write against an
+  in-memory SQLite database (row lock, decode, update, encode), committed;
+  each user's first write also creates their row
+- max_relative_error: largest difference between the streamed and offline
+  states, over all users and state fields
+
+    python benchmarks/anomaly_detection.py --users 100 --days 90
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.database import Base
+from app.models.metric_stats import UserMetricStats
+from app.models.user import User
+from app.services.anomaly_detector import (
+    AnomalyDetector, decode_state, empty_state, offline_state, score, update
+)
+
+ALPHA = 0.2
+
+
+def in_memory_session():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+def histories(rng, users: int, days: int):
+    """Per user, (day ordinals, calories) of diet records in date order"""
+    first = date.today().toordinal() - days
+    result = []
+    for _ in range(users):
+        per_day = rng.integers(1, 5, days)
+        record_days = np.repeat(np.arange(first, first + days), per_day)
+        result.append((record_days, rng.normal(600, 150, len(record_days)).clip(50)))
+    return result
+
+
+def streamed(record_days, values):
+    state = empty_state()
+    for day, value in zip(record_days.tolist(), values.tolist()):
+        update(state, day, value, ALPHA)
+        score(state, 7)
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = histories(np.random.default_rng(args.seed), args.users, args.days)
+    events = sum(len(values) for _, values in data)
+
+    started = time.perf_counter()
+    states = [streamed(record_days, values) for record_days, values in data]
+    update_seconds = time.perf_counter() - started
+
+    errors = []
+    for state, (record_days, values) in zip(states, data):
+        expected = np.array(offline_state(record_days, values, ALPHA))
+        errors.append(np.max(np.abs(np.array(state) - expected) / np.maximum(np.abs(expected), 1.0)))
+
+    # Offline recomputation per event is quadratic, so time it on the first user only
+    record_days, values = data[0]
+    started = time.perf_counter()
+    for i in range(1, len(values) + 1):
+        offline_state(record_days[:i], values[:i], ALPHA)
+    offline_seconds = (time.perf_counter() - started) / len(values)
+
+    db = in_memory_session()
+    detector = AnomalyDetector(
+        enabled=True, alpha=ALPHA, threshold=3, min_days=7, recent_days=3, bootstrap_days=args.days
+    )
+    db.add_all([
+        User(username=f"bench{i}", email=f"bench{i}@example.com", hashed_password="x") for i in range(args.users)
+    ])
+    db.commit()
+    user_ids = [user.id for user in db.query(User).order_by(User.id)]
+    writes = 0
+    started = time.perf_counter()
+    for user_id, (record_days, values) in zip(user_ids, data):
+        for day, value in zip(record_days.tolist(), values.tolist()):
+            detector.observe(db, user_id, [SimpleNamespace(data_type="diet", date=date.fromordinal(day), calories=value)])
+            db.commit()
+            writes += 1
+    observe_seconds = (time.perf_counter() - started) / writes
+    row = db.get(UserMetricStats, user_ids[0])
+    assert decode_state(row)["calories"] == states[0]
+
+    print(json.dumps({
+        "users": args.users,
+        "days": args.days,
+        "events": events,
+        "update_us": update_seconds / events * 1e6,
+        "offline_us": offline_seconds * 1e6,
+        "observe_us": observe_seconds * 1e6,
+        "state_bytes_per_user": len(row.state),
+        "max_relative_error": float(max(errors)),
+        "detector": detector.stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Per-request cost of authentication with the revoked token denylist
+
+Times, per call, against an in-memory SQLite database holding --revoked
+denylisted ids:
+
+- decode: JWT signature check and claims only
+- denylist_filter: decode plus the bloom filter check (token not revoked)
+- denylist_query: decode plus a revoked_tokens query on every request,
+  the approach the filter avoids
+- get_current_user: the whole dependency with a warm principal cache
+- get_current_user[revoked]: a revoked token (filter hit, then a query)
+
+    python benchmarks/auth_overhead.py --revoked 0 10000 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+from jose import jwt
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.config import settings
+from app.core.database import Base
+from app.core.revocation import TokenDenylist
+from app.core.security import create_access_token, get_current_user, new_token_id
+from app.models.auth_session import RevokedToken
+from app.models.user import User
+import app.core.security as security
+
+
+def in_memory_session():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+async def time_call(function, min_seconds: float, repeats: int) -> dict:
+    """Seconds per call of an async function, batched so each repeat lasts at least min_seconds"""
+    async def run(n: int) -> float:
+        started = time.perf_counter()
+        for _ in range(n):
+            await function()
+        return time.perf_counter() - started
+
+    await run(1)
+    number = 1
+    while await run(number) < min_seconds and number < 1_000_000:
+        number *= 10
+    samples = [await run(number) / number for _ in range(repeats)]
+    return {"calls": number, "median_us": statistics.median(samples) * 1e6, "min_us": min(samples) * 1e6}
+
+
+async def run_size(db, revoked: int, args) -> dict:
+    db.query(RevokedToken).delete()
+    expires_at = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    if revoked:
+        db.execute(insert(RevokedToken), [{"jti": new_token_id(), "expires_at": expires_at} for _ in range(revoked)])
+    db.commit()
+
+    denylist = TokenDenylist(settings.DENYLIST_CAPACITY, settings.DENYLIST_ERROR_RATE, 3600, 3600)
+    denylist.sync(db)
+    # get_current_user reads the module-level denylist
+    security.token_denylist = denylist
+
+    user = db.query(User).first()
+    token = create_access_token({"sub": str(user.id), "sid": new_token_id()})
+    revoked_sid = new_token_id()
+    db.add(RevokedToken(jti=revoked_sid, expires_at=expires_at))
+    db.commit()
+    denylist.add(revoked_sid)
+    revoked_token = create_access_token({"sub": str(user.id), "sid": revoked_sid})
+
+    def decode(value):
+        return jwt.decode(value, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+    async def decode_only():
+        decode(token)
+
+    async def denylist_filter():
+        payload = decode(token)
+        await denylist.is_revoked(db, payload["jti"], payload["sid"])
+
+    async def denylist_query():
+        payload = decode(token)
+        denylist._lookup(db, [payload["jti"], payload["sid"]])
+
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+
+    async def current_user():
+        await get_current_user(token, db, session_factory)
+
+    async def current_user_revoked():
+        try:
+            await get_current_user(revoked_token, db, session_factory)
+        except HTTPException:
+            pass
+
+    results = {}
+    for name, function in [
+        ("decode", decode_only),
+        ("denylist_filter", denylist_filter),
+        ("denylist_query", denylist_query),
+        ("get_current_user", current_user),
+        ("get_current_user[revoked]", current_user_revoked),
+    ]:
+        results[name] = await time_call(function, args.min_time, args.repeats)
+    results["filter_bytes"] = denylist._filter.nbytes
+    results["false_positives"] = denylist.stats()["false_positives"]
+    return results
+
+
+async def main_async(args) -> dict:
+    db = in_memory_session()
+    try:
+        db.add(User(username="bench", email="bench@example.com", hashed_password="x"))
+        db.commit()
+        return {str(revoked): await run_size(db, revoked, args) for revoked in args.revoked}
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--revoked", type=int, nargs="+", default=[0, 10000, 100000], help="Denylisted ids")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per repeat")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark response compression: CPU cost against bytes saved per endpoint
+
+Seeds one user with health records and generated plans, fetches the
+uncompressed bodies of GET /api/health/data and GET /api/health/plan from
+the in-process app, then compresses each body with every available codec
+(gzip, plus brotli and zstd when installed) at several levels. Reports
+compressed size, ratio, compression time and CPU microseconds spent per
+KB saved. Runs against DATABASE_URL:
+
+    python benchmarks/compression.py --records 2000 --plans 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import numpy as np
+
+from app.core.compression import HAS_BROTLI, HAS_ZSTD, BrotliCompressor, GzipCompressor, ZstdCompressor
+from app.core.database import SessionLocal
+from app.models.user import User
+from app.schemas.health_data import HealthDataCreate
+from app.services.health_data_service import HealthDataService
+
+ENDPOINTS = ("/api/health/data", "/api/health/plan")
+
+
+def seed_records(user_id: int, n: int):
+    rng = np.random.default_rng(0)
+    today = date.today()
+    db = SessionLocal()
+    try:
+        for i in range(n):
+            day = today - timedelta(days=int(rng.integers(0, 90)))
+            kind = i % 3
+            if kind == 0:
+                record = HealthDataCreate(
+                    data_type="exercise", date=day, exercise_type="running", duration=float(rng.uniform(10, 90))
+                )
+            elif kind == 1:
+                record = HealthDataCreate(data_type="diet", date=day, calories=float(rng.uniform(200, 900)))
+            else:
+                record = HealthDataCreate(data_type="sleep", date=day, sleep_duration=float(rng.uniform(5, 9)))
+            HealthDataService.create_health_data(db, user_id, record)
+    finally:
+        db.close()
+
+
+def codecs():
+    """(name, level, compressor factory) for every available codec and level"""
+    candidates = [("gzip", level, GzipCompressor) for level in (1, 6, 9)]
+    if HAS_BROTLI:
+        candidates += [("br", quality, BrotliCompressor) for quality in (1, 4, 6, 11)]
+    if HAS_ZSTD:
+        candidates += [("zstd", level, ZstdCompressor) for level in (1, 3, 9, 19)]
+    return candidates
+
+
+def measure(body: bytes, factory, level: int, repeats: int) -> dict:
+    timings = []
+    for _ in range(repeats):
+        started = time.process_time()
+        compressor = factory(level)
+        compressed = compressor.compress(body) + compressor.finish()
+        timings.append((time.process_time() - started) * 1000)
+    cpu_ms = float(np.median(timings))
+    saved_kb = (len(body) - len(compressed)) / 1024
+    return {
+        "bytes": len(compressed),
+        "ratio": len(compressed) / len(body),
+        "cpu_ms": cpu_ms,
+        "mb_per_second": len(body) / 1e6 / (cpu_ms / 1000) if cpu_ms else None,
+        "cpu_us_per_kb_saved": cpu_ms * 1000 / saved_kb if saved_kb > 0 else None,
+    }
+
+
+async def fetch_bodies(args) -> dict:
+    from app.main import app
+    from app.core.rate_limit import admission_controller
+
+    admission_controller.enabled = False
+    username = f"compress{int(time.time())}"
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+        await client.post("/api/auth/register", json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": "benchmark123",
+            "gender": "female",
+            "height": 165,
+            "weight": 60,
+            "date_of_birth": "1990-01-01",
+            "activity_level": "moderately_active",
+            "health_goal": "weight_loss"
+        })
+        response = await client.post("/api/auth/login", data={"username": username, "password": "benchmark123"})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        db = SessionLocal()
+        try:
+            user_id = db.query(User.id).filter(User.username == username).scalar()
+        finally:
+            db.close()
+        seed_records(user_id, args.records)
+        for _ in range(args.plans):
+            (await client.post("/api/health/plan", headers=headers)).raise_for_status()
+
+        bodies = {}
+        for path in ENDPOINTS:
+            response = await client.get(path, headers={**headers, "Accept-Encoding": "identity"})
+            response.raise_for_status()
+            bodies[path] = response.content
+        return bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=2000, help="Health records to seed")
+    parser.add_argument("--plans", type=int, default=50, help="Plans to generate")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    bodies = asyncio.run(fetch_bodies(args))
+    report = {"codecs_available": {"gzip": True, "br": HAS_BROTLI, "zstd": HAS_ZSTD}}
+    for path, body in bodies.items():
+        report[path] = {
+            "identity_bytes": len(body),
+            "codecs": {
+                f"{name}-{level}": measure(body, factory, level, args.repeats)
+                for name, level, factory in codecs()
+            }
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+HTTP load benchmark: latency percentiles and throughput per route
+
+Seeds --users synthetic users with --days of health history, then, for
+each --concurrency level, runs that many concurrent clients for --seconds.
+Each client sends a weighted mix of register, login, ingest, list,
+statistics, plan and recommendations requests. The JSON report has RPS,
+p50/p95/p99 latency and status counts per route; write it with --output
+to compare runs.
+
+By default the app runs in-process against DATABASE_URL. --spawn starts
+`python -m app.server` as a subprocess instead, and --base-url loads a
+server that is already running. --database-url points the in-process or
+spawned app at SQLite or a local PostgreSQL. Admission control is off in
+the in-process and spawned app unless --rate-limits is given, so 429s do
+not hide the routes' own throughput:
+
+    python benchmarks/http_load.py --database-url sqlite:///./data/loadtest.db --concurrency 1 8 32
+    python benchmarks/http_load.py --spawn --workers 4 --mix list=6,statistics=6,recommendations=3
+    python benchmarks/http_load.py --base-url http://localhost:8000 --output before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+import numpy as np
+
+ROUTES = ("register", "login", "ingest", "list", "statistics", "plan", "recommendations")
+DEFAULT_MIX = "register=1,login=2,ingest=4,list=6,statistics=6,plan=1,recommendations=4"
+PASSWORD = "loadtest123"
+
+
+def profile(username: str, rng: random.Random) -> dict:
+    return {
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": PASSWORD,
+        "gender": rng.choice(["male", "female"]),
+        "height": rng.uniform(155, 190),
+        "weight": rng.uniform(50, 100),
+        "date_of_birth": str(date(rng.randint(1960, 2004), rng.randint(1, 12), rng.randint(1, 28))),
+        "activity_level": rng.choice(["sedentary", "lightly_active", "moderately_active", "very_active"]),
+        "health_goal": rng.choice(["weight_loss", "muscle_gain", "maintenance", "general_health"]),
+    }
+
+
+def day_records(day: date, rng: random.Random) -> list:
+    return [
+        {
+            "data_type": "exercise", "date": str(day), "exercise_type": rng.choice(["running", "cycling", "walking"]),
+            "duration": rng.uniform(10, 90), "calories_burned": rng.uniform(50, 700)
+        },
+        {"data_type": "diet", "date": str(day), "meal_type": "lunch", "calories": rng.uniform(300, 900)},
+        {"data_type": "sleep", "date": str(day), "sleep_duration": rng.uniform(5, 9)},
+    ]
+
+
+class LoadUser:
+    def __init__(self, username: str, headers: dict):
+        self.username = username
+        self.headers = headers
+
+
+async def register_and_login(client, username: str, rng: random.Random) -> LoadUser:
+    await client.post("/api/auth/register", json=profile(username, rng))
+    response = await client.post("/api/auth/login", data={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    return LoadUser(username, {"Authorization": f"Bearer {response.json()['access_token']}"})
+
+
+async def seed(client, args, prefix: str) -> list:
+    """Register users and submit their history through the API, so every target mode seeds the same way"""
+    semaphore = asyncio.Semaphore(16)
+    today = date.today()
+
+    async def seed_user(i: int) -> LoadUser:
+        rng = random.Random(args.seed + i)
+        async with semaphore:
+            user = await register_and_login(client, f"{prefix}{i}", rng)
+            for offset in range(args.days):
+                for record in day_records(today - timedelta(days=offset), rng):
+                    response = await client.post("/api/health/data", json=record, headers=user.headers)
+                    response.raise_for_status()
+        return user
+
+    return await asyncio.gather(*[seed_user(i) for i in range(args.users)])
+
+
+class Routes:
+    """One coroutine per route name; each sends a single request"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.registered = 0
+
+    async def register(self, client, user, rng):
+        self.registered += 1
+        return await client.post(
+            "/api/auth/register", json=profile(f"{self.prefix}new{self.registered}", rng)
+        )
+
+    async def login(self, client, user, rng):
+        return await client.post("/api/auth/login", data={"username": user.username, "password": PASSWORD})
+
+    async def ingest(self, client, user, rng):
+        return await client.post(
+            "/api/health/data/ingest", json={"records": day_records(date.today(), rng)}, headers=user.headers
+        )
+
+    async def list(self, client, user, rng):
+        start = date.today() - timedelta(days=30)
+        return await client.get("/api/health/data", params={"start_date": str(start)}, headers=user.headers)
+
+    async def statistics(self, client, user, rng):
+        return await client.get("/api/health/statistics", headers=user.headers)
+
+    async def plan(self, client, user, rng):
+        return await client.post("/api/health/plan", headers=user.headers)
+
+    async def recommendations(self, client, user, rng):
+        return await client.get("/api/health/recommendations", headers=user.headers)
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ROUTES:
+            raise SystemExit(f"Unknown route in --mix: {name}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+async def run_level(client, users, routes: Routes, weights: dict, concurrency: int, args) -> dict:
+    names, probabilities = list(weights), list(weights.values())
+    latencies, statuses = defaultdict(list), defaultdict(Counter)
+    started = time.perf_counter()
+    measure_from = started + args.warmup
+    deadline = measure_from + args.seconds
+
+    async def client_loop(i: int):
+        rng = random.Random(args.seed * 1000 + concurrency * 100 + i)
+        while True:
+            name = rng.choices(names, probabilities)[0]
+            sent = time.perf_counter()
+            if sent >= deadline:
+                return
+            try:
+                status = (await getattr(routes, name)(client, rng.choice(users), rng)).status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if sent >= measure_from:
+                latencies[name].append((time.perf_counter() - sent) * 1000)
+                statuses[name][str(status)] += 1
+
+    await asyncio.gather(*[client_loop(i) for i in range(concurrency)])
+    report = {"total_rps": sum(map(len, latencies.values())) / args.seconds, "routes": {}}
+    for name in names:
+        samples = np.array(latencies[name])
+        if not len(samples):
+            continue
+        report["routes"][name] = {
+            "requests": int(len(samples)),
+            "rps": len(samples) / args.seconds,
+            "p50_ms": float(np.percentile(samples, 50)),
+            "p95_ms": float(np.percentile(samples, 95)),
+            "p99_ms": float(np.percentile(samples, 99)),
+            "max_ms": float(samples.max()),
+            "statuses": dict(statuses[name]),
+        }
+    return report
+
+
+async def run_all(client, args, target: str) -> dict:
+    prefix = f"load{int(time.time())}_"
+    weights = parse_mix(args.mix)
+    started = time.perf_counter()
+    users = await seed(client, args, prefix)
+    report = {
+        "target": target,
+        "mix": weights,
+        "users": args.users,
+        "days": args.days,
+        "seed_seconds": time.perf_counter() - started,
+        "levels": {},
+    }
+    routes = Routes(prefix)
+    for concurrency in args.concurrency:
+        report["levels"][str(concurrency)] = await run_level(client, users, routes, weights, concurrency, args)
+    return report
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_up(base_url: str, process, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with status {process.returncode}")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout:.0f}s")
+
+
+async def main_async(args) -> dict:
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=120) as client:
+            return await run_all(client, args, args.base_url)
+
+    if args.spawn:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        process = subprocess.Popen(
+            [
+                sys.executable, "-m", "app.server", "--host", "127.0.0.1", "--port", str(port),
+                "--workers", str(args.workers)
+            ],
+            cwd=ROOT,
+            # app.server refuses several workers on per-process caches
+            env={
+                **os.environ,
+                "CACHE_BACKEND": os.environ.get("CACHE_BACKEND", "disk"),
+                "CACHE_SECRET": os.environ.get("CACHE_SECRET") or secrets.token_hex(32),
+                "SERVER_LOG_LEVEL": "warning"
+            }
+        )
+        try:
+            await wait_until_up(base_url, process)
+            async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+                return await run_all(client, args, f"app.server --workers {args.workers}")
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+
+    from app.main import app
+    from app.core.rate_limit import admission_controller
+    from app.services.ingest_buffer import ingest_buffer
+
+    admission_controller.enabled = args.rate_limits
+
+    # ASGITransport does not run startup hooks; start what they would
+    ingest_buffer.start()
+    # Report app errors as 500s, as a real server would
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120) as client:
+            return await run_all(client, args, "in-process")
+    finally:
+        ingest_buffer.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--base-url", help="Load a running server")
+    target.add_argument("--spawn", action="store_true", help="Start python -m app.server as a subprocess")
+    parser.add_argument("--workers", type=int, default=2, help="Server workers with --spawn")
+    parser.add_argument("--database-url", help="DATABASE_URL for the in-process or spawned app")
+    parser.add_argument("--rate-limits", action="store_true", help="Keep admission control on in the app")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30, help="Days of history per seeded user")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Route weights, e.g. list=6,statistics=6,plan=1")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seconds", type=float, default=20, help="Measured duration per concurrency level")
+    parser.add_argument("--warmup", type=float, default=2, help="Unmeasured seconds before each level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Read by app.core.config on import, here or in the spawned server
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    if not args.rate_limits:
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+    os.environ.setdefault("INGEST_ENABLED", "true")
+    os.environ.setdefault("INGEST_LOG_DIR", tempfile.mkdtemp(prefix="http_load_ingest_"))
+
+    report = json.dumps(asyncio.run(main_async(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark write-behind ingestion against one commit per record
+
+Submits the same synthetic health records from concurrent threads, once
+through HealthDataService.create_health_data and once through the
+ingestion buffer, and reports accepted records per second plus the
+buffer's fsync batching and end-to-end lag (acknowledged -> inserted).
+Runs against DATABASE_URL:
+
+    python benchmarks/ingest_buffer.py --records 20000 --threads 32
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core.database import Base, SessionLocal, engine
+from app.models.user import User
+from app.schemas.health_data import HealthDataCreate
+from app.services.health_data_service import HealthDataService
+from app.services.ingest_buffer import IngestBuffer
+
+
+def synthetic_records(rng, n):
+    today = date.today()
+    records = []
+    for i in range(n):
+        day = today - timedelta(days=int(rng.integers(0, 30)))
+        kind = i % 3
+        if kind == 0:
+            records.append(HealthDataCreate(data_type="exercise", date=day, duration=float(rng.uniform(10, 90))))
+        elif kind == 1:
+            records.append(HealthDataCreate(data_type="diet", date=day, calories=float(rng.uniform(200, 900))))
+        else:
+            records.append(HealthDataCreate(data_type="sleep", date=day, sleep_duration=float(rng.uniform(5, 9))))
+    return records
+
+
+def create_user(prefix):
+    db = SessionLocal()
+    try:
+        user = User(username=f"{prefix}user", email=f"{prefix}user@example.com", hashed_password="benchmark")
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def run_direct(user_id, records, threads):
+    def submit(chunk):
+        db = SessionLocal()
+        try:
+            for record in chunk:
+                HealthDataService.create_health_data(db, user_id, record)
+        finally:
+            db.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(submit, np.array_split(np.array(records, dtype=object), threads)))
+    seconds = time.perf_counter() - started
+    return {"records": len(records), "seconds": seconds, "records_per_second": len(records) / seconds}
+
+
+def run_buffered(user_id, records, threads, batch_size, args):
+    log_dir = tempfile.mkdtemp(prefix="ingest-bench-")
+    buffer = IngestBuffer(
+        log_dir=log_dir,
+        node_id=f"benchmark-{os.getpid()}",
+        segment_bytes=args.segment_bytes,
+        flush_interval=args.flush_interval,
+        flush_batch=args.flush_batch,
+        max_pending=len(records) + 1
+    )
+    buffer.start()
+    latencies = []
+
+    def submit(chunk):
+        for start in range(0, len(chunk), batch_size):
+            began = time.perf_counter()
+            buffer.append(user_id, list(chunk[start:start + batch_size]))
+            latencies.append((time.perf_counter() - began) * 1000)
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(submit, np.array_split(np.array(records, dtype=object), threads)))
+        accepted_seconds = time.perf_counter() - started
+        while buffer.stats()["pending"]:
+            time.sleep(0.05)
+        drained_seconds = time.perf_counter() - started
+        stats = buffer.stats()
+    finally:
+        buffer.stop()
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+    return {
+        "records": len(records),
+        "batch_size": batch_size,
+        "accepted_seconds": accepted_seconds,
+        "accepted_per_second": len(records) / accepted_seconds,
+        "inserted_per_second": len(records) / drained_seconds,
+        "ack_p50_ms": float(np.percentile(latencies, 50)),
+        "ack_p99_ms": float(np.percentile(latencies, 99)),
+        "records_per_fsync": stats["records_per_fsync"],
+        "flushes": stats["flushes"],
+        "lag_p50_seconds": stats["lag_p50_seconds"],
+        "lag_p99_seconds": stats["lag_p99_seconds"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--direct-records", type=int, default=2_000, help="Records for the one-commit-per-record run")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 50], help="Records per append call")
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--flush-batch", type=int, default=1000)
+    parser.add_argument("--segment-bytes", type=int, default=16 * 1024 * 1024)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    rng = np.random.default_rng(args.seed)
+    user_id = create_user(f"ingest{int(time.time())}")
+    report = {"direct": run_direct(user_id, synthetic_records(rng, args.direct_records), args.threads)}
+    for batch_size in args.batch_sizes:
+        report[f"buffered_batch_{batch_size}"] = run_buffered(
+            user_id, synthetic_records(rng, args.records), args.threads, batch_size, args
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for AIHealthPlanService and HealthDataService
+
+Times _extract_user_features, calculate_bmr, analyze_health_data,
+generate_personalized_plan and get_health_data_statistics against an
+in-memory SQLite database. Each runs once per history size: a user with
+that many health records spread over the last 90 days. The functions
+that read history are timed cold (per-user series cache cleared before
+each call) and warm.
+
+Save a baseline, then compare later runs against it. The compare run
+exits with status 1 if any case's median time per call grew by more than
+--threshold:
+
+    python benchmarks/micro.py --sizes 10 1000 100000 --save
+    python benchmarks/micro.py --compare --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.database import Base
+from app.models.health_records import HEALTH_RECORD_MODELS
+from app.models.user import User
+from app.services.ai_service import get_ai_service
+from app.services.health_data_cache import health_data_cache
+from app.services.health_data_service import HealthDataService
+
+DEFAULT_BASELINE = "./data/micro_baseline.json"
+HISTORY_DAYS = 90
+
+
+def in_memory_session():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+def seed_user(db, size: int) -> User:
+    """A user with size health records, a third of each type, on random days of the last 90"""
+    user = User(
+        username=f"micro{size}",
+        email=f"micro{size}@example.com",
+        hashed_password="x",
+        gender="female",
+        height=165.0,
+        weight=62.0,
+        date_of_birth=date(1988, 5, 17),
+        activity_level="moderately_active",
+        health_goal="weight_loss"
+    )
+    db.add(user)
+    db.commit()
+
+    rng = np.random.default_rng(size)
+    today = date.today()
+    days = rng.integers(0, HISTORY_DAYS, size)
+    rows = {"exercise": [], "diet": [], "sleep": []}
+    for i, offset in enumerate(days):
+        day = today - timedelta(days=int(offset))
+        kind = ("exercise", "diet", "sleep")[i % 3]
+        if kind == "exercise":
+            rows[kind].append({
+                "user_id": user.id, "date": day, "exercise_type": "running",
+                "duration": float(rng.uniform(10, 90)), "calories_burned": float(rng.uniform(50, 700))
+            })
+        elif kind == "diet":
+            rows[kind].append({"user_id": user.id, "date": day, "meal_type": "lunch", "calories": float(rng.uniform(200, 900))})
+        else:
+            rows[kind].append({"user_id": user.id, "date": day, "sleep_duration": float(rng.uniform(5, 9))})
+    for kind, kind_rows in rows.items():
+        if kind_rows:
+            db.execute(insert(HEALTH_RECORD_MODELS[kind]), kind_rows)
+    db.commit()
+    return user
+
+
+def time_call(function, setup, min_seconds: float, repeats: int) -> dict:
+    """Seconds per call: calls are batched so each repeat lasts at least min_seconds"""
+    def run(n: int) -> float:
+        total = 0.0
+        for _ in range(n):
+            setup()
+            started = time.perf_counter()
+            function()
+            total += time.perf_counter() - started
+        return total
+
+    run(1)
+    number = 1
+    while run(number) < min_seconds and number < 1_000_000:
+        number *= 10
+    samples = [run(number) / number for _ in range(repeats)]
+    return {
+        "calls": number,
+        "median_us": statistics.median(samples) * 1e6,
+        "min_us": min(samples) * 1e6,
+    }
+
+
+def cases(db, user: User):
+    """(name, function, setup) for one seeded user"""
+    service = get_ai_service()
+    analysis = service.analyze_health_data(db, user.id)
+    no_setup = lambda: None
+
+    def cold():
+        health_data_cache.clear()
+
+    return [
+        ("calculate_bmr", lambda: service.calculate_bmr(user), no_setup),
+        ("_extract_user_features", lambda: service._extract_user_features(user, analysis), no_setup),
+        ("analyze_health_data[cold]", lambda: service.analyze_health_data(db, user.id), cold),
+        ("analyze_health_data[warm]", lambda: service.analyze_health_data(db, user.id), no_setup),
+        ("generate_personalized_plan[cold]", lambda: service.generate_personalized_plan(db, user), cold),
+        ("generate_personalized_plan[warm]", lambda: service.generate_personalized_plan(db, user), no_setup),
+        (
+            "get_health_data_statistics[cold]",
+            lambda: HealthDataService.get_health_data_statistics(db, user.id, 30),
+            cold
+        ),
+        (
+            "get_health_data_statistics[warm]",
+            lambda: HealthDataService.get_health_data_statistics(db, user.id, 30),
+            no_setup
+        ),
+    ]
+
+
+def run_suite(args) -> dict:
+    db = in_memory_session()
+    results = {}
+    try:
+        for size in args.sizes:
+            user = seed_user(db, size)
+            health_data_cache.clear()
+            for name, function, setup in cases(db, user):
+                if args.only and not any(part in name for part in args.only):
+                    continue
+                results[f"{name}/{size}"] = time_call(function, setup, args.min_time, args.repeats)
+    finally:
+        db.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> dict:
+    report, regressions = {}, []
+    for case, result in results.items():
+        before = baseline.get(case)
+        if before is None:
+            report[case] = {"median_us": result["median_us"], "baseline_us": None}
+            continue
+        change = result["median_us"] / before["median_us"] - 1
+        report[case] = {"median_us": result["median_us"], "baseline_us": before["median_us"], "change": change}
+        if change > threshold:
+            regressions.append(case)
+    return {"threshold": threshold, "cases": report, "regressions": regressions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000], help="History rows per user")
+    parser.add_argument("--only", nargs="+", help="Run only cases whose name contains one of these")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per repeat")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--save", action="store_true", help="Write the results as the new baseline")
+    mode.add_argument("--compare", action="store_true", help="Fail if a case is slower than the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results}, f, indent=2)
+    if args.compare:
+        with open(args.baseline) as f:
+            report = compare(results, json.load(f)["results"], args.threshold)
+        print(json.dumps(report, indent=2))
+        if report["regressions"]:
+            sys.exit(1)
+        return
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark the similar-user (peer) index
+
+Builds the IVF index over synthetic user feature vectors, applies a batch
+of incremental inserts, then reports query latency and recall@k against
+exact brute-force search for several nprobe settings:
+
+    python benchmarks/peer_index.py --users 1000000 --queries 500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.services.peer_index import PeerIndex
+from benchmarks.segmentation import synthetic_features
+
+
+def exact_neighbours(index_state_ids, scaled, query, k, exclude):
+    distances = ((scaled - query) ** 2).sum(axis=1)
+    distances[index_state_ids == exclude] = np.inf
+    top = np.argpartition(distances, k)[:k]
+    return set(index_state_ids[top].tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--inserts", type=int, default=5_000, help="Incremental updates applied after the build")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--recall-queries", type=int, default=100, help="Queries checked against exact search")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    user_ids = np.arange(1, args.users + 1)
+    features = synthetic_features(rng, args.users)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = PeerIndex(os.path.join(tmp, "peer_index.joblib"), nprobe=16, max_delta=10 ** 9, reload_seconds=60)
+
+        started = time.perf_counter()
+        state = index.build(user_ids, features)
+        build_seconds = time.perf_counter() - started
+
+        # Profile updates for existing users go through the delta buffer
+        insert_us = []
+        for _ in range(args.inserts):
+            user_id = int(rng.integers(1, args.users + 1))
+            features[user_id - 1] = synthetic_features(rng, 1)[0]
+            started = time.perf_counter()
+            index.insert(user_id, features[user_id - 1])
+            insert_us.append((time.perf_counter() - started) * 1e6)
+
+        scaled = state.transform(features)
+        query_ids = rng.integers(1, args.users + 1, args.queries)
+        results = {}
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            latencies, recalls = [], []
+            for n, user_id in enumerate(query_ids):
+                query = features[user_id - 1]
+                started = time.perf_counter()
+                found = index.query(query, args.k, exclude_user_id=int(user_id))
+                latencies.append((time.perf_counter() - started) * 1000)
+                if n < args.recall_queries:
+                    exact = exact_neighbours(user_ids, scaled, state.transform(query), args.k, user_id)
+                    recalls.append(len(exact & {peer_id for peer_id, _, _ in found}) / args.k)
+            latencies = np.array(latencies)
+            results[f"nprobe={nprobe}"] = {
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "recall_at_k": float(np.mean(recalls)),
+            }
+
+        started = time.perf_counter()
+        index.compact()
+        compact_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        "users": args.users,
+        "k": args.k,
+        "cells": int(len(state.centroids)),
+        "build_seconds": build_seconds,
+        "insert_p50_us": float(np.percentile(insert_us, 50)) if insert_us else None,
+        "delta_size": args.inserts,
+        "compact_seconds": compact_seconds,
+        "queries": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
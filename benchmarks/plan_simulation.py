@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark what-if plan projections (POST /api/health/plan/simulate)
+
+Projects grids of exercise minutes, weekly exercise days and calorie targets
+over --days, all scenarios at once with NumPy, and one scenario at a time in
+a Python loop for comparison. Reports scenarios per second and checks both
+give the same final weights:
+
+    python benchmarks/plan_simulation.py --scenarios 10 100 1000 --days 30 90
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.services.plan_simulator import EXERCISE_KCAL_PER_KG_MINUTE, KCAL_PER_KG, project
+
+# Moderately active 35 year old man, 175 cm, 80 kg
+START_WEIGHT = 80.0
+MULTIPLIER = 1.55
+OFFSET = 6.25 * 175 - 5 * 35 + 5
+
+
+def grids(scenarios: int):
+    """Parameter arrays of about the requested size, in the endpoint's grid order"""
+    days = np.arange(2, 6)
+    side = max(1, int(round((scenarios / len(days)) ** 0.5)))
+    minutes = np.linspace(0, 90, side)
+    calories = np.linspace(1500, 3000, side)
+    return [grid.ravel() for grid in np.meshgrid(minutes, days, calories, indexing="ij")]
+
+
+def python_project(minutes, weekly_days, calories, duration_days):
+    final = []
+    for m, d, c in zip(minutes, weekly_days, calories):
+        weight = START_WEIGHT
+        for day in range(duration_days):
+            exercise = EXERCISE_KCAL_PER_KG_MINUTE * m * weight if day % 7 < d else 0.0
+            weight += (c - MULTIPLIER * (10 * weight + OFFSET) - exercise) / KCAL_PER_KG
+        final.append(weight)
+    return np.array(final)
+
+
+def time_call(function, min_seconds: float = 0.2) -> float:
+    """Seconds per call, repeated for at least min_seconds"""
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--days", type=int, nargs="+", default=[30, 90])
+    args = parser.parse_args()
+
+    results = []
+    for duration_days in args.days:
+        for scenarios in args.scenarios:
+            minutes, weekly_days, calories = grids(scenarios)
+            vectorised = lambda: project(
+                START_WEIGHT, MULTIPLIER, OFFSET, minutes, weekly_days, calories, duration_days
+            )
+            looped = lambda: python_project(minutes, weekly_days, calories, duration_days)
+            vectorised_seconds = time_call(vectorised)
+            looped_seconds = time_call(looped)
+            error = np.abs(vectorised()["weight"][:, -1] - looped()).max()
+            results.append({
+                "days": duration_days,
+                "scenarios": len(calories),
+                "numpy_ms": round(vectorised_seconds * 1000, 3),
+                "numpy_scenarios_per_second": round(len(calories) / vectorised_seconds),
+                "python_ms": round(looped_seconds * 1000, 3),
+                "python_scenarios_per_second": round(len(calories) / looped_seconds),
+                "speedup": round(looped_seconds / vectorised_seconds, 1),
+                "max_weight_difference_kg": float(error),
+            })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark the compiled recommendation rule engine
+
+Evaluates synthetic rule sets of increasing size over random health data
+analyses, one user at a time and as a batch, and compares with checking
+each condition in a Python loop:
+
+    python benchmarks/rule_engine.py --rules 10 100 1000 --users 10000
+"""
+import argparse
+import json
+import operator
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.services.rule_engine import RuleSet
+
+NUMERIC_FIELDS = {
+    "exercise_frequency": (0, 30),
+    "average_exercise_duration": (0, 120),
+    "total_calories_burned": (0, 15000),
+    "average_sleep_hours": (3, 11),
+    "average_daily_calories": (800, 4500),
+}
+GOALS = ["weight_loss", "weight_gain", "muscle_gain", "endurance", "general_health"]
+PYTHON_OPS = {
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+    "==": operator.eq, "!=": operator.ne, "in": lambda a, b: a in b,
+}
+
+
+def synthetic_rules(rng, n):
+    rules = []
+    fields = list(NUMERIC_FIELDS)
+    for i in range(n):
+        conditions = []
+        for field in rng.choice(fields, size=int(rng.integers(1, 4)), replace=False):
+            low, high = NUMERIC_FIELDS[field]
+            conditions.append({
+                "field": str(field),
+                "op": str(rng.choice(["<", "<=", ">", ">="])),
+                "value": round(float(rng.uniform(low, high)), 1)
+            })
+        if rng.random() < 0.3:
+            conditions.append({"field": "goal", "op": "in", "value": list(rng.choice(GOALS, 2, replace=False))})
+        rules.append({
+            "id": f"rule_{i}",
+            "type": "exercise",
+            "priority": str(rng.choice(["high", "medium", "low"])),
+            "when": conditions,
+            "message": "Average sleep {average_sleep_hours:.1f} h"
+        })
+    return rules
+
+
+def synthetic_contexts(rng, n):
+    columns = {field: rng.uniform(low, high, n) for field, (low, high) in NUMERIC_FIELDS.items()}
+    goals = rng.choice(GOALS, n)
+    return [
+        {**{field: float(values[i]) for field, values in columns.items()}, "goal": str(goals[i])}
+        for i in range(n)
+    ]
+
+
+def python_evaluate(rules, context):
+    matched = []
+    for rule in rules:
+        if all(PYTHON_OPS[c["op"]](context.get(c["field"]), c["value"]) for c in rule["when"]):
+            matched.append({
+                "type": rule["type"], "priority": rule["priority"],
+                "message": rule["message"].format_map(context)
+            })
+    return matched
+
+
+def per_call_us(fn, items):
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - started) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--users", type=int, default=10_000, help="Batch size")
+    parser.add_argument("--single", type=int, default=500, help="Single-user evaluations to time")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    contexts = synthetic_contexts(rng, args.users)
+    report = {}
+    for n_rules in args.rules:
+        rules = synthetic_rules(rng, n_rules)
+        started = time.perf_counter()
+        rule_set = RuleSet(rules)
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        single = contexts[:args.single]
+        for context in single[:20]:
+            assert rule_set.evaluate(context) == python_evaluate(rules, context)
+
+        columns = {field: [c.get(field) for c in contexts] for field in rule_set.fields}
+        X = rule_set.matrix(columns, len(contexts))
+        started = time.perf_counter()
+        mask = rule_set.evaluate_matrix(X)
+        mask_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        rule_set.evaluate_batch(contexts)
+        batch_ms = (time.perf_counter() - started) * 1000
+
+        report[f"{n_rules}_rules"] = {
+            "compile_ms": compile_ms,
+            "single_compiled_us": per_call_us(rule_set.evaluate, single),
+            "single_python_us": per_call_us(lambda c: python_evaluate(rules, c), single),
+            "batch_users": len(contexts),
+            "batch_mask_ms": mask_ms,
+            "batch_with_messages_ms": batch_ms,
+            "batch_python_ms": per_call_us(lambda c: python_evaluate(rules, c), contexts) * len(contexts) / 1000,
+            "mean_matches": float(mask.sum(axis=1).mean()),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark online user segmentation
+
+Measures per-event update cost (queueing the vector, plus the batched
+scaler and MiniBatchKMeans.partial_fit folds),
+single-vector assignment latency and full refit time on synthetic
+feature vectors shaped like _extract_user_features output:
+
+    python benchmarks/segmentation.py --users 100000 --events 5000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+
+from app.services.segmentation_service import UserSegmentationService
+
+
+def synthetic_features(rng: np.random.Generator, n: int) -> np.ndarray:
+    """Height, weight, gender, age, activity, exercise freq/duration/kcal, sleep, diet kcal"""
+    return np.column_stack([
+        rng.normal(172, 9, n),
+        rng.normal(72, 14, n),
+        rng.integers(0, 2, n),
+        rng.integers(18, 75, n),
+        rng.integers(1, 6, n),
+        rng.poisson(8, n),
+        rng.gamma(4, 10, n),
+        rng.gamma(3, 1500, n),
+        rng.normal(7, 1.1, n),
+        rng.normal(600, 180, n),
+    ]).astype(np.float64)
+
+
+def percentiles(samples_us: list) -> dict:
+    samples = np.array(samples_us)
+    return {
+        "mean_us": float(samples.mean()),
+        "p50_us": float(np.percentile(samples, 50)),
+        "p99_us": float(np.percentile(samples, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--events", type=int, default=5_000)
+    parser.add_argument("--clusters", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    population = synthetic_features(rng, args.users)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = UserSegmentationService(
+            n_clusters=args.clusters,
+            model_path=os.path.join(tmp, "segmentation.joblib"),
+            save_every=0,
+            drift_threshold=0.25
+        )
+
+        # Warm up so centroids exist before timing
+        for user_id in range(args.clusters * 4):
+            service.update(user_id, population[user_id])
+
+        update_us, assign_us = [], []
+        for i in range(args.events):
+            user_id = int(rng.integers(args.users))
+            started = time.perf_counter()
+            service.update(user_id, population[user_id])
+            update_us.append((time.perf_counter() - started) * 1e6)
+
+            started = time.perf_counter()
+            service.assign(population[user_id])
+            assign_us.append((time.perf_counter() - started) * 1e6)
+
+        started = time.perf_counter()
+        scaled = StandardScaler().fit_transform(population)
+        MiniBatchKMeans(n_clusters=args.clusters, n_init=3, batch_size=256, random_state=42).fit(scaled)
+        refit_s = time.perf_counter() - started
+
+    print(json.dumps({
+        "users": args.users,
+        "events": args.events,
+        "update": percentiles(update_us),
+        "assign": percentiles(assign_us),
+        "full_refit_seconds": refit_s,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
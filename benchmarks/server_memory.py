@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Report resident and shared memory per worker for each server mode
+
+Starts the server in each mode, waits for /health, warms every worker with
+a few requests, then reads /proc/<pid>/smaps_rollup for the parent and all
+of its descendants. PSS (proportional set size) splits shared pages between
+the processes sharing them, so its sum is the real footprint of the setup.
+Linux only:
+
+    python benchmarks/server_memory.py --workers 4
+    python benchmarks/server_memory.py --modes prefork uvicorn --warmup 200
+
+Modes:
+    prefork     python -m app.server (models loaded once, shared copy-on-write)
+    no_preload  python -m app.server --no-preload (each worker loads its own)
+    uvicorn     uvicorn app.main:app --workers N (the previous setup)
+"""
+import argparse
+import json
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def commands(workers: int, port: int) -> dict:
+    server = [sys.executable, "-m", "app.server", "--workers", str(workers), "--port", str(port)]
+    return {
+        "prefork": server,
+        "no_preload": server + ["--no-preload"],
+        "uvicorn": [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--workers", str(workers), "--port", str(port), "--no-access-log"
+        ],
+    }
+
+
+def children_of(pid: int) -> list:
+    found = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                found += [int(child) for child in f.read().split()]
+        except OSError:
+            pass
+    return found
+
+
+def descendants(pid: int) -> list:
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        stack += children_of(current)
+    return pids
+
+
+def memory_of(pid: int) -> dict:
+    """smaps_rollup fields of one process, in MB"""
+    usage = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in SMAPS_FIELDS:
+                usage[name.lower()] = int(value.split()[0]) / 1024
+    usage["shared"] = usage.pop("shared_clean") + usage.pop("shared_dirty")
+    usage["private"] = usage.pop("private_clean") + usage.pop("private_dirty")
+    return {key: round(value, 1) for key, value in usage.items()}
+
+
+def wait_ready(base_url: str, process, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+
+def measure(mode: str, command: list, args) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    # app.server refuses several workers on per-process caches
+    env = {
+        **os.environ,
+        "CACHE_BACKEND": os.environ.get("CACHE_BACKEND", "disk"),
+        "CACHE_SECRET": os.environ.get("CACHE_SECRET") or secrets.token_hex(32)
+    }
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(base_url, process, args.startup_timeout)
+        # Touch every worker's copy of the models and caches
+        username = f"memory{mode}{int(time.time())}"
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            client.post("/api/auth/register", json={
+                "username": username,
+                "email": f"{username}@example.com",
+                "password": "benchmark123",
+                "gender": "female",
+                "height": 165,
+                "weight": 60,
+                "date_of_birth": "1990-01-01",
+                "activity_level": "moderately_active",
+                "health_goal": "weight_loss"
+            })
+            response = client.post("/api/auth/login", data={"username": username, "password": "benchmark123"})
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            for _ in range(args.warmup):
+                # Rate limited responses are fine here; only the memory touched matters
+                client.get("/api/health/recommendations", headers=headers)
+                client.get("/api/health/statistics", headers=headers)
+        time.sleep(args.settle)
+
+        pids = descendants(process.pid)
+        processes = {pid: memory_of(pid) for pid in pids}
+        workers = [usage for pid, usage in processes.items() if pid != process.pid]
+        return {
+            "command": " ".join(command),
+            "parent": processes[process.pid],
+            "workers": workers,
+            "total_rss_mb": round(sum(usage["rss"] for usage in processes.values()), 1),
+            "total_pss_mb": round(sum(usage["pss"] for usage in processes.values()), 1),
+            "mean_worker_private_mb": round(
+                sum(usage["private"] for usage in workers) / len(workers), 1
+            ) if workers else None,
+        }
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["prefork", "no_preload", "uvicorn"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--warmup", type=int, default=100, help="Request pairs sent before measuring")
+    parser.add_argument("--settle", type=float, default=2, help="Seconds to wait after warm-up")
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    args = parser.parse_args()
+
+    available = commands(args.workers, args.port)
+    report = {}
+    for mode in args.modes:
+        try:
+            report[mode] = measure(mode, available[mode], args)
+        except Exception as e:
+            report[mode] = {"error": str(e)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Compare the per-type health record tables with the legacy wide table
+
+Reports table/index size, buffer cache hit ratio and scan time of the
+queries behind analyze_health_data for both layouts. Run against a
+PostgreSQL database that went through the split migration:
+
+    python benchmarks/storage_split.py --users 200 --days 30
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+
+TYPED_TABLES = ("health_exercise", "health_diet", "health_sleep")
+
+# Queries analyze_health_data needs per user and window, for each layout
+LEGACY_QUERIES = (
+    "SELECT date, duration, calories_burned, distance FROM {legacy} "
+    "WHERE user_id = :user_id AND date >= :start AND date <= :end AND data_type = 'exercise'",
+    "SELECT date, calories, protein, carbs, fats, fiber FROM {legacy} "
+    "WHERE user_id = :user_id AND date >= :start AND date <= :end AND data_type = 'diet'",
+    "SELECT date, sleep_duration FROM {legacy} "
+    "WHERE user_id = :user_id AND date >= :start AND date <= :end AND data_type = 'sleep'",
+)
+TYPED_QUERIES = (
+    "SELECT date, duration, calories_burned, distance FROM health_exercise "
+    "WHERE user_id = :user_id AND date >= :start AND date <= :end",
+    "SELECT date, calories, protein, carbs, fats, fiber FROM health_diet "
+    "WHERE user_id = :user_id AND date >= :start AND date <= :end",
+    "SELECT date, sleep_duration FROM health_sleep "
+    "WHERE user_id = :user_id AND date >= :start AND date <= :end",
+)
+
+
+def table_sizes(conn, table: str) -> dict:
+    row = conn.execute(
+        text("SELECT pg_table_size(:t), pg_indexes_size(:t), pg_total_relation_size(:t)"),
+        {"t": table}
+    ).one()
+    return {"table_bytes": row[0], "index_bytes": row[1], "total_bytes": row[2]}
+
+
+def block_counters(conn, tables) -> dict:
+    rows = conn.execute(
+        text(
+            "SELECT COALESCE(SUM(heap_blks_read), 0), COALESCE(SUM(heap_blks_hit), 0), "
+            "COALESCE(SUM(idx_blks_read), 0), COALESCE(SUM(idx_blks_hit), 0) "
+            "FROM pg_statio_user_tables WHERE relname = ANY(:tables)"
+        ),
+        {"tables": list(tables)}
+    ).one()
+    return {"heap_read": rows[0], "heap_hit": rows[1], "idx_read": rows[2], "idx_hit": rows[3]}
+
+
+def hit_ratio(before: dict, after: dict) -> dict:
+    delta = {key: after[key] - before[key] for key in before}
+    reads = delta["heap_read"] + delta["idx_read"]
+    hits = delta["heap_hit"] + delta["idx_hit"]
+    return {
+        "blocks_read": reads,
+        "blocks_hit": hits,
+        "hit_ratio": hits / (reads + hits) if reads + hits else None
+    }
+
+
+def time_layout(conn, queries, tables, user_ids, start, end) -> dict:
+    before = block_counters(conn, tables)
+    timings = []
+    for user_id in user_ids:
+        params = {"user_id": user_id, "start": start, "end": end}
+        began = time.perf_counter()
+        for query in queries:
+            conn.execute(text(query), params).all()
+        timings.append((time.perf_counter() - began) * 1000)
+    # Statistics collector updates are asynchronous; give it a moment
+    time.sleep(1)
+    timings.sort()
+    return {
+        "users": len(user_ids),
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        **hit_ratio(before, block_counters(conn, tables))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--legacy-table", default="health_data_legacy")
+    parser.add_argument("--users", type=int, default=200, help="Number of users to sample")
+    parser.add_argument("--days", type=int, default=30, help="Analysis window in days")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    end = date.today()
+    start = end - timedelta(days=args.days)
+    legacy_queries = [query.format(legacy=args.legacy_table) for query in LEGACY_QUERIES]
+
+    with engine.connect() as conn:
+        user_ids = [row[0] for row in conn.execute(text(f"SELECT DISTINCT user_id FROM {args.legacy_table}"))]
+        random.Random(args.seed).shuffle(user_ids)
+        user_ids = user_ids[:args.users]
+
+        report = {
+            "sizes": {
+                table: table_sizes(conn, table)
+                for table in (args.legacy_table,) + TYPED_TABLES
+            },
+            "window_days": args.days,
+            "legacy": time_layout(conn, legacy_queries, [args.legacy_table], user_ids, start, end),
+            "typed": time_layout(conn, TYPED_QUERIES, TYPED_TABLES, user_ids, start, end),
+        }
+        report["sizes"]["typed_total_bytes"] = sum(
+            report["sizes"][table]["total_bytes"] for table in TYPED_TABLES
+        )
+
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
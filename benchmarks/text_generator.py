@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark text generator backends: tokens/second, latency and memory
+
+Each backend runs in a fresh process so its resident memory is measured
+on its own. Every prompt generates exactly --tokens new tokens, so
+tokens/second is comparable across backends:
+
+    python scripts/export_text_generator.py --quantize avx2
+    python benchmarks/text_generator.py --backends pytorch onnx --prompts 20 --tokens 60
+
+A backend may also be given as backend=path to compare model directories,
+e.g. onnx=./models/text_generator_onnx_fp32.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+PROMPTS = (
+    "A personalized health plan for weight loss should",
+    "To improve sleep quality, a busy adult can",
+    "For building muscle, a beginner's weekly routine",
+    "Healthy eating on a budget starts with",
+    "After a long day at a desk, light exercise",
+)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_one(spec: str, args) -> dict:
+    from app.services.text_generator import load_text_generator
+
+    backend, _, model_path = spec.partition("=")
+    baseline_mb = rss_mb()
+    started = time.perf_counter()
+    generator = load_text_generator(backend, model_path or None, threads=args.threads)
+    if generator is None:
+        raise RuntimeError(f"Could not load backend {spec}")
+    load_seconds = time.perf_counter() - started
+    loaded_mb = rss_mb()
+
+    options = {"min_new_tokens": args.tokens, "do_sample": False}
+    generator.generate(PROMPTS[0], args.tokens, **options)
+    latencies = []
+    for i in range(args.prompts):
+        started = time.perf_counter()
+        generator.generate(PROMPTS[i % len(PROMPTS)], args.tokens, **options)
+        latencies.append(time.perf_counter() - started)
+    latencies = np.array(latencies)
+
+    return {
+        "backend": backend,
+        "model_path": generator.model_path,
+        "model_file": generator.model_file,
+        "load_seconds": load_seconds,
+        "tokens_per_second": args.tokens * len(latencies) / latencies.sum(),
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "model_rss_mb": round(loaded_mb - baseline_mb, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["pytorch", "onnx"])
+    parser.add_argument("--prompts", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=60, help="New tokens per prompt")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads, 0 = runtime default")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(args.run_one, args)))
+        return
+
+    report = {}
+    for spec in args.backends:
+        command = [
+            sys.executable, os.path.abspath(__file__), "--run-one", spec,
+            "--prompts", str(args.prompts), "--tokens", str(args.tokens), "--threads", str(args.threads)
+        ]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            lines = (result.stdout + result.stderr).strip().splitlines()
+            report[spec] = {"error": lines[-1] if lines else "failed", "output": result.stdout.strip()}
+            continue
+        report[spec] = json.loads(result.stdout.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
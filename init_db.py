@@ -3,7 +3,7 @@
 数据库初始化脚本
 """
 from app.core.database import Base, engine
-from app.models import user, health_data
+from app.models import user, health_data, health_records, user_segment, ingest_checkpoint, precompute_checkpoint, auth_session, plan_text, metric_stats, plan_progress
 
 def init_db():
     """初始化数据库表"""
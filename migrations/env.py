@@ -9,7 +9,7 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from app.core.database import Base
-from app.models import user, health_data  # 导入所有模型
+from app.models import user, health_data, health_records, user_segment, ingest_checkpoint, precompute_checkpoint, auth_session, plan_text, metric_stats, plan_progress  # 导入所有模型
 
 # Alembic Config 对象
 config = context.config
@@ -0,0 +1,139 @@
+"""split health_data into per-type tables
+
+Revision ID: 5b7e3c1d9a42
+Revises: 
+Create Date: 2026-10-19 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e3c1d9a42'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+COMMON_COLUMNS = ("id", "user_id", "date", "notes", "created_at", "updated_at")
+
+RECORD_TABLES = {
+    "health_exercise": ("exercise", ("exercise_type", "duration", "calories_burned", "distance", "intensity")),
+    "health_diet": ("diet", ("meal_type", "food_name", "calories", "protein", "carbs", "fats", "fiber")),
+    "health_sleep": ("sleep", ("sleep_duration", "sleep_quality", "bed_time", "wake_time")),
+}
+
+# Column order and types exposed by the compatibility view
+VIEW_COLUMNS = (
+    ("exercise_type", "varchar"), ("duration", "double precision"),
+    ("calories_burned", "double precision"), ("distance", "double precision"),
+    ("intensity", "varchar"), ("meal_type", "varchar"), ("food_name", "varchar"),
+    ("calories", "double precision"), ("protein", "double precision"),
+    ("carbs", "double precision"), ("fats", "double precision"), ("fiber", "double precision"),
+    ("sleep_duration", "double precision"), ("sleep_quality", "varchar"),
+    ("bed_time", "timestamp"), ("wake_time", "timestamp"),
+)
+
+
+def _common_columns():
+    return [
+        sa.Column("id", sa.Integer(), server_default=sa.text("nextval('health_record_id_seq')"), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("notes", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+    ]
+
+
+def upgrade() -> None:
+    if "health_data" not in sa.inspect(op.get_bind()).get_table_names():
+        # Fresh database: the typed tables come from Base.metadata.create_all
+        return
+
+    op.execute("CREATE SEQUENCE health_record_id_seq")
+
+    op.create_table(
+        "health_exercise",
+        *_common_columns(),
+        sa.Column("exercise_type", sa.String(length=50), nullable=True),
+        sa.Column("duration", sa.Float(), nullable=True),
+        sa.Column("calories_burned", sa.Float(), nullable=True),
+        sa.Column("distance", sa.Float(), nullable=True),
+        sa.Column("intensity", sa.String(length=20), nullable=True),
+    )
+    op.create_table(
+        "health_diet",
+        *_common_columns(),
+        sa.Column("meal_type", sa.String(length=20), nullable=True),
+        sa.Column("food_name", sa.String(length=100), nullable=True),
+        sa.Column("calories", sa.Float(), nullable=True),
+        sa.Column("protein", sa.Float(), nullable=True),
+        sa.Column("carbs", sa.Float(), nullable=True),
+        sa.Column("fats", sa.Float(), nullable=True),
+        sa.Column("fiber", sa.Float(), nullable=True),
+    )
+    op.create_table(
+        "health_sleep",
+        *_common_columns(),
+        sa.Column("sleep_duration", sa.Float(), nullable=True),
+        sa.Column("sleep_quality", sa.String(length=20), nullable=True),
+        sa.Column("bed_time", sa.DateTime(), nullable=True),
+        sa.Column("wake_time", sa.DateTime(), nullable=True),
+    )
+
+    # Copy existing rows, keeping their ids
+    for table, (data_type, fields) in RECORD_TABLES.items():
+        columns = COMMON_COLUMNS + fields
+        selected = [
+            f"COALESCE({name}, now())" if name in ("created_at", "updated_at") else name
+            for name in columns
+        ]
+        op.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"SELECT {', '.join(selected)} FROM health_data WHERE data_type = '{data_type}'"
+        )
+        op.create_index(f"ix_{table}_user_date", table, ["user_id", "date"])
+        op.execute(f"ANALYZE {table}")
+    op.execute("SELECT setval('health_record_id_seq', COALESCE((SELECT MAX(id) FROM health_data), 0) + 1, false)")
+
+    # Keep the wide table around and expose the old shape as a read-only view
+    op.rename_table("health_data", "health_data_legacy")
+    selects = []
+    for table, (data_type, fields) in RECORD_TABLES.items():
+        projected = [
+            name if name in fields else f"NULL::{sql_type} AS {name}"
+            for name, sql_type in VIEW_COLUMNS
+        ]
+        selects.append(
+            f"SELECT id, user_id, '{data_type}'::varchar AS data_type, date, "
+            f"{', '.join(projected)}, notes, created_at, updated_at FROM {table}"
+        )
+    op.execute("CREATE VIEW health_data AS " + " UNION ALL ".join(selects))
+
+
+def downgrade() -> None:
+    if "health_data_legacy" not in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.execute("DROP VIEW health_data")
+    op.rename_table("health_data_legacy", "health_data")
+
+    # Carry over rows written after the split
+    legacy_max_id = op.get_bind().execute(sa.text("SELECT COALESCE(MAX(id), 0) FROM health_data")).scalar()
+    for table, (data_type, fields) in RECORD_TABLES.items():
+        columns = ", ".join(COMMON_COLUMNS + fields)
+        op.execute(
+            f"INSERT INTO health_data (data_type, {columns}) "
+            f"SELECT '{data_type}', {columns} FROM {table} WHERE id > {int(legacy_max_id)}"
+        )
+    op.execute(
+        "SELECT setval(pg_get_serial_sequence('health_data', 'id'), "
+        "(SELECT COALESCE(MAX(id), 0) + 1 FROM health_data), false)"
+    )
+
+    for table in RECORD_TABLES:
+        op.drop_table(table)
+    op.execute("DROP SEQUENCE health_record_id_seq")
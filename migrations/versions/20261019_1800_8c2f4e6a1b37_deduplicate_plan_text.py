@@ -0,0 +1,108 @@
+"""move health plan text into content-addressed blobs
+
+Revision ID: 8c2f4e6a1b37
+Revises: 5b7e3c1d9a42
+Create Date: 2026-10-19 18:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2f4e6a1b37'
+down_revision = '5b7e3c1d9a42'
+branch_labels = None
+depends_on = None
+
+TEXT_FIELDS = ("description", "exercise_plan", "diet_suggestions")
+
+
+def _hash(expression: str) -> str:
+    # Same as hashlib.sha256(text.encode()).hexdigest() in app/services/plan_text_store.py
+    return f"encode(sha256(convert_to({expression}, 'UTF8')), 'hex')"
+
+
+def _any_text(prefix: str = "") -> str:
+    return " OR ".join(f"{prefix}{field} IS NOT NULL" for field in TEXT_FIELDS)
+
+
+def _sizes(bind) -> dict:
+    inline = " + ".join(f"COALESCE(octet_length({field}), 0)" for field in TEXT_FIELDS)
+    plans, inline_bytes = bind.execute(sa.text(f"SELECT count(*), COALESCE(sum({inline}), 0) FROM health_plans")).one()
+    blobs, blob_bytes = bind.execute(sa.text("SELECT count(*), COALESCE(sum(size), 0) FROM plan_text_blobs")).one()
+    relations = {
+        table: bind.execute(sa.text(f"SELECT pg_total_relation_size('{table}')")).scalar()
+        for table in ("health_plans", "health_plan_texts", "plan_text_blobs")
+    }
+    return {
+        "plans": plans, "inline_text_bytes": inline_bytes, "blobs": blobs, "blob_bytes": blob_bytes,
+        "relation_bytes": relations,
+    }
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    tables = sa.inspect(bind).get_table_names()
+    if "plan_text_blobs" not in tables:
+        op.create_table(
+            "plan_text_blobs",
+            sa.Column("hash", sa.String(length=64), nullable=False),
+            sa.Column("text", sa.Text(), nullable=False),
+            sa.Column("size", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("hash"),
+        )
+    if "health_plan_texts" not in tables:
+        op.create_table(
+            "health_plan_texts",
+            sa.Column("plan_id", sa.Integer(), nullable=False),
+            *[sa.Column(f"{field}_hash", sa.String(length=64), nullable=True) for field in TEXT_FIELDS],
+            sa.PrimaryKeyConstraint("plan_id"),
+            sa.ForeignKeyConstraint(["plan_id"], ["health_plans.id"], ondelete="CASCADE"),
+            *[sa.ForeignKeyConstraint([f"{field}_hash"], ["plan_text_blobs.hash"]) for field in TEXT_FIELDS],
+        )
+    if "health_plans" not in tables:
+        # Fresh database: nothing to deduplicate
+        return
+
+    before = _sizes(bind)
+
+    # One blob per distinct text
+    texts = " UNION ".join(f"SELECT {field} AS text FROM health_plans" for field in TEXT_FIELDS)
+    op.execute(
+        f"INSERT INTO plan_text_blobs (hash, text, size, created_at) "
+        f"SELECT {_hash('text')}, text, octet_length(text), now() FROM ({texts}) AS texts "
+        f"WHERE text IS NOT NULL ON CONFLICT (hash) DO NOTHING"
+    )
+    # Point the plans at them and drop the inline copies
+    hashes = ", ".join(f"CASE WHEN {field} IS NULL THEN NULL ELSE {_hash(field)} END" for field in TEXT_FIELDS)
+    op.execute(
+        f"INSERT INTO health_plan_texts (plan_id, {', '.join(f'{field}_hash' for field in TEXT_FIELDS)}) "
+        f"SELECT id, {hashes} FROM health_plans WHERE ({_any_text()}) ON CONFLICT (plan_id) DO NOTHING"
+    )
+    op.execute(
+        f"UPDATE health_plans SET {', '.join(f'{field} = NULL' for field in TEXT_FIELDS)} "
+        f"WHERE ({_any_text()}) AND id IN (SELECT plan_id FROM health_plan_texts)"
+    )
+    op.execute("ANALYZE plan_text_blobs")
+    op.execute("ANALYZE health_plan_texts")
+
+    after = _sizes(bind)
+    print(f"Plan text before: {before}")
+    print(f"Plan text after:  {after}")
+    # Dead tuples keep health_plans at its old size until it is rewritten
+    print("Run VACUUM FULL health_plans (or scripts/plan_text_report.py --vacuum) to return the space")
+
+
+def downgrade() -> None:
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if "health_plan_texts" not in tables:
+        return
+
+    restored = ", ".join(
+        f"{field} = (SELECT text FROM plan_text_blobs WHERE hash = t.{field}_hash)" for field in TEXT_FIELDS
+    )
+    op.execute(f"UPDATE health_plans AS p SET {restored} FROM health_plan_texts AS t WHERE t.plan_id = p.id")
+    op.drop_table("health_plan_texts")
+    op.drop_table("plan_text_blobs")
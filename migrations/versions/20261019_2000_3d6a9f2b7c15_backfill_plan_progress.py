@@ -0,0 +1,68 @@
+"""create plan_progress and backfill it for existing plans
+
+Revision ID: 3d6a9f2b7c15
+Revises: 8c2f4e6a1b37
+Create Date: 2026-10-19 20:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+
+# revision identifiers, used by Alembic.
+revision = '3d6a9f2b7c15'
+down_revision = '8c2f4e6a1b37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    tables = sa.inspect(bind).get_table_names()
+    if "plan_progress" not in tables:
+        op.create_table(
+            "plan_progress",
+            sa.Column("plan_id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("start_date", sa.Date(), nullable=False),
+            sa.Column("end_date", sa.Date(), nullable=False),
+            sa.Column("calories", sa.LargeBinary(), nullable=False),
+            sa.Column("minutes", sa.LargeBinary(), nullable=False),
+            sa.Column("open_day", sa.Integer(), nullable=False),
+            sa.Column("days_on_target", sa.Integer(), nullable=False),
+            sa.Column("exercise_days", sa.Integer(), nullable=False),
+            sa.Column("calorie_days", sa.Integer(), nullable=False),
+            sa.Column("calorie_balance", sa.Float(), nullable=False),
+            sa.Column("current_streak", sa.Integer(), nullable=False),
+            sa.Column("best_streak", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("plan_id"),
+            sa.ForeignKeyConstraint(["plan_id"], ["health_plans.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        )
+        op.create_index("ix_plan_progress_user_id", "plan_progress", ["user_id"])
+    if "health_plans" not in tables:
+        # Fresh database: nothing to backfill
+        return
+
+    # Same computation as for a new plan, from the records already in each plan's window
+    from app.models.health_data import HealthPlan
+    from app.models.plan_progress import PlanProgress
+    from app.services.adherence_tracker import adherence_tracker
+
+    db = Session(bind=bind)
+    missing = db.query(HealthPlan).filter(~HealthPlan.id.in_(sa.select(PlanProgress.plan_id)))
+    backfilled = 0
+    for plan in missing.yield_per(500):
+        adherence_tracker.start(db, plan)
+        backfilled += 1
+        if backfilled % 500 == 0:
+            db.flush()
+    db.flush()
+    print(f"Backfilled progress for {backfilled} plans")
+
+
+def downgrade() -> None:
+    if "plan_progress" in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_table("plan_progress")
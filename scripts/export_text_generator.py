@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Export the text generator to ONNX, optionally quantized to int8
+
+Writes an ONNX Runtime export of a causal language model (a hub name or a
+local directory) with its tokenizer and config, for
+TEXT_GENERATOR_BACKEND=onnx. With --quantize, the dynamic int8 model is
+saved alongside as model_quantized.onnx, which the onnx backend prefers:
+
+    python scripts/export_text_generator.py --model gpt2 --output ./models/text_generator_onnx
+    python scripts/export_text_generator.py --model ./models/gpt2 --quantize avx2
+
+Requires optimum[onnxruntime].
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+
+QUANTIZATION_TARGETS = ("arm64", "avx2", "avx512", "avx512_vnni")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.TEXT_GENERATOR_MODEL, help="Hub name or local model directory")
+    parser.add_argument("--output", default=settings.TEXT_GENERATOR_ONNX_PATH)
+    parser.add_argument(
+        "--quantize", choices=QUANTIZATION_TARGETS,
+        help="Also write a dynamic int8 model tuned for this instruction set"
+    )
+    args = parser.parse_args()
+
+    from optimum.onnxruntime import ORTModelForCausalLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    # Exported with the key/value cache so generation does not recompute the prefix
+    model = ORTModelForCausalLM.from_pretrained(args.model, export=True, use_cache=True)
+    model.save_pretrained(args.output)
+    AutoTokenizer.from_pretrained(args.model).save_pretrained(args.output)
+    report = {"output": args.output, "model": args.model, "files": {}}
+
+    if args.quantize:
+        quantizer = ORTQuantizer.from_pretrained(args.output, file_name="model.onnx")
+        config = getattr(AutoQuantizationConfig, args.quantize)(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=args.output, quantization_config=config)
+        report["quantization"] = args.quantize
+
+    for name in sorted(os.listdir(args.output)):
+        if name.endswith(".onnx") or name.endswith(".onnx_data"):
+            report["files"][name] = round(os.path.getsize(os.path.join(args.output, name)) / 1024 / 1024, 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
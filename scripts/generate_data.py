@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+"""
+Generate realistic synthetic users, health records and plans for scale testing
+
+Every user is drawn from its own random stream seeded by (--seed, user
+number), so a seed always gives the same data, whatever the chunk size.
+The generated data has these properties:
+
+  - Activity levels and goals are skewed toward sedentary users who want
+    to lose weight.
+  - Engagement is heavy-tailed, and some users churn.
+  - Sleep is logged daily with 3-6 diet entries per logged day.
+  - Exercise comes in bursts: streaks of activity alternate with lapses.
+  - Plans follow one another while the user is active.
+
+Rows are loaded into DATABASE_URL with COPY on PostgreSQL and batched
+inserts elsewhere. They can also be written to CSV or Parquet files
+(Parquet needs pyarrow) and replayed into a database later. Users get
+ids after the existing ones and are named synthetic<id>. All of them log
+in with --password.
+
+    python scripts/generate_data.py --users 10000 --years 2 --seed 42
+    python scripts/generate_data.py --users 10000 --format csv --dir ./data/synthetic
+    python scripts/generate_data.py --replay ./data/synthetic
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from datetime import date, datetime
+from typing import Dict, Iterator, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, Sequence, func, insert, select, text
+
+from app.core.database import engine
+from app.core.security import get_password_hash
+from app.models.health_data import HealthPlan
+from app.models.health_records import HEALTH_RECORD_MODELS
+from app.models.user import User
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+TABLES = {
+    "users": User.__table__,
+    **{model.__tablename__: model.__table__ for model in HEALTH_RECORD_MODELS.values()},
+    "health_plans": HealthPlan.__table__,
+}
+RECORD_TABLES = tuple(model.__tablename__ for model in HEALTH_RECORD_MODELS.values())
+
+ACTIVITY_LEVELS = ("sedentary", "lightly_active", "moderately_active", "very_active", "extra_active")
+ACTIVITY_WEIGHTS = (0.35, 0.30, 0.20, 0.10, 0.05)
+GOALS = ("weight_loss", "general_health", "muscle_gain", "endurance", "weight_gain")
+GOAL_WEIGHTS = (0.45, 0.25, 0.15, 0.10, 0.05)
+PLAN_TITLES = {
+    "weight_loss": "Weight Loss Health Plan",
+    "weight_gain": "Weight Gain Health Plan",
+    "muscle_gain": "Muscle Gain Fitness Plan",
+    "endurance": "Endurance Improvement Plan",
+    "general_health": "Comprehensive Health Plan",
+}
+# type: (MET at low/moderate/high intensity, km/h or None)
+EXERCISES = {
+    "walking": ((2.8, 3.5, 4.3), 5.0),
+    "running": ((7.0, 9.8, 11.5), 10.0),
+    "cycling": ((4.0, 6.8, 10.0), 20.0),
+    "swimming": ((5.8, 7.0, 9.8), 2.0),
+    "strength": ((3.5, 5.0, 6.0), None),
+    "yoga": ((2.0, 2.5, 3.0), None),
+}
+EXERCISE_TYPES = tuple(EXERCISES)
+EXERCISE_NAMES = np.array(EXERCISE_TYPES)
+EXERCISE_METS = np.array([EXERCISES[name][0] for name in EXERCISE_TYPES])
+EXERCISE_SPEEDS = np.array([EXERCISES[name][1] or np.nan for name in EXERCISE_TYPES])
+INTENSITY_NAMES = np.array(["low", "moderate", "high"])
+MEAL_NAMES = np.array(["breakfast", "lunch", "dinner", "snack"])
+MEAL_CALORIES = np.array([400.0, 650.0, 750.0, 200.0])
+# Per meal type, in MEAL_NAMES order
+FOOD_NAMES = np.array([
+    ("oatmeal", "eggs and toast", "yogurt with fruit", "pancakes"),
+    ("chicken salad", "rice bowl", "sandwich", "noodle soup"),
+    ("salmon with vegetables", "pasta", "steak and potatoes", "tofu stir fry"),
+    ("apple", "protein bar", "nuts", "chips"),
+])
+
+
+EPOCH = date(1970, 1, 1).toordinal()
+
+
+def _dates(ordinals) -> np.ndarray:
+    return (np.asarray(ordinals, dtype="int64") - EPOCH).astype("datetime64[D]")
+
+
+def _times(ordinals, seconds) -> np.ndarray:
+    days = np.asarray(ordinals, dtype="int64") - EPOCH
+    return (days * 86400 + np.asarray(seconds).astype("int64")).astype("datetime64[s]")
+
+
+def _streaks(rng, n: int, mean_on: float, mean_off: float) -> np.ndarray:
+    """Alternating on/off streaks with geometric lengths, as a boolean per day"""
+    state = np.zeros(n, dtype=bool)
+    position, on = 0, rng.random() < mean_on / (mean_on + mean_off)
+    while position < n:
+        length = int(rng.geometric(1 / (mean_on if on else mean_off)))
+        state[position:position + length] = on
+        position += length
+        on = not on
+    return state
+
+
+def generate_user(seed: int, number: int, first_day: int, last_day: int, password_hash: str) -> Dict[str, Dict]:
+    """Columns (numpy arrays) of every table for user number, its local id; deterministic in (seed, number)"""
+    rng = np.random.default_rng([seed, number])
+
+    gender = "male" if rng.random() < 0.49 else "female"
+    age = 18 + min(rng.gamma(2.2, 9.0), 62)
+    height = rng.normal(176, 7) if gender == "male" else rng.normal(163, 6.5)
+    weight = rng.lognormal(np.log(25.5), 0.17) * (height / 100) ** 2
+    activity = int(rng.choice(len(ACTIVITY_LEVELS), p=ACTIVITY_WEIGHTS))
+    goal = GOALS[rng.choice(len(GOALS), p=GOAL_WEIGHTS)]
+
+    signup = int(rng.integers(first_day, last_day - 6))
+    last_active = last_day
+    if rng.random() < 0.35:
+        last_active = min(last_day, signup + 7 + int(rng.exponential(120)))
+    days = np.arange(signup, last_active + 1)
+    engagement = 0.05 + 0.9 * rng.beta(2.0, 1.0)
+    logged = rng.random(len(days)) < engagement
+    signed_up_at = _times([signup], [rng.integers(6 * 3600, 23 * 3600)])
+
+    users = {
+        "id": np.array([number]),
+        "username": np.array([f"synthetic{number}"]),
+        "email": np.array([f"synthetic{number}@example.com"]),
+        "hashed_password": np.array([password_hash]),
+        "full_name": np.array([f"Synthetic User {number}"]),
+        "date_of_birth": _dates([last_day - int(age * 365.25)]),
+        "gender": np.array([gender]),
+        "height": np.array([round(height, 1)]),
+        "weight": np.array([round(weight, 1)]),
+        "activity_level": np.array([ACTIVITY_LEVELS[activity]]),
+        "health_goal": np.array([goal]),
+        "created_at": signed_up_at,
+        "updated_at": signed_up_at,
+    }
+
+    # Sleep: one night per logged day, longer at weekends
+    sleep_days = days[logged]
+    weekend = (sleep_days % 7) >= 5
+    duration = np.clip(rng.normal(rng.normal(7.1, 0.6), 0.9, len(sleep_days)) + 0.6 * weekend, 3, 12).round(2)
+    bed = rng.normal(22.5 * 3600, 50 * 60, len(sleep_days))
+    sleep = {
+        "user_id": np.full(len(sleep_days), number),
+        "date": _dates(sleep_days),
+        "sleep_duration": duration,
+        "sleep_quality": np.select([duration < 6, duration < 7, duration < 8.5], ["poor", "fair", "good"], "excellent"),
+        "bed_time": _times(sleep_days - 1, bed),
+        "wake_time": _times(sleep_days - 1, bed + duration * 3600),
+    }
+
+    # Diet: 3-6 entries per logged day, breakfast/lunch/dinner then snacks
+    diet_days = days[logged & (rng.random(len(days)) < 0.8)]
+    counts = rng.integers(3, 7, len(diet_days))
+    entry_days = np.repeat(diet_days, counts)
+    meal = np.minimum(np.arange(len(entry_days)) - np.repeat(np.cumsum(counts) - counts, counts), 3)
+    calories = (MEAL_CALORIES[meal] * rng.lognormal(0, 0.15) * rng.lognormal(0, 0.25, len(meal))).round(0)
+    protein_share = rng.uniform(0.12, 0.3, len(meal))
+    fat_share = rng.uniform(0.2, 0.4, len(meal))
+    diet = {
+        "user_id": np.full(len(entry_days), number),
+        "date": _dates(entry_days),
+        "meal_type": MEAL_NAMES[meal],
+        "food_name": FOOD_NAMES[meal, rng.integers(0, FOOD_NAMES.shape[1], len(meal))],
+        "calories": calories,
+        "protein": (calories * protein_share / 4).round(1),
+        "carbs": (calories * (1 - protein_share - fat_share) / 4).round(1),
+        "fats": (calories * fat_share / 9).round(1),
+        "fiber": rng.uniform(0, 12, len(meal)).round(1),
+    }
+
+    # Exercise: bursts of activity separated by lapses, more often for active users
+    streak = _streaks(rng, len(days), mean_on=7 + 4 * activity, mean_off=max(4.0, 28 - 5 * activity))
+    chance = np.where(streak, 0.35 + 0.12 * activity, 0.03) * (0.5 + engagement / 2)
+    exercise_days = days[rng.random(len(days)) < chance]
+    n = len(exercise_days)
+    favourite = int(rng.integers(len(EXERCISE_TYPES)))
+    kind = np.where(rng.random(n) < 0.7, favourite, rng.integers(0, len(EXERCISE_TYPES), n))
+    intensity = rng.choice(3, n, p=(0.5 - 0.08 * activity, 0.4, 0.1 + 0.08 * activity))
+    minutes = np.clip(rng.lognormal(np.log(35 + 5 * activity), 0.4, n), 5, 180).round(0)
+    exercise = {
+        "user_id": np.full(n, number),
+        "date": _dates(exercise_days),
+        "exercise_type": EXERCISE_NAMES[kind],
+        "duration": minutes,
+        "calories_burned": (EXERCISE_METS[kind, intensity] * weight * minutes / 60).round(0),
+        # NaN (no distance for strength and yoga) is written as NULL
+        "distance": (EXERCISE_SPEEDS[kind] * minutes / 60 * rng.lognormal(0, 0.1, n)).round(2),
+        "intensity": INTENSITY_NAMES[intensity],
+    }
+
+    # Records are entered on the day they describe
+    for columns, record_days in ((sleep, sleep_days), (diet, entry_days), (exercise, exercise_days)):
+        columns["created_at"] = _times(record_days, rng.integers(7 * 3600, 23 * 3600, len(record_days)))
+        columns["updated_at"] = columns["created_at"]
+
+    # Plans: back to back while active, with gaps; the current one stays active
+    starts, ends, statuses = [], [], []
+    start = signup + int(rng.integers(0, 14))
+    while start <= last_active:
+        end = start + int(rng.choice([30, 60, 90]))
+        if end >= last_day:
+            statuses.append("active" if last_active == last_day else "paused")
+        else:
+            statuses.append("completed" if rng.random() < engagement else "cancelled")
+        starts.append(start)
+        ends.append(end)
+        start = end + int(rng.geometric(1 / 20))
+    starts, ends, k = np.array(starts, dtype="int64"), np.array(ends, dtype="int64"), len(starts)
+    planned_at = _times(starts, rng.integers(6 * 3600, 23 * 3600, k))
+    plans = {
+        "user_id": np.full(k, number),
+        "plan_type": np.full(k, "exercise" if goal in ("muscle_gain", "endurance") else "general"),
+        "title": np.full(k, PLAN_TITLES[goal]),
+        "description": np.full(k, f"A personalized health plan tailored for Synthetic User {number}."),
+        "duration_days": ends - starts,
+        "calories_target": rng.normal(2000, 300, k).round(0),
+        "exercise_minutes_per_day": 30.0 + 10 * rng.integers(0, 4, k),
+        "weekly_exercise_days": rng.integers(2, 6, k),
+        "status": np.array(statuses, dtype=str),
+        "start_date": _dates(starts),
+        "end_date": _dates(ends),
+        "created_at": planned_at,
+        "updated_at": planned_at,
+    }
+
+    return {"users": users, "health_exercise": exercise, "health_diet": diet, "health_sleep": sleep, "health_plans": plans}
+
+
+def generate(args, password_hash: str) -> Iterator[Dict[str, Dict]]:
+    """Chunks of --chunk-users users: table -> column -> numpy array"""
+    last_day = date.today().toordinal()
+    first_day = last_day - int(args.years * 365)
+    for chunk_start in range(1, args.users + 1, args.chunk_users):
+        users = [
+            generate_user(args.seed, number, first_day, last_day, password_hash)
+            for number in range(chunk_start, min(chunk_start + args.chunk_users, args.users + 1))
+        ]
+        yield {
+            table: {name: np.concatenate([user[table][name] for user in users]) for name in columns}
+            for table, columns in users[0].items()
+        }
+
+
+def _rows(columns: Dict) -> int:
+    return len(next(iter(columns.values()), []))
+
+
+def _text(values: np.ndarray) -> List[str]:
+    """Column as CSV/COPY text; NaN and None become empty (NULL)"""
+    if values.dtype.kind == "M":
+        return np.datetime_as_string(values).tolist()
+    if values.dtype.kind == "f":
+        text_values = values.astype(str)
+        text_values[np.isnan(values)] = ""
+        return text_values.tolist()
+    if values.dtype.kind in "iuUb":
+        return values.astype(str).tolist()
+    return values.tolist()
+
+
+def _python(values: np.ndarray) -> list:
+    """Column as Python values for DB-API inserts; NaN becomes None"""
+    if values.dtype.kind == "f":
+        objects = values.astype(object)
+        objects[np.isnan(values)] = None
+        return objects.tolist()
+    return values.tolist()
+
+
+class DatabaseSink:
+    """COPY on PostgreSQL, batched inserts elsewhere; ids follow the existing rows
+
+    Local user numbers become user ids offset by the ids allocated up front,
+    and every other row gets its id from its table's sequence.
+    """
+
+    def __init__(self, engine, users: int):
+        self.engine = engine
+        self.postgres = engine.dialect.name == "postgresql"
+        self.user_offset = self._allocate("users", users) - 1
+
+    def _allocate(self, table: str, n: int) -> int:
+        """First of n consecutive new ids for table"""
+        column = TABLES[table].c.id
+        with self.engine.begin() as conn:
+            if self.postgres:
+                if isinstance(column.default, Sequence):
+                    sequence = f"'{column.default.name}'"
+                else:
+                    sequence = f"pg_get_serial_sequence('{table}', 'id')"
+                last = conn.execute(text(f"SELECT setval({sequence}, nextval({sequence}) + :n - 1)"), {"n": n}).scalar()
+                return last - n + 1
+            shared = RECORD_TABLES if table in RECORD_TABLES else (table,)
+            current = max(conn.execute(select(func.max(TABLES[name].c.id))).scalar() or 0 for name in shared)
+            return current + 1
+
+    def write(self, table: str, columns: Dict):
+        n = _rows(columns)
+        if not n:
+            return
+        columns = {name: np.asarray(values) for name, values in columns.items()}
+        if table == "users":
+            columns["id"] = columns["id"].astype("int64") + self.user_offset
+            if self.user_offset:
+                # Names follow the ids so loading twice does not collide
+                names = columns["id"].astype(str).astype(object)
+                columns["username"] = "synthetic" + names
+                columns["email"] = "synthetic" + names + "@example.com"
+        else:
+            columns["user_id"] = columns["user_id"].astype("int64") + self.user_offset
+            first = self._allocate(table, n)
+            columns = {"id": np.arange(first, first + n), **columns}
+        columns = _with_defaults(TABLES[table], columns, n)
+
+        if self.postgres:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(zip(*map(_text, columns.values())))
+            buffer.seek(0)
+            connection = self.engine.raw_connection()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(
+                        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+                    )
+                connection.commit()
+            finally:
+                connection.close()
+            return
+        names = list(columns)
+        with self.engine.begin() as conn:
+            conn.execute(insert(TABLES[table]), [dict(zip(names, row)) for row in zip(*map(_python, columns.values()))])
+
+    def close(self):
+        pass
+
+
+def _with_defaults(table, columns: Dict, n: int) -> Dict:
+    """Drop columns the table lacks and fill the ones not generated from their defaults"""
+    columns = {name: values for name, values in columns.items() if name in table.c}
+    for column in table.c:
+        if column.name in columns or column.default is None or isinstance(column.default, Sequence):
+            continue
+        if column.default.is_scalar:
+            columns[column.name] = np.full(n, column.default.arg, dtype=object)
+        elif column.default.is_callable:
+            # Evaluated once per chunk, e.g. datetime.utcnow
+            columns[column.name] = np.full(n, column.default.arg(None), dtype=object)
+    return columns
+
+
+class CsvSink:
+    """One CSV file per table, with a header row"""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.files = {}
+
+    def write(self, table: str, columns: Dict):
+        if table not in self.files:
+            handle = open(os.path.join(self.directory, f"{table}.csv"), "w", newline="")
+            writer = csv.writer(handle)
+            writer.writerow(columns)
+            self.files[table] = (handle, writer)
+        self.files[table][1].writerows(zip(*map(_text, columns.values())))
+
+    def close(self):
+        for handle, _ in self.files.values():
+            handle.close()
+
+
+def _arrow_type(column):
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("s")
+    if isinstance(column.type, Date):
+        return pa.date32()
+    return pa.string()
+
+
+class ParquetSink:
+    """One Parquet file per table, a row group per chunk"""
+
+    def __init__(self, directory: str):
+        if not HAS_PYARROW:
+            raise SystemExit("--format parquet requires pyarrow")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.writers = {}
+
+    def write(self, table: str, columns: Dict):
+        if table not in self.writers:
+            schema = pa.schema([
+                (name, _arrow_type(TABLES[table].c[name]) if name in TABLES[table].c else pa.string())
+                for name in columns
+            ])
+            self.writers[table] = pq.ParquetWriter(os.path.join(self.directory, f"{table}.parquet"), schema)
+        writer = self.writers[table]
+        arrays = [
+            pa.array(values, type=field.type, from_pandas=True)
+            for values, field in zip(columns.values(), writer.schema)
+        ]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=writer.schema))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+def _parse(column, value: str):
+    if value == "":
+        return None
+    if isinstance(column.type, Boolean):
+        return value in ("True", "true", "t", "1")
+    if isinstance(column.type, Integer):
+        return int(value)
+    if isinstance(column.type, Float):
+        return float(value)
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Date):
+        return date.fromisoformat(value)
+    return value
+
+
+def read_files(directory: str, chunk_rows: int) -> Iterator[tuple]:
+    """(table, columns) chunks from a --dir written by the csv or parquet format"""
+    for table in TABLES:
+        path = os.path.join(directory, f"{table}.parquet")
+        if os.path.exists(path):
+            if not HAS_PYARROW:
+                raise SystemExit("Replaying Parquet files requires pyarrow")
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+                yield table, batch.to_pydict()
+            continue
+        path = os.path.join(directory, f"{table}.csv")
+        if not os.path.exists(path):
+            continue
+        with open(path, newline="") as f:
+            reader = csv.reader(f)
+            names = next(reader)
+            columns = [TABLES[table].c[name] if name in TABLES[table].c else None for name in names]
+            rows = []
+            for row in reader:
+                rows.append([_parse(column, value) if column is not None else value for column, value in zip(columns, row)])
+                if len(rows) == chunk_rows:
+                    yield table, dict(zip(names, map(list, zip(*rows))))
+                    rows = []
+            if rows:
+                yield table, dict(zip(names, map(list, zip(*rows))))
+
+
+def count_users(directory: str) -> int:
+    path = os.path.join(directory, "users.parquet")
+    if os.path.exists(path):
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(os.path.join(directory, "users.csv"), newline="") as f:
+        return sum(1 for _ in f) - 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--years", type=float, default=2, help="History length, ending today")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--password", default="synthetic123", help="Password of every generated user")
+    parser.add_argument("--format", choices=("db", "csv", "parquet"), default="db")
+    parser.add_argument("--dir", default="./data/synthetic", help="Output directory for csv and parquet")
+    parser.add_argument("--replay", metavar="DIR", help="Load files written with --format csv/parquet into the database")
+    parser.add_argument("--chunk-users", type=int, default=200, help="Users generated and written per batch")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = {table: 0 for table in TABLES}
+    if args.replay:
+        sink = DatabaseSink(engine, count_users(args.replay))
+        chunks = read_files(args.replay, chunk_rows=100_000)
+    else:
+        if args.format == "db":
+            sink = DatabaseSink(engine, args.users)
+        elif args.format == "csv":
+            sink = CsvSink(args.dir)
+        else:
+            sink = ParquetSink(args.dir)
+        # Hashed once: bcrypt per user would dominate generation time
+        password_hash = get_password_hash(args.password)
+        chunks = (
+            (table, columns)
+            for chunk in generate(args, password_hash)
+            for table, columns in chunk.items()
+        )
+    try:
+        for table, columns in chunks:
+            sink.write(table, columns)
+            counts[table] += _rows(columns)
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(json.dumps({
+        "target": f"replay {args.replay}" if args.replay else ("database" if args.format == "db" else args.dir),
+        "rows": counts,
+        "total_rows": total,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(total / elapsed) if elapsed else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
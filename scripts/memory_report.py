@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Memory broken down by component: model parameters, caches, database pool
+and sessions, and the top tracemalloc allocation sites
+
+Queries GET /api/admin/memory on a running worker (ADMIN_API_KEY must be
+set there and passed here). To see what grows, start tracing, let traffic
+run, and report twice; the second report's "diff" lists the allocation
+sites that grew in between:
+    python scripts/memory_report.py --trace start
+    python scripts/memory_report.py --collect --interval 60 --top 30
+    python scripts/memory_report.py --trace stop
+
+Each request reaches one worker, so run it a few times against a pre-fork
+server. --local imports the app in this process instead, which shows the
+footprint of the models and caches right after startup.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+
+def local_report(args) -> dict:
+    from app.core.memory import memory
+
+    # Before the imports, so the models' and caches' allocations are attributed
+    memory.tracer.start(args.frames)
+    from app.main import app  # noqa: F401 (registers every component)
+    from app.services.ai_service import get_ai_service
+
+    get_ai_service()
+    gc.collect()
+    return memory.report(args.top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--key", default=os.getenv("ADMIN_API_KEY", ""), help="Defaults to $ADMIN_API_KEY")
+    parser.add_argument("--local", action="store_true", help="Report on this process instead of a server")
+    parser.add_argument("--top", type=int, default=20, help="Allocation sites to list")
+    parser.add_argument("--collect", action="store_true", help="Run a full garbage collection before each report")
+    parser.add_argument("--interval", type=float, default=0, help="Report twice, this many seconds apart")
+    parser.add_argument("--trace", choices=["start", "stop"], help="Start or stop allocation tracing")
+    parser.add_argument("--frames", type=int, default=1, help="Traceback depth with --trace start or --local")
+    args = parser.parse_args()
+
+    if args.local:
+        print(json.dumps(local_report(args), indent=2))
+        return
+
+    with httpx.Client(base_url=args.base_url, headers={"X-Admin-Key": args.key}, timeout=60) as client:
+        if args.trace == "start":
+            response = client.post("/api/admin/memory/tracing", params={"frames": args.frames})
+        elif args.trace == "stop":
+            response = client.delete("/api/admin/memory/tracing")
+        else:
+            params = {"top": args.top, "collect": args.collect}
+            if args.interval:
+                client.get("/api/admin/memory", params=params).raise_for_status()
+                time.sleep(args.interval)
+            response = client.get("/api/admin/memory", params=params)
+        response.raise_for_status()
+        print(json.dumps(response.json(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Report how much health plan text is stored inline and as deduplicated blobs
+
+Run before and after the plan text migration (alembic upgrade head) to
+compare. The migration clears the inline copies, but PostgreSQL only
+returns the space once health_plans is rewritten, which --vacuum does
+(VACUUM FULL takes an exclusive lock on the table):
+    python scripts/plan_text_report.py
+    python scripts/plan_text_report.py --vacuum
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app.core.database import engine
+from app.models.plan_text import PLAN_TEXT_FIELDS
+
+TABLES = ("health_plans", "health_plan_texts", "plan_text_blobs")
+
+
+def report(connection) -> dict:
+    # SQLite's length() counts characters
+    size = "octet_length" if connection.dialect.name == "postgresql" else "length"
+    inline = " + ".join(f"COALESCE({size}({field}), 0)" for field in PLAN_TEXT_FIELDS)
+    plans, inline_bytes = connection.execute(text(f"SELECT count(*), COALESCE(sum({inline}), 0) FROM health_plans")).one()
+    linked = connection.execute(text("SELECT count(*) FROM health_plan_texts")).scalar()
+    blobs, blob_bytes = connection.execute(text("SELECT count(*), COALESCE(sum(size), 0) FROM plan_text_blobs")).one()
+    # What the linked plans would take with inline copies
+    referenced = " + ".join(
+        f"COALESCE((SELECT size FROM plan_text_blobs WHERE hash = t.{field}_hash), 0)" for field in PLAN_TEXT_FIELDS
+    )
+    referenced_bytes = connection.execute(text(f"SELECT COALESCE(sum({referenced}), 0) FROM health_plan_texts AS t")).scalar()
+    result = {
+        "plans": plans,
+        "plans_with_blobs": linked,
+        "inline_text_bytes": int(inline_bytes),
+        "blobs": blobs,
+        "blob_bytes": int(blob_bytes),
+        "deduplicated_text_bytes": int(referenced_bytes),
+        "dedup_ratio": referenced_bytes / blob_bytes if blob_bytes else None,
+    }
+    if connection.dialect.name == "postgresql":
+        result["relation_bytes"] = {
+            table: connection.execute(text(f"SELECT pg_total_relation_size('{table}')")).scalar() for table in TABLES
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vacuum", action="store_true", help="Rewrite health_plans first (PostgreSQL: VACUUM FULL)")
+    args = parser.parse_args()
+
+    if args.vacuum:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if connection.dialect.name == "postgresql":
+                connection.execute(text("VACUUM FULL ANALYZE health_plans"))
+            else:
+                connection.execute(text("VACUUM"))
+    with engine.connect() as connection:
+        print(json.dumps(report(connection), indent=2))
+
+
+if __name__ == "__main__":
+    main()
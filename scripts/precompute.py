@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Precompute analyses, statistics and recommendations for recently active users
+
+Runs today's job once and exits (resuming an interrupted run), or with
+--loop keeps the daily schedule in this process so API workers can leave
+PRECOMPUTE_ENABLED off:
+    python scripts/precompute.py
+    python scripts/precompute.py --force
+    python scripts/precompute.py --loop
+
+Results land in the configured cache backend, so use CACHE_BACKEND=disk or
+redis, with the API workers' CACHE_SECRET, for them to reach the API workers.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.precompute import precompute_scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--force", action="store_true", help="Start over even if today's run completed")
+    parser.add_argument("--loop", action="store_true", help="Run daily at PRECOMPUTE_AT until interrupted")
+    args = parser.parse_args()
+
+    if args.loop:
+        asyncio.run(precompute_scheduler.run_forever())
+        return
+    report = asyncio.run(precompute_scheduler.run(force=args.force))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Print a signed X-Profile header value for profiling one request
+
+Requires PROFILING_ENABLED=true on the server and the same PROFILING_SECRET
+here. The response carries X-Profile-Path, where the profile was written
+(.pstats for deterministic, folded stacks for sampling) next to a .sql.json
+file with the request's SQL timings:
+    curl -i -H "X-Profile: $(python scripts/profile_header.py)" \\
+        -H "Authorization: Bearer $TOKEN" http://localhost:8000/api/health/statistics
+    python -m pstats data/profiles/<file>.pstats
+    flamegraph.pl data/profiles/<file>.folded > flame.svg
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.core.profiling import MODES, sign_profile_header
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=MODES, default="deterministic")
+    parser.add_argument("--ttl", type=float, default=300, help="Seconds the value stays valid")
+    args = parser.parse_args()
+    if not settings.PROFILING_SECRET:
+        parser.error("PROFILING_SECRET is not set")
+
+    print(sign_profile_header(args.mode, args.ttl, settings.PROFILING_SECRET))
+
+
+if __name__ == "__main__":
+    main()
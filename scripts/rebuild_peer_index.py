@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Rebuild the similar-user (peer) index from stored feature vectors
+
+Meant to run periodically (e.g. nightly from cron); running workers pick
+up the new index file within PEER_INDEX_RELOAD_SECONDS:
+    python scripts/rebuild_peer_index.py
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import SessionLocal
+from app.services.peer_index import peer_index
+
+
+def main():
+    db = SessionLocal()
+    try:
+        report = peer_index.rebuild(db)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
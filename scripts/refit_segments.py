@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Full refit of user segments with a drift check
+
+Meant to run periodically (e.g. nightly from cron):
+    python scripts/refit_segments.py [--force]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import SessionLocal
+from app.services.segmentation_service import segmentation_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refit user segmentation centroids")
+    parser.add_argument("--force", action="store_true", help="Adopt the refit even if drift is below threshold")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = segmentation_service.refit(db, force=args.force)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import gc
+import tracemalloc
+from datetime import date, timedelta
+
+from fastapi import status
+
+from app.core.config import settings
+from app.core.rate_limit import admission_controller
+
+
+def register_and_login(client, username):
+    """注册并登录，返回认证 headers"""
+    client.post("/api/auth/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "testpass123"
+    })
+    login_response = client.post("/api/auth/login", data={
+        "username": username,
+        "password": "testpass123"
+    })
+    token = login_response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_memory_report_requires_admin_key(client, monkeypatch):
+    """测试内存报告：未配置 ADMIN_API_KEY 时不存在，密钥错误返回 403"""
+    monkeypatch.setattr(settings, "ADMIN_API_KEY", "")
+    assert client.get("/api/admin/memory").status_code == status.HTTP_404_NOT_FOUND
+    
+    monkeypatch.setattr(settings, "ADMIN_API_KEY", "admin-secret")
+    response = client.get("/api/admin/memory", headers={"X-Admin-Key": "wrong"})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_memory_report_by_component(client, monkeypatch):
+    """测试内存报告按组件列出，开启追踪后包含分配位置及两次报告间的差异"""
+    monkeypatch.setattr(settings, "ADMIN_API_KEY", "admin-secret")
+    headers = {"X-Admin-Key": "admin-secret"}
+    
+    response = client.get("/api/admin/memory", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    report = response.json()
+    assert report["process"]["peak_rss_bytes"] > 0
+    for component in ("database", "cache", "health_data_cache", "segmentation", "peer_index"):
+        assert component in report["components"]
+    assert report["allocations"] == {"tracing": False}
+    
+    client.post("/api/admin/memory/tracing", headers=headers)
+    try:
+        client.get("/api/admin/memory", headers=headers)
+        allocations = client.get("/api/admin/memory", params={"top": 5}, headers=headers).json()["allocations"]
+        assert allocations["tracing"] is True
+        assert len(allocations["top"]) == 5
+        assert "diff" in allocations
+    finally:
+        client.delete("/api/admin/memory/tracing", headers=headers)
+
+
+def test_memory_growth_is_bounded(client, monkeypatch):
+    """测试 10000 次请求后 Python 堆增长在界限内（无泄漏）"""
+    monkeypatch.setattr(admission_controller, "enabled", False)
+    headers = register_and_login(client, "leakuser")
+    for day in range(14):
+        client.post("/api/health/data", json={
+            "data_type": "exercise",
+            "date": str(date.today() - timedelta(days=day)),
+            "exercise_type": "跑步",
+            "duration": 30,
+            "calories_burned": 300
+        }, headers=headers)
+    
+    paths = ["/api/health/data", "/api/health/statistics", "/api/users/me", "/health"]
+    
+    # 预热：填充缓存、连接池和惰性初始化的对象
+    for i in range(500):
+        client.get(paths[i % len(paths)], headers=headers)
+    
+    tracemalloc.start()
+    try:
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(10_000):
+            response = client.get(paths[i % len(paths)], headers=headers)
+            assert response.status_code == status.HTTP_200_OK
+        gc.collect()
+        growth = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    
+    # 约 100 字节/请求；缓存条目和连接在预热中已分配
+    assert growth < 1024 * 1024
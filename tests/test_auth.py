@@ -1,6 +1,12 @@
+import asyncio
+
 import pytest
 from fastapi import status
 
+from app.core.rate_limit import RouteLimits, admission_controller
+from app.core.revocation import BloomFilter, TokenDenylist
+from app.core.security import token_session_id
+
 
 def test_register_user(client):
     """测试用户注册"""
@@ -72,6 +78,21 @@ def test_login_wrong_password(client):
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
 
+def test_login_rate_limited(client, monkeypatch):
+    """测试登录请求超出令牌桶限制"""
+    monkeypatch.setitem(admission_controller.limits, "auth", RouteLimits(user_rate=0.01, user_burst=2))
+    
+    statuses = [
+        client.post("/api/auth/login", data={"username": "nobody", "password": "wrongpass"}).status_code
+        for _ in range(3)
+    ]
+    response = client.post("/api/auth/login", data={"username": "nobody", "password": "wrongpass"})
+    
+    assert statuses[:2] == [status.HTTP_401_UNAUTHORIZED] * 2
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(response.headers["Retry-After"]) >= 1
+
+
 def test_get_current_user(client):
     """测试获取当前用户信息"""
     # 注册
@@ -96,3 +117,95 @@ def test_get_current_user(client):
     assert response.status_code == status.HTTP_200_OK
     assert response.json()["username"] == "testuser"
 
+
+def login_tokens(client, username="testuser", password="testpass123"):
+    """注册（如需要）并登录，返回 token 响应"""
+    client.post("/api/auth/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "testpass123"
+    })
+    return client.post("/api/auth/login", data={"username": username, "password": password}).json()
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_logout_revokes_session(client):
+    """测试登出后访问令牌和刷新令牌立即失效"""
+    tokens = login_tokens(client)
+    assert client.get("/api/users/me", headers=bearer(tokens["access_token"])).status_code == status.HTTP_200_OK
+    
+    response = client.post("/api/auth/logout", headers=bearer(tokens["access_token"]))
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    
+    assert client.get("/api/users/me", headers=bearer(tokens["access_token"])).status_code == status.HTTP_401_UNAUTHORIZED
+    response = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_refresh_rotates_token(client):
+    """测试刷新令牌只能使用一次，重复使用会撤销整个会话"""
+    tokens = login_tokens(client)
+    assert client.get("/api/users/me", headers=bearer(tokens["refresh_token"])).status_code == status.HTTP_401_UNAUTHORIZED
+    
+    response = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == status.HTTP_200_OK
+    refreshed = response.json()
+    assert client.get("/api/users/me", headers=bearer(refreshed["access_token"])).status_code == status.HTTP_200_OK
+    
+    # 旧刷新令牌被重放
+    response = client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.get("/api/users/me", headers=bearer(refreshed["access_token"])).status_code == status.HTTP_401_UNAUTHORIZED
+    response = client.post("/api/auth/refresh", json={"refresh_token": refreshed["refresh_token"]})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_password_change_revokes_all_sessions(client):
+    """测试修改密码后所有旧会话失效，返回新会话"""
+    first = login_tokens(client)
+    second = login_tokens(client)
+    
+    response = client.post("/api/auth/password", json={
+        "current_password": "wrongpass",
+        "new_password": "newpass123"
+    }, headers=bearer(first["access_token"]))
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    
+    response = client.post("/api/auth/password", json={
+        "current_password": "testpass123",
+        "new_password": "newpass123"
+    }, headers=bearer(first["access_token"]))
+    assert response.status_code == status.HTTP_200_OK
+    new_tokens = response.json()
+    
+    for tokens in (first, second):
+        assert client.get("/api/users/me", headers=bearer(tokens["access_token"])).status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.get("/api/users/me", headers=bearer(new_tokens["access_token"])).status_code == status.HTTP_200_OK
+    assert "access_token" in login_tokens(client, password="newpass123")
+
+
+def test_denylist_syncs_between_workers(client, db_session):
+    """测试其他 worker 的布隆过滤器从撤销表同步，未撤销的令牌不查询数据库"""
+    tokens = login_tokens(client)
+    sid = token_session_id(tokens["access_token"])
+    other_worker = TokenDenylist(capacity=1000, error_rate=0.001, sync_seconds=0, rebuild_seconds=3600)
+    assert asyncio.run(other_worker.is_revoked(db_session, sid)) is False
+    assert other_worker.stats()["filter_hits"] == 0
+    
+    client.post("/api/auth/logout", headers=bearer(tokens["access_token"]))
+    assert asyncio.run(other_worker.is_revoked(db_session, sid)) is True
+    assert other_worker.stats()["rejected"] == 1
+
+
+def test_bloom_filter_error_rate():
+    """测试布隆过滤器无漏报，误报率接近设定值"""
+    bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+    for i in range(10_000):
+        bloom.add(f"revoked-{i}")
+    
+    assert all(f"revoked-{i}" in bloom for i in range(10_000))
+    false_positives = sum(f"valid-{i}" in bloom for i in range(10_000))
+    assert false_positives < 200
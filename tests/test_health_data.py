@@ -1,6 +1,28 @@
+import asyncio
+import json
+import os
+import pickle
+import pstats
+from types import SimpleNamespace
+
+import numpy as np
 import pytest
 from fastapi import status
-from datetime import date
+from fastapi.testclient import TestClient
+from datetime import date, timedelta
+
+from app.core import cache
+from app.core.cache import Cache, DiskBackend, invalidate_tags_sync, user_tag
+from app.core.profiling import ProfilingMiddleware, sign_profile_header
+from app.main import app
+from app.models.health_records import HEALTH_RECORD_MODELS
+from app.models.ingest_checkpoint import IngestDeadLetter
+from app.models.metric_stats import UserMetricStats
+from app.schemas.health_data import HealthDataCreate
+from app.services.anomaly_detector import anomaly_detector, decode_state, encode_state, offline_state
+from app.services.health_data_cache import health_data_cache
+from app.services.ingest_buffer import ingest_buffer
+from app.services.segmentation_service import segmentation_service
 
 
 @pytest.fixture
@@ -23,6 +45,16 @@ def auth_headers(client):
     return {"Authorization": f"Bearer {token}"}
 
 
+@pytest.fixture
+def started_ingest_buffer(client, tmp_path, monkeypatch):
+    """启动写后缓冲，日志写入临时目录，只在读取时刷新"""
+    monkeypatch.setattr(ingest_buffer, "log_dir", str(tmp_path))
+    monkeypatch.setattr(ingest_buffer, "flush_interval", 3600)
+    ingest_buffer.start()
+    yield ingest_buffer
+    ingest_buffer.stop()
+
+
 def test_create_exercise_data(client, auth_headers):
     """测试创建运动数据"""
     response = client.post("/api/health/data", json={
@@ -102,3 +134,354 @@ def test_get_health_statistics(client, auth_headers):
     assert "total_exercise_minutes" in response.json()
     assert "total_calories_burned" in response.json()
 
+
+
+def test_get_health_trends(client, auth_headers):
+    """测试获取健康趋势"""
+    today = date.today()
+    for days_ago, duration in [(0, 30), (0, 15), (1, 45), (10, 60)]:
+        client.post("/api/health/data", json={
+            "data_type": "exercise",
+            "date": str(today - timedelta(days=days_ago)),
+            "duration": duration
+        }, headers=auth_headers)
+    
+    response = client.get(
+        f"/api/health/trends?metric=duration&bucket=day&start={today - timedelta(days=6)}&end={today}",
+        headers=auth_headers
+    )
+    
+    assert response.status_code == status.HTTP_200_OK
+    trends = response.json()
+    assert len(trends["buckets"]) == 7
+    assert trends["sum"][-1] == 45
+    assert trends["count"][-1] == 2
+    assert trends["mean"][-1] == 22.5
+    assert trends["mean"][0] is None
+    assert trends["rolling_7d_mean"][-1] == 45
+    assert trends["rolling_28d_mean"][-1] == 50
+    
+    response = client.get("/api/health/trends?metric=notes", headers=auth_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_health_statistics_reflect_new_data(client, auth_headers):
+    """测试统计数据在写入后立即更新"""
+    client.post("/api/health/data", json={
+        "data_type": "sleep",
+        "date": str(date.today()),
+        "sleep_duration": 7
+    }, headers=auth_headers)
+    response = client.get("/api/health/statistics?days=7", headers=auth_headers)
+    assert response.json()["total_sleep_hours"] == 7
+    
+    client.post("/api/health/data", json={
+        "data_type": "sleep",
+        "date": str(date.today() - timedelta(days=1)),
+        "sleep_duration": 6.5
+    }, headers=auth_headers)
+    response = client.get("/api/health/statistics?days=7", headers=auth_headers)
+    assert response.json()["total_sleep_hours"] == 13.5
+
+
+def test_get_health_data_across_types(client, auth_headers):
+    """测试按类型分表后的数据查询"""
+    today = date.today()
+    client.post("/api/health/data", json={
+        "data_type": "sleep",
+        "date": str(today - timedelta(days=1)),
+        "sleep_duration": 8
+    }, headers=auth_headers)
+    client.post("/api/health/data", json={
+        "data_type": "diet",
+        "date": str(today),
+        "calories": 500
+    }, headers=auth_headers)
+    
+    response = client.get("/api/health/data", headers=auth_headers)
+    assert [d["data_type"] for d in response.json()] == ["diet", "sleep"]
+    
+    response = client.get("/api/health/data?data_type=sleep", headers=auth_headers)
+    assert len(response.json()) == 1
+    assert response.json()[0]["calories"] is None
+    
+    response = client.post("/api/health/data", json={
+        "data_type": "weight",
+        "date": str(today)
+    }, headers=auth_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_ingest_health_data_read_your_writes(client, auth_headers, started_ingest_buffer):
+    """测试批量写入后读取能看到尚未刷新的数据"""
+    response = client.post("/api/health/data/ingest", json={"records": [
+        {"data_type": "sleep", "date": str(date.today() - timedelta(days=day)), "sleep_duration": 8}
+        for day in range(3)
+    ]}, headers=auth_headers)
+    
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json()["accepted"] == 3
+    assert started_ingest_buffer.has_pending(1)
+    
+    data = client.get("/api/health/data?data_type=sleep", headers=auth_headers).json()
+    
+    assert len(data) == 3
+    assert not started_ingest_buffer.has_pending(1)
+    # 刷新后的记录同样更新用户分群
+    assert segmentation_service.drain() == 1
+
+
+def test_ingest_failed_log_write_leaves_nothing_pending(client, auth_headers, started_ingest_buffer, monkeypatch):
+    """测试日志写入失败返回 503 时，用户不会一直被视为有待刷新的记录"""
+    def fail(batch):
+        raise OSError("disk full")
+    
+    monkeypatch.setattr(started_ingest_buffer, "_write", fail)
+    response = client.post("/api/health/data/ingest", json={"records": [
+        {"data_type": "sleep", "date": str(date.today()), "sleep_duration": 8}
+    ]}, headers=auth_headers)
+    
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert not started_ingest_buffer.has_pending(1)
+
+
+def test_ingest_health_data_replayed_after_restart(client, auth_headers, started_ingest_buffer):
+    """测试未刷新的日志在重启后重放"""
+    client.post("/api/health/data/ingest", json={"records": [
+        {"data_type": "exercise", "date": str(date.today()), "duration": 30},
+        {"data_type": "diet", "date": str(date.today()), "calories": 500}
+    ]}, headers=auth_headers)
+    
+    # 模拟崩溃：不刷新直接停止
+    started_ingest_buffer.stop(flush=False)
+    started_ingest_buffer.start()
+    
+    assert started_ingest_buffer.stats()["replayed"] == 2
+    response = client.get("/api/health/data", headers=auth_headers)
+    assert len(response.json()) == 2
+    
+    # 已刷新的记录不会重复写入
+    started_ingest_buffer.stop(flush=False)
+    started_ingest_buffer.start()
+    assert started_ingest_buffer.stats()["replayed"] == 0
+    assert len(client.get("/api/health/data", headers=auth_headers).json()) == 2
+
+
+def test_sleep_drop_flagged_as_anomaly(client, auth_headers, started_ingest_buffer, db_session):
+    """测试睡眠骤降在写入时被检测并出现在推荐中"""
+    history = [7.5, 8.0, 8.5, 7.8, 8.2, 7.6, 8.4, 8.0, 7.9, 8.1]
+    client.post("/api/health/data/ingest", json={"records": [
+        {"data_type": "sleep", "date": str(date.today() - timedelta(days=len(history) - i)), "sleep_duration": hours}
+        for i, hours in enumerate(history)
+    ]}, headers=auth_headers)
+    started_ingest_buffer.flush()
+    
+    # 增量统计与离线计算一致
+    stats = db_session.get(UserMetricStats, 1)
+    days = [(date.today() - timedelta(days=len(history) - i)).toordinal() for i in range(len(history))]
+    expected = offline_state(np.array(days), np.array(history), anomaly_detector.alpha)
+    assert decode_state(stats)["sleep_duration"] == pytest.approx(expected)
+    
+    client.post("/api/health/data", json={
+        "data_type": "sleep",
+        "date": str(date.today()),
+        "sleep_duration": 3
+    }, headers=auth_headers)
+    recommendations = client.get("/api/health/recommendations", headers=auth_headers).json()["recommendations"]
+    
+    anomaly = recommendations[0]["anomaly"]
+    assert anomaly["metric"] == "sleep_duration"
+    assert anomaly["direction"] == "low"
+    assert anomaly["date"] == str(date.today())
+    assert "Sleep dropped to 3.0 h" in recommendations[0]["message"]
+
+
+def test_future_and_non_finite_records_do_not_stall_anomaly_detection(client, auth_headers, db_session):
+    """测试未来日期和非有限数值的记录不会成为打开的一天，不影响之后的检测"""
+    today = date.today()
+    response = client.post("/api/health/data", json={
+        "data_type": "sleep", "date": str(today + timedelta(days=365)), "sleep_duration": 8
+    }, headers=auth_headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    
+    # 非有限数值（如旧日志重放）同样不计入统计
+    anomaly_detector.observe(db_session, 1, [
+        SimpleNamespace(data_type="sleep", date=today, sleep_duration=float("nan"))
+    ])
+    db_session.commit()
+    client.post("/api/health/data", json={
+        "data_type": "sleep", "date": str(today), "sleep_duration": 8
+    }, headers=auth_headers)
+    row = db_session.get(UserMetricStats, 1)
+    assert decode_state(row)["sleep_duration"][4:] == [today.toordinal(), 8]
+    
+    # 修复前已被未来日期打开的状态，在下次写入时从历史重建
+    state = decode_state(row)
+    state["sleep_duration"][4] = (today + timedelta(days=365)).toordinal()
+    row.state = encode_state(state)
+    db_session.commit()
+    client.post("/api/health/data", json={
+        "data_type": "sleep", "date": str(today), "sleep_duration": 7
+    }, headers=auth_headers)
+    assert decode_state(db_session.get(UserMetricStats, 1))["sleep_duration"][4:] == [today.toordinal(), 15]
+
+
+def test_backfilled_days_recounted_into_baseline(client, auth_headers, db_session):
+    """测试补录早于当前打开日的记录时，从历史重算统计而不是丢弃"""
+    today = date.today()
+    for days_ago, hours in [(3, 7), (0, 8), (2, 6), (1, 9), (2, 1)]:
+        client.post("/api/health/data", json={
+            "data_type": "sleep", "date": str(today - timedelta(days=days_ago)), "sleep_duration": hours
+        }, headers=auth_headers)
+    
+    days = [(today - timedelta(days=days_ago)).toordinal() for days_ago in (3, 2, 1, 0)]
+    expected = offline_state(np.array(days), np.array([7.0, 7.0, 9.0, 8.0]), anomaly_detector.alpha)
+    assert decode_state(db_session.get(UserMetricStats, 1))["sleep_duration"] == pytest.approx(expected)
+
+def test_ingest_rejects_unsupported_type(client, auth_headers, started_ingest_buffer):
+    """测试批量写入拒绝不支持的数据类型"""
+    response = client.post("/api/health/data/ingest", json={"records": [
+        {"data_type": "steps", "date": str(date.today())}
+    ]}, headers=auth_headers)
+    
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_ingest_rejects_oversized_and_non_finite_fields(client, auth_headers, started_ingest_buffer):
+    """测试超出列长度的字段和非有限数值在入口被拒绝，不会进入缓冲"""
+    response = client.post("/api/health/data/ingest", json={"records": [
+        {"data_type": "diet", "date": str(date.today()), "food_name": "x" * 101, "calories": 500}
+    ]}, headers=auth_headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    
+    # 1e400 解析为无穷大
+    response = client.post(
+        "/api/health/data",
+        content=f'{{"data_type": "sleep", "date": "{date.today()}", "sleep_duration": 1e400}}',
+        headers={**auth_headers, "Content-Type": "application/json"}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert started_ingest_buffer.stats()["pending"] == 0
+
+
+def test_ingest_dead_letters_rejected_record(client, auth_headers, started_ingest_buffer, db_session):
+    """测试数据库拒绝的记录被移入死信表，其余记录照常写入，缓冲不再阻塞"""
+    good = HealthDataCreate(data_type="exercise", date=date.today(), duration=30)
+    # 绕过校验，模拟数据库拒绝的记录（date 不能为空）
+    bad = HealthDataCreate.model_construct(data_type="exercise", date=None, duration=45)
+    started_ingest_buffer.append(1, [good, bad, good])
+    
+    assert started_ingest_buffer.flush() == 3
+    
+    stats = started_ingest_buffer.stats()
+    assert stats["pending"] == 0
+    assert stats["dead_lettered"] == 1
+    dead = db_session.query(IngestDeadLetter).one()
+    assert dead.seq == 2
+    assert json.loads(dead.record)["duration"] == 45
+    assert len(client.get("/api/health/data", headers=auth_headers).json()) == 2
+    
+    # 检查点已越过死信记录，重启后不会重放
+    started_ingest_buffer.stop(flush=False)
+    started_ingest_buffer.start()
+    assert started_ingest_buffer.stats()["replayed"] == 0
+
+
+def test_health_data_cache_load_racing_a_write_is_not_kept(client, auth_headers, db_session, monkeypatch):
+    """测试与写入并发的缓存加载不会留下缺少新记录的序列，写入后也不会重复计数"""
+    start_date = date.today() - timedelta(days=7)
+    load = health_data_cache._load
+    
+    def load_then_write(db, user_id, *args):
+        series = load(db, user_id, *args)
+        # 加载完成前另一个请求提交了新记录
+        monkeypatch.undo()
+        client.post("/api/health/data", json={
+            "data_type": "sleep", "date": str(date.today()), "sleep_duration": 8
+        }, headers=auth_headers)
+        return series
+    
+    monkeypatch.setattr(health_data_cache, "_load", load_then_write)
+    assert health_data_cache.get_series(db_session, 1, start_date, date.today()).size == 0
+    assert health_data_cache.get_series(db_session, 1, start_date, date.today()).size == 1
+    
+    client.post("/api/health/data", json={
+        "data_type": "sleep", "date": str(date.today()), "sleep_duration": 7
+    }, headers=auth_headers)
+    assert health_data_cache.get_series(db_session, 1, start_date, date.today()).size == 2
+
+
+def test_health_data_cache_reloads_after_other_workers_write(client, auth_headers, db_session, tmp_path, monkeypatch):
+    """测试共享缓存后端下，其他 worker 的写入使本进程缓存的用户序列失效"""
+    monkeypatch.setattr(cache, "cache_backend", DiskBackend(str(tmp_path / "cache.sqlite3")))
+    client.post("/api/health/data", json={
+        "data_type": "sleep", "date": str(date.today()), "sleep_duration": 8
+    }, headers=auth_headers)
+    start_date = date.today() - timedelta(days=7)
+    assert health_data_cache.get_series(db_session, 1, start_date, date.today()).size == 1
+    
+    # 模拟另一个 worker 的写入：记录直接入库，本进程只能看到共享的用户标签版本变化
+    db_session.add(HEALTH_RECORD_MODELS["sleep"](user_id=1, date=date.today(), sleep_duration=6))
+    db_session.commit()
+    assert health_data_cache.get_series(db_session, 1, start_date, date.today()).size == 1
+    
+    invalidate_tags_sync(user_tag(1))
+    assert health_data_cache.get_series(db_session, 1, start_date, date.today()).size == 2
+
+
+def test_shared_cache_ignores_unsigned_entries(tmp_path):
+    """测试共享缓存中未签名（被他人写入）的条目不会被反序列化，而是重新计算"""
+    statistics = Cache("statistics", DiskBackend(str(tmp_path / "cache.sqlite3")), ttl_seconds=60)
+    
+    async def scenario():
+        assert await statistics.get(1, lambda: {"total": 1}) == {"total": 1}
+        await statistics.backend.set("statistics:1", pickle.dumps(([], {"total": 666})))
+        return await statistics.get(1, lambda: {"total": 2})
+    
+    assert asyncio.run(scenario()) == {"total": 2}
+    assert statistics.stats()["errors"] == 1
+
+def test_large_health_data_response_is_compressed(client, auth_headers):
+    """测试大列表响应按 Accept-Encoding 压缩，小响应不压缩"""
+    for day in range(20):
+        client.post("/api/health/data", json={
+            "data_type": "exercise",
+            "date": str(date.today() - timedelta(days=day)),
+            "exercise_type": "跑步",
+            "duration": 30
+        }, headers=auth_headers)
+    
+    response = client.get("/api/health/data", headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 20
+    
+    response = client.get("/api/health/data", headers={**auth_headers, "Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert len(response.json()) == 20
+    
+    response = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+def test_signed_profile_header_profiles_request(client, auth_headers, tmp_path):
+    """测试带签名 X-Profile 头的请求被剖析，线程池中的工作也被记录；签名错误返回 403"""
+    client.post("/api/health/data", json={
+        "data_type": "sleep",
+        "date": str(date.today()),
+        "sleep_duration": 7.5
+    }, headers=auth_headers)
+    profiled_client = TestClient(ProfilingMiddleware(app, "profile-secret", str(tmp_path)))
+    
+    header = sign_profile_header("deterministic", 60, "profile-secret")
+    response = profiled_client.get("/api/health/statistics", headers={**auth_headers, "X-Profile": header})
+    assert response.status_code == status.HTTP_200_OK
+    path = response.headers["x-profile-path"]
+    assert os.path.exists(path)
+    assert os.path.exists(os.path.splitext(path)[0] + ".sql.json")
+    functions = {name for _, _, name in pstats.Stats(path).stats}
+    assert "get_health_data_statistics" in functions
+    
+    header = sign_profile_header("deterministic", 60, "wrong-secret")
+    response = profiled_client.get("/api/health/statistics", headers={**auth_headers, "X-Profile": header})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
@@ -1,5 +1,24 @@
+import asyncio
+
+import joblib
 import pytest
 from fastapi import status
+import json
+from datetime import date, timedelta
+
+from app.core.rate_limit import RouteLimits, admission_controller
+from app.models.health_data import HealthPlan
+from app.models.plan_progress import PlanProgress
+from app.models.plan_text import HealthPlanText, PlanTextBlob
+from app.models.precompute_checkpoint import PrecomputeCheckpoint
+from app.schemas.health_data import HealthPlanCreate
+from app.services.adherence_tracker import adherence_tracker
+from app.services.ai_service import get_ai_service
+from app.services.health_data_service import HealthDataService
+from app.services.peer_index import peer_index
+from app.services.precompute import PrecomputeScheduler, precompute_scheduler
+from app.services.segmentation_service import segmentation_service
+from app.services.text_generator import GenerationStream
 
 
 @pytest.fixture
@@ -37,6 +56,94 @@ def test_generate_health_plan(client, auth_headers):
     assert "title" in response.json()
     assert "exercise_plan" in response.json()
     assert "diet_suggestions" in response.json()
+    # 无运动和睡眠记录且目标为减重时的规则洞察
+    assert "exercise frequency can be increased" in response.json()["description"]
+    assert "sustainable weight loss" in response.json()["description"]
+
+
+def test_generate_health_plan_shed_when_saturated(client, auth_headers, monkeypatch):
+    """测试计划生成超出全局容量时返回 503，且不消耗用户的令牌"""
+    monkeypatch.setitem(admission_controller.limits, "plan", RouteLimits(
+        user_rate=0.01, user_burst=2, global_rate=0.01, global_burst=1
+    ))
+    
+    first = client.post("/api/health/plan", headers=auth_headers)
+    response = client.post("/api/health/plan", headers=auth_headers)
+    
+    assert first.status_code == status.HTTP_201_CREATED
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert "Retry-After" in response.headers
+    # 读取接口不受影响
+    assert client.get("/api/health/plan", headers=auth_headers).status_code == status.HTTP_200_OK
+    
+    # 被降级拒绝的请求退还了用户令牌：容量恢复后用户仍有一次配额
+    monkeypatch.setitem(admission_controller.limits, "plan", RouteLimits(user_rate=0.01, user_burst=2))
+    assert client.post("/api/health/plan", headers=auth_headers).status_code == status.HTTP_201_CREATED
+    assert client.post("/api/health/plan", headers=auth_headers).status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+
+class FakeTextGenerator:
+    """按固定分词输出的文本生成器"""
+    
+    def stream(self, prompt, max_new_tokens=None, max_buffered=64):
+        def produce(emit, cancelled):
+            for token in ["Drink", " water", " daily."]:
+                emit(token)
+        return GenerationStream(produce, max_buffered)
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_health_plan(client, auth_headers, monkeypatch):
+    """测试以 SSE 流式生成计划：先输出计划字段，再输出生成文本，最后保存计划"""
+    monkeypatch.setattr(get_ai_service(), "text_generator", FakeTextGenerator())
+    
+    response = client.get("/api/health/plan/stream", headers=auth_headers)
+    
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    assert [name for name, _ in events] == ["plan", "token", "token", "token", "done"]
+    assert "exercise_plan" in events[0][1]
+    assert events[-1][1]["ai_generated_content"] == "Drink water daily."
+    
+    plans = client.get("/api/health/plan", headers=auth_headers).json()
+    assert [plan["id"] for plan in plans] == [events[-1][1]["id"]]
+
+
+class FailingTextGenerator:
+    """输出一个分词后出错的文本生成器"""
+    
+    def stream(self, prompt, max_new_tokens=None, max_buffered=64):
+        def produce(emit, cancelled):
+            emit("Drink")
+            raise RuntimeError("out of memory")
+        return GenerationStream(produce, max_buffered)
+
+
+def test_stream_health_plan_generation_error(client, auth_headers, monkeypatch):
+    """测试生成中途出错时输出 error 事件，不保存只生成了一部分的计划"""
+    monkeypatch.setattr(get_ai_service(), "text_generator", FailingTextGenerator())
+    
+    events = parse_events(client.get("/api/health/plan/stream", headers=auth_headers).text)
+    
+    assert [name for name, _ in events] == ["plan", "token", "error"]
+    assert client.get("/api/health/plan", headers=auth_headers).json() == []
+
+def test_stream_health_plan_without_text_generator(client, auth_headers, monkeypatch):
+    """测试未加载文本生成模型时只输出计划字段并保存"""
+    monkeypatch.setattr(get_ai_service(), "text_generator", None)
+    
+    events = parse_events(client.get("/api/health/plan/stream", headers=auth_headers).text)
+    
+    assert [name for name, _ in events] == ["plan", "done"]
+    assert events[-1][1]["ai_generated_content"] is None
 
 
 def test_get_health_plans(client, auth_headers):
@@ -51,6 +158,139 @@ def test_get_health_plans(client, auth_headers):
     assert len(response.json()) > 0
 
 
+def test_plan_text_deduplicated(client, auth_headers, db_session):
+    """测试计划文本按内容哈希只存一份，计划行不再保存全文，旧的内联计划照常读取"""
+    created = [client.post("/api/health/plan", headers=auth_headers).json() for _ in range(3)]
+    assert created[0]["exercise_plan"] == created[2]["exercise_plan"]
+    
+    assert db_session.query(HealthPlanText).count() == 3
+    assert db_session.query(PlanTextBlob).count() <= 3
+    assert all(plan.exercise_plan is None for plan in db_session.query(HealthPlan).all())
+    
+    legacy = HealthPlan(user_id=created[0]["user_id"], plan_type="general", description="inline text")
+    db_session.add(legacy)
+    db_session.commit()
+    
+    plans = client.get("/api/health/plan", headers=auth_headers).json()
+    assert {plan["description"] for plan in plans} == {created[0]["description"], "inline text"}
+    assert all(plan["diet_suggestions"] == created[0]["diet_suggestions"] for plan in plans if plan["id"] != legacy.id)
+    
+    response = client.put(f"/api/health/plan/{created[0]['id']}", json={"exercise_plan": "Walk 30 minutes"}, headers=auth_headers)
+    assert response.json()["exercise_plan"] == "Walk 30 minutes"
+    assert response.json()["description"] == created[0]["description"]
+    response = client.get(f"/api/health/plan/{created[1]['id']}", headers=auth_headers)
+    assert response.json()["exercise_plan"] == created[1]["exercise_plan"]
+
+
+def test_plan_text_not_interned_after_rollback(client, auth_headers, db_session, monkeypatch):
+    """测试事务回滚后，文本块不会被当作已存储而跳过写入"""
+    plan_data = HealthPlanCreate(plan_type="general", description="Rolled back text")
+    monkeypatch.setattr(adherence_tracker, "start", lambda db, plan: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        HealthDataService.create_health_plan(db_session, 1, plan_data)
+    db_session.rollback()
+    assert db_session.query(PlanTextBlob).count() == 0
+    
+    monkeypatch.undo()
+    plan = HealthDataService.create_health_plan(db_session, 1, plan_data)
+    assert plan.description == "Rolled back text"
+    assert db_session.query(PlanTextBlob).count() == 1
+
+
+def test_simulate_health_plan(client, auth_headers):
+    """测试计划参数网格的批量推演"""
+    plan = client.post("/api/health/plan", headers=auth_headers).json()
+    
+    response = client.post("/api/health/plan/simulate", json={
+        "plan_id": plan["id"],
+        "exercise_minutes_per_day": [0, 30, 60],
+        "calories_target": [1800, 2500]
+    }, headers=auth_headers)
+    
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert result["scenarios"] == 6
+    assert result["duration_days"] == plan["duration_days"]
+    assert set(result["weekly_exercise_days"]) == {plan["weekly_exercise_days"]}
+    assert len(result["weight"]) == 6
+    assert len(result["weight"][0]) == plan["duration_days"]
+    # 场景按 运动时长 -> 每周天数 -> 热量 排列
+    final = result["final_weight"]
+    assert final[0] < final[1]
+    assert final[4] < final[2] < final[0]
+    assert result["weight_change"][0] < 0
+    
+    too_many = client.post("/api/health/plan/simulate", json={
+        "exercise_minutes_per_day": list(range(100)),
+        "calories_target": list(range(1000, 4000, 10))
+    }, headers=auth_headers)
+    assert too_many.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_plan_progress_tracked_as_data_is_written(client, auth_headers, db_session):
+    """测试计划执行进度随数据写入增量更新"""
+    today = date.today()
+    
+    def diet(days_ago, calories):
+        client.post("/api/health/data", json={
+            "data_type": "diet", "date": str(today - timedelta(days=days_ago)), "calories": calories
+        }, headers=auth_headers)
+    
+    # 计划创建前已有的记录
+    diet(5, 2000)
+    diet(4, 2500)
+    plan = HealthDataService.create_health_plan(db_session, 1, HealthPlanCreate(
+        plan_type="diet",
+        duration_days=30,
+        calories_target=2000,
+        exercise_minutes_per_day=30,
+        weekly_exercise_days=3,
+        start_date=today - timedelta(days=5),
+        end_date=today + timedelta(days=25)
+    ))
+    diet(3, 1950)
+    diet(2, 1900)
+    client.post("/api/health/data", json={
+        "data_type": "exercise", "date": str(today - timedelta(days=2)), "duration": 45
+    }, headers=auth_headers)
+    diet(1, 2050)
+    
+    progress = client.get(f"/api/health/plan/{plan.id}/progress", headers=auth_headers).json()
+    assert progress["days_completed"] == 5
+    assert progress["days_on_target"] == 4
+    assert progress["current_streak"] == 3
+    assert progress["calorie_balance"] == 400
+    assert progress["exercise_days"] == 1
+    
+    # 补记的记录会使该日不再达标
+    diet(5, 500)
+    client.post("/api/health/data", json={
+        "data_type": "exercise", "date": str(today), "duration": 20
+    }, headers=auth_headers)
+    
+    progress = client.get(f"/api/health/plan/{plan.id}/progress", headers=auth_headers).json()
+    assert progress["days_on_target"] == 3
+    assert progress["best_streak"] == 3
+    assert progress["calorie_balance"] == 900
+    assert progress["calorie_days"] == 5
+    assert progress["today_exercise_minutes"] == 20
+    assert progress["today_calories"] is None
+    assert client.get("/api/health/plan/999/progress", headers=auth_headers).status_code == 404
+    
+    # 暂停期间写入的记录在重新激活后计入进度
+    client.put(f"/api/health/plan/{plan.id}", json={"status": "paused"}, headers=auth_headers)
+    diet(0, 2000)
+    client.put(f"/api/health/plan/{plan.id}", json={"status": "active"}, headers=auth_headers)
+    progress = client.get(f"/api/health/plan/{plan.id}/progress", headers=auth_headers).json()
+    assert progress["today_calories"] == 2000
+    
+    # 没有进度行的旧计划：读取时计算，不写入数据库
+    db_session.delete(db_session.get(PlanProgress, plan.id))
+    db_session.commit()
+    assert client.get(f"/api/health/plan/{plan.id}/progress", headers=auth_headers).json() == progress
+    assert db_session.get(PlanProgress, plan.id) is None
+
+
 def test_get_ai_recommendations(client, auth_headers):
     """测试获取 AI 推荐"""
     response = client.get("/api/health/recommendations", headers=auth_headers)
@@ -58,4 +298,173 @@ def test_get_ai_recommendations(client, auth_headers):
     assert response.status_code == status.HTTP_200_OK
     assert "analysis" in response.json()
     assert "recommendations" in response.json()
+    assert [(r["type"], r["priority"]) for r in response.json()["recommendations"]] == [
+        ("exercise", "high"), ("sleep", "high")
+    ]
+
+
+def test_recommendations_cached_until_new_data(client, auth_headers):
+    """测试推荐结果缓存及写入后失效"""
+    before = client.get("/metrics").json()["cache"]["namespaces"]["recommendations"]
+    first = client.get("/api/health/recommendations", headers=auth_headers).json()
+    client.get("/api/health/recommendations", headers=auth_headers)
+    
+    after = client.get("/metrics").json()["cache"]["namespaces"]["recommendations"]
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+    
+    client.post("/api/health/data", json={
+        "data_type": "sleep",
+        "date": str(date.today()),
+        "sleep_duration": 8
+    }, headers=auth_headers)
+    
+    response = client.get("/api/health/recommendations", headers=auth_headers)
+    
+    assert first["analysis"]["average_sleep_hours"] == 0
+    assert response.json()["analysis"]["average_sleep_hours"] == 8
+    assert client.get("/metrics").json()["cache"]["namespaces"]["recommendations"]["misses"] - before["misses"] == 2
+
+
+def test_precomputed_recommendations(client, auth_headers):
+    """测试每日预计算写入推荐和统计缓存"""
+    client.post("/api/health/data", json={
+        "data_type": "sleep",
+        "date": str(date.today()),
+        "sleep_duration": 8
+    }, headers=auth_headers)
+    
+    report = asyncio.run(precompute_scheduler.run())
+    assert report["users"] == 1
+    # 当天已完成的任务不会重复执行
+    assert asyncio.run(precompute_scheduler.run())["skipped"] is True
+    
+    before = client.get("/metrics").json()["cache"]["namespaces"]
+    response = client.get("/api/health/recommendations", headers=auth_headers)
+    client.get("/api/health/statistics", headers=auth_headers)
+    after = client.get("/metrics").json()["cache"]["namespaces"]
+    
+    assert response.json()["analysis"]["average_sleep_hours"] == 8
+    assert after["recommendations"]["hits"] - before["recommendations"]["hits"] == 1
+    assert after["recommendations"]["misses"] == before["recommendations"]["misses"]
+    assert after["statistics"]["hits"] - before["statistics"]["hits"] == 1
+
+
+def test_precompute_resumes_under_new_owner(client, auth_headers, db_session, monkeypatch):
+    """测试预计算中途中断后，重启的进程（新 owner）在租约过期后从检查点继续"""
+    for i in range(3):
+        client.post("/api/auth/register", json={
+            "username": f"active{i}",
+            "email": f"active{i}@example.com",
+            "password": "testpass123"
+        })
+        token = client.post("/api/auth/login", data={
+            "username": f"active{i}",
+            "password": "testpass123"
+        }).json()["access_token"]
+        client.post("/api/health/data", json={
+            "data_type": "sleep",
+            "date": str(date.today()),
+            "sleep_duration": 7
+        }, headers={"Authorization": f"Bearer {token}"})
+    monkeypatch.setattr(precompute_scheduler, "batch_size", 1)
+    monkeypatch.setattr(precompute_scheduler, "max_users_per_second", 0)
+    monkeypatch.setattr(precompute_scheduler, "lease_seconds", 1)
+    monkeypatch.setattr(precompute_scheduler, "run_at", (0, 0))
+    
+    # 第二批处理时进程被杀死
+    process_batch = PrecomputeScheduler._process_batch
+    batches = []
+    
+    async def killed(self, user_ids, semaphore):
+        batches.append(user_ids)
+        if len(batches) == 2:
+            raise SystemExit
+        return await process_batch(self, user_ids, semaphore)
+    
+    monkeypatch.setattr(PrecomputeScheduler, "owner", property(lambda self: "host:1"))
+    monkeypatch.setattr(PrecomputeScheduler, "_process_batch", killed)
+    with pytest.raises(SystemExit):
+        asyncio.run(precompute_scheduler.run())
+    
+    # 新进程在租约有效期内跳过，但给出重试时间
+    monkeypatch.setattr(PrecomputeScheduler, "owner", property(lambda self: "host:2"))
+    monkeypatch.setattr(PrecomputeScheduler, "_process_batch", process_batch)
+    report = asyncio.run(precompute_scheduler.run())
+    assert report["skipped"] is True
+    assert "retry_at" in report
+    
+    async def run_until_idle():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(precompute_scheduler.run_forever(), timeout=4)
+    
+    asyncio.run(run_until_idle())
+    checkpoint = db_session.get(PrecomputeCheckpoint, PrecomputeScheduler.JOB)
+    db_session.refresh(checkpoint)
+    assert checkpoint.completed
+    assert checkpoint.users_done == 3
 
+def test_get_peer_recommendations(client, auth_headers):
+    """测试基于相似用户的推荐"""
+    for i in range(3):
+        client.post("/api/auth/register", json={
+            "username": f"peer{i}",
+            "email": f"peer{i}@example.com",
+            "password": "testpass123",
+            "gender": "male",
+            "height": 175 + i,
+            "weight": 70 + i,
+            "date_of_birth": "1990-01-01",
+            "activity_level": "moderately_active"
+        })
+        token = client.post("/api/auth/login", data={
+            "username": f"peer{i}",
+            "password": "testpass123"
+        }).json()["access_token"]
+        for day in range(5):
+            client.post("/api/health/data", json={
+                "data_type": "exercise",
+                "date": str(date.today() - timedelta(days=day)),
+                "duration": 45
+            }, headers={"Authorization": f"Bearer {token}"})
+    segmentation_service.drain()
+    
+    response = client.get("/api/health/recommendations/peers?k=5", headers=auth_headers)
+    
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["peer_count"] == 3
+    assert response.json()["peer_averages"]["exercise_frequency"] == 5
+    assert response.json()["recommendations"][0]["type"] == "exercise"
+    
+    # 索引在后台构建，同一时间只有一个构建任务
+    with peer_index._rebuild_lock:
+        assert not peer_index.start_rebuild()
+    assert peer_index.rebuild()["users"] == 3
+    response = client.get("/api/health/recommendations/peers?k=5", headers=auth_headers)
+    assert response.json()["index_ready"] is True
+    assert response.json()["peer_count"] == 3
+    
+    # 重建后新增的用户：重启后从数据库回放，压缩后写入索引文件
+    client.post("/api/auth/register", json={
+        "username": "latepeer",
+        "email": "latepeer@example.com",
+        "password": "testpass123"
+    })
+    token = client.post("/api/auth/login", data={
+        "username": "latepeer",
+        "password": "testpass123"
+    }).json()["access_token"]
+    client.post("/api/health/data", json={
+        "data_type": "exercise",
+        "date": str(date.today()),
+        "duration": 30
+    }, headers={"Authorization": f"Bearer {token}"})
+    segmentation_service.drain()
+    peer_index.reset()
+    response = client.get("/api/health/recommendations/peers?k=5", headers=auth_headers)
+    assert response.json()["peer_count"] == 4
+    
+    peer_index.compact()
+    saved = joblib.load(peer_index.index_path)
+    assert len(saved) == 4
+    assert saved.row_of(5) is not None
@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pytest
+from fastapi import status
+from datetime import date
+
+from app.services.segmentation_service import UserSegmentationService, segmentation_service
+
+
+def register_and_login(client, username, **profile):
+    """注册并登录，返回认证 headers"""
+    client.post("/api/auth/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "testpass123",
+        **profile
+    })
+    login_response = client.post("/api/auth/login", data={
+        "username": username,
+        "password": "testpass123"
+    })
+    token = login_response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_update_current_user(client):
+    """测试更新用户信息"""
+    headers = register_and_login(client, "testuser")
+    
+    response = client.put("/api/users/me", json={"weight": 68.5}, headers=headers)
+    
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["weight"] == 68.5
+
+
+def test_get_user_segment(client):
+    """测试获取用户分群"""
+    headers = register_and_login(client, "user0", height=160, weight=55)
+    response = client.get("/api/users/me/segment", headers=headers)
+    
+    # 用户数少于分群数时尚未分群
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["segment_id"] is None
+    
+    for i in range(1, 5):
+        other_headers = register_and_login(client, f"user{i}", height=160 + i * 5, weight=55 + i * 8)
+        client.post("/api/health/data", json={
+            "data_type": "exercise",
+            "date": str(date.today()),
+            "duration": 20 * i
+        }, headers=other_headers)
+    # 写入只登记用户，特征在后台（此处为 drain）重新计算
+    assert segmentation_service.drain() == 4
+    
+    response = client.get("/api/users/me/segment", headers=headers)
+    
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["segment_id"] in range(5)
+
+
+def test_segmentation_counts_each_user_once_per_batch(tmp_path, monkeypatch):
+    """测试频繁写入的用户每批只计一次，缩放器更新后质心在特征空间中保持不动"""
+    service = UserSegmentationService(
+        n_clusters=2, model_path=os.path.join(tmp_path, "segmentation.joblib"),
+        save_every=0, drift_threshold=0.25, batch_users=3, fold_seconds=3600
+    )
+    service.update(0, np.array([160.0, 55.0]))
+    service.update(1, np.array([185.0, 90.0]))
+    assert service.updates == 2
+    centers = service.scaler.inverse_transform(service.kmeans.cluster_centers_)
+    
+    for weight in range(60, 70):
+        service.update(2, np.array([170.0, float(weight)]))
+    assert service.updates == 2
+    
+    # 只看缩放器的变化：跳过质心本身的更新
+    monkeypatch.setattr(service.kmeans, "partial_fit", lambda X: service.kmeans)
+    service.update(3, np.array([200.0, 120.0]))
+    service.update(4, np.array([150.0, 45.0]))
+    assert service.updates == 5
+    assert service.scaler.n_samples_seen_ == 5
+    np.testing.assert_allclose(service.scaler.inverse_transform(service.kmeans.cluster_centers_), centers)
+
+
+def test_cached_principal_refreshed_after_update(client):
+    """测试缓存的当前用户在更新资料后失效"""
+    headers = register_and_login(client, "testuser", weight=70)
+    metrics_before = client.get("/metrics").json()["cache"]["namespaces"]["principals"]
+    
+    assert client.get("/api/users/me", headers=headers).json()["weight"] == 70
+    assert client.get("/api/users/me", headers=headers).json()["weight"] == 70
+    client.put("/api/users/me", json={"weight": 68.5}, headers=headers)
+    
+    assert client.get("/api/users/me", headers=headers).json()["weight"] == 68.5
+    metrics_after = client.get("/metrics").json()["cache"]["namespaces"]["principals"]
+    assert metrics_after["hits"] - metrics_before["hits"] >= 2
+    assert metrics_after["stale"] - metrics_before["stale"] == 1